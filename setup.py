@@ -57,6 +57,10 @@ setup(
         "pyyaml",
         "protobuf<5"
     ],
+    extras_require={
+        # faster body serialization, see _body_capture.serialize
+        "orjson": ["orjson"],
+    },
     entry_points = {
         'console_scripts': [
             'hypertrace-instrument = hypertrace.agent.autoinstrumentation.hypertrace_instrument:run',
@@ -11,9 +11,12 @@ import opentelemetry.trace as ot
 
 from hypertrace.agent.instrumentation.instrumentation_definitions import SUPPORTED_LIBRARIES, \
     get_instrumentation_wrapper, REQUESTS_KEY, GRPC_CLIENT_KEY, DJANGO_KEY, MYSQL_KEY, GRPC_SERVER_KEY, \
-    POSTGRESQL_KEY, AIOHTTP_CLIENT_KEY, FLASK_KEY, LAMBDA,FAST_API_KEY, _uninstrument_all
+    POSTGRESQL_KEY, AIOHTTP_CLIENT_KEY, FLASK_KEY, LAMBDA,FAST_API_KEY, LIBRARY_MODULES, \
+    _uninstrument_all
+from hypertrace.agent.instrumentation.import_hook import register_post_import_hook
 from hypertrace.env_var_settings import get_env_value
 from hypertrace.agent.init import AgentInit
+from hypertrace.agent.startup_profile import startup_profiler
 from hypertrace.agent.config import AgentConfig
 from hypertrace.agent import constants
 from hypertrace.agent import custom_logger
@@ -48,8 +51,11 @@ class Agent:
             if not self.is_enabled():
                 return
             try:
-                self._config = AgentConfig()
-                self._init = AgentInit(self._config)
+                profiler = startup_profiler()
+                with profiler.phase('agent.config'):
+                    self._config = AgentConfig()
+                with profiler.phase('agent.init'):
+                    self._init = AgentInit(self._config)
                 self._initialized = True
             except Exception as err:  # pylint: disable=W0703
                 logger.error('Failed to initialize Agent: exception=%s, stacktrace=%s',
@@ -65,24 +71,45 @@ class Agent:
 
     def instrument(self, app=None, skip_libraries=None, auto_instrument=False):
         '''used to register applicable instrumentation wrappers'''
-        self._init.apply_config(self._config)
+        profiler = startup_profiler()
+        with profiler.phase('instrument'):
+            self._init.apply_config(self._config)
+
+            if skip_libraries is None:
+                skip_libraries = []
+            if not self.is_initialized():
+                logger.debug('agent is not initialized, not instrumenting')
+                return
 
-        if skip_libraries is None:
-            skip_libraries = []
-        if not self.is_initialized():
-            logger.debug('agent is not initialized, not instrumenting')
-            return
+            for library_key in SUPPORTED_LIBRARIES:
+                if library_key in skip_libraries:
+                    logger.debug('not attempting to instrument %s', library_key)
+                    continue
 
-        for library_key in SUPPORTED_LIBRARIES:
-            if library_key in skip_libraries:
-                logger.debug('not attempting to instrument %s', library_key)
-                continue
+                self._instrument_on_import(library_key, app, auto_instrument)
+        profiler.finish()
 
+    def _instrument_on_import(self, library_key, app=None, auto_instrument=False):
+        """instrument a library once the app imports it, its instrumentation wrapper
+        (and the modules it depends on) is only loaded then"""
+        module_name = LIBRARY_MODULES.get(library_key)
+        if module_name is None:
             self._instrument(library_key, app, auto_instrument)
+            return
+        register_post_import_hook(
+            module_name, library_key,
+            lambda _module: self._instrument(library_key, app, auto_instrument))
 
     def _instrument(self, library_key, app=None, auto_instrument=False):
         """only used to allow the deprecated register_x library methods to still work"""
+        if library_key == LAMBDA and '_HANDLER' not in os.environ:
+            return
+
+        with startup_profiler().phase(f'instrument.{library_key}'):
+            self._instrument_library(library_key, app, auto_instrument)
 
+    def _instrument_library(self, library_key, app=None, auto_instrument=False):
+        """load the instrumentation wrapper of a library and apply it"""
         wrapper_instance = get_instrumentation_wrapper(library_key)
         if wrapper_instance is None:
             return
@@ -120,9 +147,6 @@ class Agent:
             add_fast_api_auto_instr_wrappers(self, wrapper_instance)
             return
 
-        if library_key == LAMBDA and '_HANDLER' not in os.environ:
-            return
-
         self.register_library(library_key, wrapper_instance)
 
     def register_library(self, library_name, wrapper_instance):
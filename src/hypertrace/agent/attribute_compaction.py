@@ -0,0 +1,130 @@
+'''Shrink span attributes before they are exported'''
+import logging
+import typing
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from hypertrace.agent.instrumentation.body_serializers import json_dumps
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# captured header/metadata prefix -> attribute holding all of them as a JSON object
+MERGED_HEADER_ATTRIBUTES = {
+    'http.request.header.': 'http.request.headers',
+    'http.response.header.': 'http.response.headers',
+    'rpc.request.metadata.': 'rpc.request.metadata',
+    'rpc.response.metadata.': 'rpc.response.metadata',
+}
+
+# values up to this size are shared between the spans of a batch, larger ones(bodies)
+# are rarely equal and hashing them would cost more than it saves
+_MAX_INTERNED_VALUE_SIZE = 4096
+
+# size of a non string attribute value in an export
+_SCALAR_SIZE = 8
+
+
+def _value_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (tuple, list)):
+        return sum(_value_size(item) for item in value)
+    return _SCALAR_SIZE
+
+
+def merge_header_attributes(attributes: dict) -> dict:
+    '''Replace the attribute per header with one JSON object attribute per header prefix'''
+    merged = {}
+    compacted = {}
+    for key, value in attributes.items():
+        if key[:4] in ('http', 'rpc.'):
+            for prefix, merged_key in MERGED_HEADER_ATTRIBUTES.items():
+                if key.startswith(prefix):
+                    merged.setdefault(merged_key, {})[key[len(prefix):]] = value
+                    break
+            else:
+                compacted[key] = value
+        else:
+            compacted[key] = value
+    for merged_key, headers in merged.items():
+        compacted[merged_key] = json_dumps(headers)
+    return compacted
+
+
+def enforce_budget(attributes: dict, max_bytes: int) -> dict:
+    '''Truncate the largest string values until keys and values fit in max_bytes'''
+    total = sum(len(key) + _value_size(value) for key, value in attributes.items())
+    excess = total - max_bytes
+    if excess <= 0:
+        return attributes
+
+    attributes = dict(attributes)
+    strings = sorted((key for key, value in attributes.items() if isinstance(value, str)),
+                     key=lambda key: len(attributes[key]), reverse=True)
+    for key in strings:
+        encoded = attributes[key].encode('utf-8')
+        cut = min(excess, len(encoded))
+        attributes[key] = encoded[:len(encoded) - cut].decode('utf-8', 'ignore')
+        excess -= cut
+        if excess <= 0:
+            break
+    return attributes
+
+
+class AttributeCompactingSpanExporter(SpanExporter):
+    '''Compacts the attributes of each batch before handing it to another exporter:
+
+    - merge_headers: captured headers/metadata become one JSON object attribute,
+      ex: `http.request.headers`, instead of an attribute per header
+    - max_span_bytes: the attribute keys and values of a span are kept under this
+      budget by truncating the largest values first, 0 disables it
+    - equal values across the spans of a batch share a single string'''
+
+    def __init__(self, exporter: SpanExporter, merge_headers: bool = True, max_span_bytes: int = 0):
+        '''constructor'''
+        self._exporter = exporter
+        self._merge_headers = merge_headers
+        self._max_span_bytes = max_span_bytes or 0
+
+    def _compact(self, span: ReadableSpan, interned: dict) -> ReadableSpan:
+        attributes = span.attributes
+        if not attributes:
+            return span
+        if self._merge_headers:
+            attributes = merge_header_attributes(attributes)
+        if self._max_span_bytes:
+            attributes = enforce_budget(attributes, self._max_span_bytes)
+        if attributes is span.attributes:
+            return span
+
+        for key, value in attributes.items():
+            if isinstance(value, str) and len(value) <= _MAX_INTERNED_VALUE_SIZE:
+                attributes[key] = interned.setdefault(value, value)
+        return ReadableSpan(name=span.name,
+                            context=span.context,
+                            parent=span.parent,
+                            resource=span.resource,
+                            attributes=attributes,
+                            events=span.events,
+                            links=span.links,
+                            kind=span.kind,
+                            status=span.status,
+                            start_time=span.start_time,
+                            end_time=span.end_time,
+                            instrumentation_scope=span.instrumentation_scope)
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        interned = {}
+        try:
+            spans = [self._compact(span, interned) for span in spans]
+        except Exception as err:  # pylint: disable=W0703
+            logger.debug('Failed to compact span attributes, exporting them as is: %s', err)
+        return self._exporter.export(spans)
+
+    def shutdown(self) -> None:
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
@@ -2,24 +2,46 @@
 Agent configuration logic that pull in values from a defaults list,
 environment variables, and the agent-config.yaml file.
 """
+import copy
 import logging
-from google.protobuf import json_format as jf
+import os
+import re
+import tempfile
+import threading
+from types import MappingProxyType, SimpleNamespace
 from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from hypertrace import env_var_settings
 from hypertrace.agent.config import config_pb2 # pylint:disable=W0406
 from hypertrace.agent.config.default import *
 from hypertrace.env_var_settings import get_env_value
+from hypertrace.agent.startup_profile import startup_profiler
+from hypertrace.agent import custom_logger
 from .file import load_config_from_file
 from .environment import load_config_from_env
 
 
 # Configuration attributes specific to pythonagent
 PYTHON_SPECIFIC_ATTRIBUTES: list = [
-    '_use_console_span_exporter'
+    '_use_console_span_exporter',
+    '_header_capture',
+    '_body_capture',
+    '_redaction',
+    '_capture_policies',
+    '_sampling',
+    '_span_processor',
+    '_attribute_compaction',
+    '_exporter',
+    '_forwarder',
+    '_spool',
+    '_span_naming'
 ]
 
 # Initialize logger
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
+_SNAPSHOT = None
+_SNAPSHOT_LOCK = threading.Lock()
+
 
 def merge_config(base_config, overriding_config):
     """
@@ -47,34 +69,37 @@ def merge_config(base_config, overriding_config):
 class AgentConfig:  # pylint: disable=R0902,R0903
     '''A wrapper around the agent configuration logic'''
 
-    def __init__(self):  # pylint: disable=R0912,R0915
+    def __init__(self):
         """
-        Returns a new instance of config_pb2.AgentConfig when a new AgentConfig() is created.
+        Builds a new agent_config, shared with no other AgentConfig, when a new AgentConfig() is created.
         If 'HT_CONFIG_FILE' is specified in the environment data would be loaded from that file.
         If not, data would be loaded from 'DEFAULT_AGENT_CONFIG' on 'default.py'
         """
 
-        config_dict = DEFAULT_AGENT_CONFIG
-        custom_config = {}
-        file_dict = _read_from_file()
-        if file_dict is not None:
-            config_dict = merge_config(config_dict, file_dict)
-
-        env_dict = load_config_from_env()
-        config_dict = merge_config(config_dict, env_dict)
+        profiler = startup_profiler()
+        with profiler.phase('config.load'):
+            config_dict = self._load_config_dict()
+        with profiler.phase('config.protobuf'):
+            self._build_agent_config(config_dict)
 
-        self.custom_config = _apply_custom_config_options(custom_config, config_dict)
+    def _load_config_dict(self) -> dict:
+        '''A copy of the merged defaults, config file and environment'''
+        snapshot = config_snapshot()
+        self.custom_config = _thaw(snapshot.custom_config)
+        return _thaw(snapshot.config_dict)
 
-        # transform(to not break old support) like zipkin != proto def of ZIPKIN
-        _transform_values(config_dict)
-        logger.info("Config init complete - config state: %s", config_dict)
+    def _build_agent_config(self, config_dict: dict) -> None:  # pylint: disable=R0914
+        '''Build the protobuf config from the merged config dict'''
+        # Every AgentConfig gets its own objects holding plain values, ex: service_name
+        # is a str rather than a StringValue, which is what agent code and edit_config
+        # users read and assign. Editing one config never changes another.
 
-        # Create protobuf Reporting object
-        reporting = jf.Parse(jf.MessageToJson(
-            config_pb2.Reporting()), config_pb2.Reporting)
+        # Create Reporting object
+        reporting = SimpleNamespace()
         reporting.endpoint = config_dict['reporting']['endpoint']
         reporting.secure = config_dict['reporting']['secure']
         reporting.token = config_dict['reporting']['token']
+        reporting.cert_file = config_dict['reporting'].get('cert_file', '')
 
         # Set trace_reporter_type
         if config_dict['reporting']['trace_reporter_type'] == 'OTLP':
@@ -103,18 +128,18 @@ class AgentConfig:  # pylint: disable=R0902,R0903
             response=BoolValue(
                 value=config_dict['data_capture']['http_headers']['response']))
 
-        # Create Protobuf DataCapture object
-        data_capture = jf.Parse(jf.MessageToJson(
-            config_pb2.DataCapture()), config_pb2.DataCapture)
+        # Create DataCapture object
+        data_capture = SimpleNamespace()
         data_capture.http_headers = http_headers
         data_capture.http_body = http_body
         data_capture.rpc_metadata = rpc_metadata
         data_capture.rpc_body = rpc_body
         data_capture.body_max_size_bytes = config_dict['data_capture']['body_max_size_bytes']
+        data_capture.body_max_processing_size_bytes = \
+            config_dict['data_capture']['body_max_processing_size_bytes']
 
-        # Create Protobuf AgentConfig object
-        self.agent_config: config_pb2.AgentConfig = jf.Parse(jf.MessageToJson(
-            config_pb2.AgentConfig()), config_pb2.AgentConfig)
+        # Create AgentConfig object
+        self.agent_config = SimpleNamespace()
         self.agent_config.service_name = config_dict['service_name']
         self.agent_config.reporting = reporting
         self.agent_config.data_capture = data_capture
@@ -143,6 +168,198 @@ class AgentConfig:  # pylint: disable=R0902,R0903
         '''Initialize InMemorySpanExporter'''
         return self.custom_config.get('_use_console_span_exporter')
 
+    def header_capture_rules(self) -> dict:
+        '''Header allow/deny/redact lists applied by every instrumentation wrapper'''
+        rules = self.custom_config.get('_header_capture') or {}
+        return {
+            'allow': rules.get('allow') or [],
+            'deny': rules.get('deny') or [],
+            'redact': rules.get('redact') or [],
+        }
+
+    def body_capture_content_types(self):
+        '''Content types whose body is captured, None falls back to the wrapper defaults'''
+        body_capture = self.custom_config.get('_body_capture') or {}
+        return body_capture.get('content_types')
+
+    def body_capture_serialize(self) -> bool:
+        '''Whether captured bodies are normalized by their content type serializer'''
+        body_capture = self.custom_config.get('_body_capture') or {}
+        return bool(body_capture.get('serialize', False))
+
+    def redaction_rules(self) -> dict:
+        '''Keys and regexes masked in captured headers and bodies by every instrumentation wrapper'''
+        rules = self.custom_config.get('_redaction') or {}
+        return {
+            'keys': rules.get('keys') or [],
+            'patterns': rules.get('patterns') or [],
+        }
+
+    def capture_policies(self) -> list:
+        '''Per route overrides of the data_capture header/body settings'''
+        return self.custom_config.get('_capture_policies') or []
+
+    def sampling(self) -> dict:
+        '''Head sampling ratio, per process rate limit and whether child spans follow their parent'''
+        sampling = self.custom_config.get('_sampling') or {}
+        return {
+            'ratio': float(sampling.get('ratio', 1.0)),
+            'rate_limit': float(sampling.get('rate_limit') or 0),
+            'parent_based': bool(sampling.get('parent_based', True)),
+        }
+
+    def span_processor_options(self) -> dict:
+        '''BatchSpanProcessor queue/batch sizes, delays and drop policy'''
+        options = self.custom_config.get('_span_processor') or {}
+        return {
+            'max_queue_size': options.get('max_queue_size'),
+            'max_export_batch_size': options.get('max_export_batch_size'),
+            'schedule_delay_millis': options.get('schedule_delay_millis'),
+            'export_timeout_millis': options.get('export_timeout_millis'),
+            'drop_policy': options.get('drop_policy') or 'drop_oldest',
+        }
+
+    def attribute_compaction(self) -> dict:
+        '''Whether exported span attributes are compacted, and how'''
+        options = self.custom_config.get('_attribute_compaction') or {}
+        return {
+            'enabled': bool(options.get('enabled', False)),
+            'merge_headers': bool(options.get('merge_headers', True)),
+            'max_span_bytes': int(options.get('max_span_bytes') or 0),
+        }
+
+    def exporter_options(self) -> dict:
+        '''OTLP exporter compression, timeout, extra headers and http connection pool size'''
+        options = self.custom_config.get('_exporter') or {}
+        compression = options.get('compression')
+        timeout = options.get('timeout')
+        return {
+            'compression': compression.strip().lower() or None if compression else None,
+            'timeout': int(timeout) if timeout else None,
+            'headers': options.get('headers') or {},
+            'http_pool_size': int(options.get('http_pool_size') or 10),
+        }
+
+    def forwarder_options(self) -> dict:
+        '''Whether spans are exported through a forwarder process, and its socket'''
+        options = self.custom_config.get('_forwarder') or {}
+        return {
+            'enabled': bool(options.get('enabled', False)),
+            'socket_path': options.get('socket_path') or '',
+        }
+
+    def spool_options(self) -> dict:
+        '''Whether batches that fail to export are spooled to disk, where and how much'''
+        options = self.custom_config.get('_spool') or {}
+        return {
+            'enabled': bool(options.get('enabled', False)),
+            'directory': options.get('directory') or self._default_spool_directory(),
+            'max_segment_bytes': int(options.get('max_segment_bytes') or 8388608),
+            'max_bytes': int(options.get('max_bytes') or 268435456),
+        }
+
+    def _default_spool_directory(self) -> str:
+        '''A spool directory per user and service, so a process only replays the
+        batches of its own service'''
+        service_name = re.sub(r'[^\w.-]', '_', self.agent_config.service_name or '')
+        return os.path.join(tempfile.gettempdir(),
+                            f'hypertrace-spool-{os.getuid()}-{service_name or "default"}')
+
+    def span_naming(self) -> dict:
+        '''Whether server requests that matched no route are named after their templated path'''
+        options = self.custom_config.get('_span_naming') or {}
+        return {
+            'template_unmatched_routes': bool(options.get('template_unmatched_routes', False)),
+        }
+
+
+class ConfigSnapshot:
+    '''The merged defaults, config file and environment of the process, read only.
+
+    Loaded once and shared by every AgentConfig until the config file or an
+    HT_ environment variable changes.'''
+
+    def __init__(self, key: tuple, config_dict: dict, custom_config: dict):
+        '''constructor'''
+        self._key = key
+        self._config_dict = _freeze(config_dict)
+        self._custom_config = _freeze(custom_config)
+
+    @property
+    def key(self) -> tuple:
+        '''The environment and config file modification time it was loaded from'''
+        return self._key
+
+    @property
+    def config_dict(self) -> MappingProxyType:
+        '''The agent config values'''
+        return self._config_dict
+
+    @property
+    def custom_config(self) -> MappingProxyType:
+        '''The python agent specific options, see PYTHON_SPECIFIC_ATTRIBUTES'''
+        return self._custom_config
+
+
+def config_snapshot() -> ConfigSnapshot:
+    '''The config of the process, loaded again only when its sources changed'''
+    global _SNAPSHOT  # pylint: disable=W0603
+    key = _snapshot_key()
+    with _SNAPSHOT_LOCK:
+        if _SNAPSHOT is None or _SNAPSHOT.key != key:
+            _SNAPSHOT = _load_snapshot(key)
+        return _SNAPSHOT
+
+
+def _snapshot_key() -> tuple:
+    prefixes = tuple(f'{prefix}_' for prefix in env_var_settings.ENV_VAR_PREFIXES)
+    environment = tuple(sorted(item for item in os.environ.items() if item[0].startswith(prefixes)))
+    config_file = get_env_value('CONFIG_FILE')
+    modified = None
+    if config_file:
+        try:
+            modified = os.stat(config_file).st_mtime_ns
+        except OSError:
+            pass
+    return environment, modified
+
+
+def _load_snapshot(key: tuple) -> ConfigSnapshot:
+    # HT_LOG_LEVEL is part of the key, a reload applies it to the agent loggers
+    custom_logger.refresh_log_level()
+    # copy so merging file & env config never mutates the defaults
+    config_dict = copy.deepcopy(DEFAULT_AGENT_CONFIG)
+    custom_config = {}
+    file_dict = _read_from_file()
+    if file_dict is not None:
+        config_dict = merge_config(config_dict, file_dict)
+
+    env_dict = load_config_from_env()
+    config_dict = merge_config(config_dict, env_dict)
+
+    custom_config = _apply_custom_config_options(custom_config, config_dict)
+
+    # transform(to not break old support) like zipkin != proto def of ZIPKIN
+    _transform_values(config_dict)
+    logger.info("Config init complete - config state: %s", config_dict)
+    return ConfigSnapshot(key, config_dict, custom_config)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
 
 def _transform_values(config_dict):
     # This has to be upcase or else enum lookup fails
@@ -9,6 +9,7 @@ DEFAULT_AGENT_CONFIG = {
         'secure': False,
         'trace_reporter_type': 'OTLP',
         'token': '',
+        'cert_file': '',
     },
     'data_capture': {
         'http_headers': {
@@ -27,7 +28,60 @@ DEFAULT_AGENT_CONFIG = {
             'request': True,
             'response': True,
         },
-        'body_max_size_bytes': 131072
+        'body_max_size_bytes': 131072,
+        'body_max_processing_size_bytes': 1048576
     },
-    'resource_attributes': {}
+    'resource_attributes': {},
+    # credentials are redacted unless a config sets its own redact list
+    '_header_capture': {
+        'allow': [],
+        'deny': [],
+        'redact': ['authorization', 'proxy-authorization', 'cookie', 'set-cookie'],
+    },
+    # content_types defaults to instrumentation.content_type.DEFAULT_CAPTURE_CONTENT_TYPES
+    '_body_capture': {
+        'serialize': False,
+    },
+    '_redaction': {
+        'keys': [],
+        'patterns': [],
+    },
+    # ex: [{'route': '/ingest/*', 'methods': ['POST'], 'request_body': False}]
+    '_capture_policies': [],
+    # rate_limit is the max number of sampled traces per second per process, 0 disables it
+    '_sampling': {
+        'ratio': 1.0,
+        'rate_limit': 0,
+        'parent_based': True,
+    },
+    # max_queue_size, max_export_batch_size, schedule_delay_millis and export_timeout_millis
+    # default to the OTEL_BSP_* env vars or the BatchSpanProcessor defaults
+    '_span_processor': {
+        'drop_policy': 'drop_oldest',
+    },
+    '_attribute_compaction': {
+        'enabled': False,
+        'merge_headers': True,
+        'max_span_bytes': 0,
+    },
+    # compression and timeout(seconds) default to the OTEL_EXPORTER_OTLP_* env vars
+    '_exporter': {
+        'headers': {},
+        'http_pool_size': 10,
+    },
+    # socket_path defaults to forwarder.sock in a new private temporary directory
+    '_forwarder': {
+        'enabled': False,
+        'socket_path': '',
+    },
+    # directory defaults to hypertrace-spool-<uid>-<service name> in the temporary directory
+    '_spool': {
+        'enabled': False,
+        'directory': '',
+        'max_segment_bytes': 8388608,
+        'max_bytes': 268435456,
+    },
+    '_span_naming': {
+        'template_unmatched_routes': False,
+    }
 }
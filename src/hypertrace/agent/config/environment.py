@@ -1,5 +1,6 @@
 '''Environment config loader'''
 
+import json
 import logging
 
 from hypertrace.env_var_settings import get_env_value
@@ -41,6 +42,11 @@ def load_config_from_env() -> dict:  # pylint: disable=R0912,R0915,R0914
         logger.debug("[env] Loaded REPORTING_TOKEN from env")
         config['reporting']['token'] = reporting_token
 
+    reporting_cert_file = get_env_value('REPORTING_CERT_FILE')
+    if reporting_cert_file:
+        logger.debug("[env] Loaded REPORTING_CERT_FILE from env")
+        config['reporting']['cert_file'] = reporting_cert_file
+
     if len(config['reporting']) == 0:
         del config['reporting']
 
@@ -117,6 +123,12 @@ def load_config_from_env() -> dict:  # pylint: disable=R0912,R0915,R0914
             "[env] Loaded DATA_CAPTURE_BODY_MAX_SIZE_BYTES from env")
         config['data_capture']['body_max_size_bytes'] = int(body_max_size_bytes)
 
+    body_max_processing_size_bytes = get_env_value('DATA_CAPTURE_BODY_MAX_PROCESSING_SIZE_BYTES')
+    if body_max_processing_size_bytes:
+        logger.debug(
+            "[env] Loaded DATA_CAPTURE_BODY_MAX_PROCESSING_SIZE_BYTES from env")
+        config['data_capture']['body_max_processing_size_bytes'] = int(body_max_processing_size_bytes)
+
     if len(config['data_capture']) == 0:
         del config['data_capture']
 
@@ -134,6 +146,151 @@ def load_config_from_env() -> dict:  # pylint: disable=R0912,R0915,R0914
     if console_span_exporter:
         logger.debug("[env] Loaded ENABLE_CONSOLE_SPAN_EXPORTER from env")
         config['_use_console_span_exporter'] = _is_true(console_span_exporter)
+    header_capture = {}
+    for rule in ('allow', 'deny', 'redact'):
+        header_names = get_env_value(f'DATA_CAPTURE_HEADERS_{rule.upper()}')
+        if header_names:
+            logger.debug("[env] Loaded DATA_CAPTURE_HEADERS_%s from env", rule.upper())
+            header_capture[rule] = header_names.split(',')
+    if header_capture:
+        config['_header_capture'] = header_capture
+
+    body_capture = {}
+    content_types = get_env_value('DATA_CAPTURE_BODY_CONTENT_TYPES')
+    if content_types:
+        logger.debug("[env] Loaded DATA_CAPTURE_BODY_CONTENT_TYPES from env")
+        body_capture['content_types'] = content_types.split(',')
+    serialize_bodies = get_env_value('DATA_CAPTURE_BODY_SERIALIZE')
+    if serialize_bodies:
+        logger.debug("[env] Loaded DATA_CAPTURE_BODY_SERIALIZE from env")
+        body_capture['serialize'] = _is_true(serialize_bodies)
+    if body_capture:
+        config['_body_capture'] = body_capture
+
+    redaction = {}
+    redact_keys = get_env_value('DATA_CAPTURE_REDACT_KEYS')
+    if redact_keys:
+        logger.debug("[env] Loaded DATA_CAPTURE_REDACT_KEYS from env")
+        redaction['keys'] = redact_keys.split(',')
+    # regexes can contain commas, patterns are a json list
+    redact_patterns = get_env_value('DATA_CAPTURE_REDACT_PATTERNS')
+    if redact_patterns:
+        logger.debug("[env] Loaded DATA_CAPTURE_REDACT_PATTERNS from env")
+        try:
+            redaction['patterns'] = json.loads(redact_patterns)
+        except ValueError as err:
+            logger.error('Failed to parse DATA_CAPTURE_REDACT_PATTERNS, expected a json list: %s', err)
+    if redaction:
+        config['_redaction'] = redaction
+
+    capture_policies = get_env_value('DATA_CAPTURE_POLICIES')
+    if capture_policies:
+        logger.debug("[env] Loaded DATA_CAPTURE_POLICIES from env")
+        try:
+            config['_capture_policies'] = json.loads(capture_policies)
+        except ValueError as err:
+            logger.error('Failed to parse DATA_CAPTURE_POLICIES, expected a json list: %s', err)
+
+    sampling = {}
+    sampling_ratio = get_env_value('SAMPLING_RATIO')
+    if sampling_ratio:
+        logger.debug("[env] Loaded SAMPLING_RATIO from env")
+        sampling['ratio'] = float(sampling_ratio)
+    sampling_rate_limit = get_env_value('SAMPLING_RATE_LIMIT')
+    if sampling_rate_limit:
+        logger.debug("[env] Loaded SAMPLING_RATE_LIMIT from env")
+        sampling['rate_limit'] = float(sampling_rate_limit)
+    sampling_parent_based = get_env_value('SAMPLING_PARENT_BASED')
+    if sampling_parent_based:
+        logger.debug("[env] Loaded SAMPLING_PARENT_BASED from env")
+        sampling['parent_based'] = _is_true(sampling_parent_based)
+    if sampling:
+        config['_sampling'] = sampling
+
+    span_processor = {}
+    for option in ('max_queue_size', 'max_export_batch_size',
+                   'schedule_delay_millis', 'export_timeout_millis'):
+        value = get_env_value(f'SPAN_PROCESSOR_{option.upper()}')
+        if value:
+            logger.debug("[env] Loaded SPAN_PROCESSOR_%s from env", option.upper())
+            span_processor[option] = int(value)
+    drop_policy = get_env_value('SPAN_PROCESSOR_DROP_POLICY')
+    if drop_policy:
+        logger.debug("[env] Loaded SPAN_PROCESSOR_DROP_POLICY from env")
+        span_processor['drop_policy'] = drop_policy.lower()
+    if span_processor:
+        config['_span_processor'] = span_processor
+
+    attribute_compaction = {}
+    compaction_enabled = get_env_value('ATTRIBUTE_COMPACTION_ENABLED')
+    if compaction_enabled:
+        logger.debug("[env] Loaded ATTRIBUTE_COMPACTION_ENABLED from env")
+        attribute_compaction['enabled'] = _is_true(compaction_enabled)
+    merge_headers = get_env_value('ATTRIBUTE_COMPACTION_MERGE_HEADERS')
+    if merge_headers:
+        logger.debug("[env] Loaded ATTRIBUTE_COMPACTION_MERGE_HEADERS from env")
+        attribute_compaction['merge_headers'] = _is_true(merge_headers)
+    max_span_bytes = get_env_value('ATTRIBUTE_COMPACTION_MAX_SPAN_BYTES')
+    if max_span_bytes:
+        logger.debug("[env] Loaded ATTRIBUTE_COMPACTION_MAX_SPAN_BYTES from env")
+        attribute_compaction['max_span_bytes'] = int(max_span_bytes)
+    if attribute_compaction:
+        config['_attribute_compaction'] = attribute_compaction
+
+    exporter = {}
+    exporter_compression = get_env_value('EXPORTER_COMPRESSION')
+    if exporter_compression:
+        logger.debug("[env] Loaded EXPORTER_COMPRESSION from env")
+        exporter['compression'] = exporter_compression.lower()
+    exporter_timeout = get_env_value('EXPORTER_TIMEOUT')
+    if exporter_timeout:
+        logger.debug("[env] Loaded EXPORTER_TIMEOUT from env")
+        exporter['timeout'] = int(exporter_timeout)
+    exporter_headers = get_env_value('EXPORTER_HEADERS')
+    if exporter_headers:
+        logger.debug("[env] Loaded EXPORTER_HEADERS from env")
+        exporter['headers'] = dict(header.split('=', 1) for header in exporter_headers.split(','))
+    http_pool_size = get_env_value('EXPORTER_HTTP_POOL_SIZE')
+    if http_pool_size:
+        logger.debug("[env] Loaded EXPORTER_HTTP_POOL_SIZE from env")
+        exporter['http_pool_size'] = int(http_pool_size)
+    if exporter:
+        config['_exporter'] = exporter
+
+    forwarder = {}
+    forwarder_enabled = get_env_value('FORWARDER_ENABLED')
+    if forwarder_enabled:
+        logger.debug("[env] Loaded FORWARDER_ENABLED from env")
+        forwarder['enabled'] = _is_true(forwarder_enabled)
+    forwarder_socket_path = get_env_value('FORWARDER_SOCKET_PATH')
+    if forwarder_socket_path:
+        logger.debug("[env] Loaded FORWARDER_SOCKET_PATH from env")
+        forwarder['socket_path'] = forwarder_socket_path
+    if forwarder:
+        config['_forwarder'] = forwarder
+
+    spool = {}
+    spool_enabled = get_env_value('SPOOL_ENABLED')
+    if spool_enabled:
+        logger.debug("[env] Loaded SPOOL_ENABLED from env")
+        spool['enabled'] = _is_true(spool_enabled)
+    spool_directory = get_env_value('SPOOL_DIRECTORY')
+    if spool_directory:
+        logger.debug("[env] Loaded SPOOL_DIRECTORY from env")
+        spool['directory'] = spool_directory
+    for option in ('max_segment_bytes', 'max_bytes'):
+        value = get_env_value(f'SPOOL_{option.upper()}')
+        if value:
+            logger.debug("[env] Loaded SPOOL_%s from env", option.upper())
+            spool[option] = int(value)
+    if spool:
+        config['_spool'] = spool
+
+    template_unmatched_routes = get_env_value('SPAN_NAMING_TEMPLATE_UNMATCHED_ROUTES')
+    if template_unmatched_routes:
+        logger.debug("[env] Loaded SPAN_NAMING_TEMPLATE_UNMATCHED_ROUTES from env")
+        config['_span_naming'] = {'template_unmatched_routes': _is_true(template_unmatched_routes)}
+
     resource_attributes = get_env_value('RESOURCE_ATTRIBUTES')
     if resource_attributes:
         config['resource_attributes'] = {}
@@ -18,6 +18,64 @@ _LOG_LEVEL = {
     'NOTSET': logging.NOTSET
 }
 
+# log methods the facade binds from the wrapped logger
+_LOG_METHODS = ('debug', 'info', 'warning', 'error', 'exception', 'critical')
+
+# names of the loggers configured from HT_LOG_LEVEL
+_configured_loggers = set()
+_state = {'env_value': None}
+
+
+class AgentLogger:
+    '''Logger facade for instrumentation hot paths.
+
+    Log methods are bound from the wrapped logger, which checks levels against the
+    cache logging keeps per logger and clears on every level change, so setLevel,
+    basicConfig(level=...) or logging.disable apply right away.
+    Per request call sites should be guarded with `if logger.debug_enabled:`,
+    which skips the call and its arguments entirely.'''
+
+    def __init__(self, logger_: logging.Logger):
+        '''constructor'''
+        self.logger = logger_
+        for method_name in _LOG_METHODS:
+            setattr(self, method_name, getattr(logger_, method_name))
+
+    @property
+    def debug_enabled(self) -> bool:
+        '''Whether DEBUG records are logged'''
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def __getattr__(self, name):
+        '''Anything else is served by the wrapped logger'''
+        if name == 'logger':
+            raise AttributeError(name)
+        return getattr(self.logger, name)
+
+
+def get_agent_logger(name: str) -> AgentLogger:
+    '''Logger for agent modules, with a cheap debug_enabled guard'''
+    return AgentLogger(logging.getLogger(name))
+
+
+def _log_level_from_env() -> int:
+    env_value = get_env_value('LOG_LEVEL')
+    _state['env_value'] = env_value
+    if env_value:
+        return _LOG_LEVEL.get(env_value, logging.INFO)
+    return logging.INFO
+
+
+def refresh_log_level() -> bool:
+    '''Re-read HT_LOG_LEVEL, returns True if it changed and loggers were updated'''
+    if get_env_value('LOG_LEVEL') == _state['env_value']:
+        return False
+    log_level = _log_level_from_env()
+    for name in _configured_loggers:
+        logging.getLogger(name).setLevel(log_level)
+    return True
+
+
 def get_custom_logger(name: str) -> logging.Logger:
     '''Agent logger configuration'''
     try:
@@ -25,14 +83,10 @@ def get_custom_logger(name: str) -> logging.Logger:
                                       datefmt='%Y-%m-%d %H:%M:%S')
         screen_handler = logging.StreamHandler(stream=sys.stdout)
         screen_handler.setFormatter(formatter)
-        log_level = logging.INFO
         logger_ = logging.getLogger(name)
-        env_value = get_env_value('LOG_LEVEL')
-        if env_value:
-            log_level = _LOG_LEVEL.get(env_value, log_level)
-
-        logger_.setLevel(log_level)
+        logger_.setLevel(_log_level_from_env())
         logger_.addHandler(screen_handler)
+        _configured_loggers.add(name)
         return logger_
     except Exception as err:  # pylint: disable=W0703
         print('Failed to customize logger: exception=%s, stacktrace=%s',
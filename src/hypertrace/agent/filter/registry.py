@@ -21,12 +21,21 @@ class Registry:
         if not hasattr(self, '_initialized'):
             self._initialized = True
             self.filters = []
+            self.body_max_processing_size = 0
+
+    def set_body_max_processing_size(self, body_max_processing_size: int):
+        '''Limit how many bytes of a body are handed to evaluate_body, 0 means unbounded'''
+        self.body_max_processing_size = body_max_processing_size
 
     def register(self, filter_class: Type[Filter]):
         '''Register a filter to apply on ingress traffic'''
         instance = filter_class()
         self.filters.append(instance)
 
+    def has_filters(self) -> bool:
+        '''Are there any filters that need request data?'''
+        return len(self.filters) > 0
+
     def apply_filters(self, span: Span, url: Union[str, None], headers: dict, body, request_type) -> bool: # pylint:disable=R0913,R0917
         '''Apply all registered filters'''
         if url or headers:
@@ -35,8 +44,16 @@ class Registry:
                     return True
 
         if body:
+            body = self._bounded_body(body)
             for filter_instance in self.filters:
                 if filter_instance.evaluate_body(span, body, headers, request_type):
                     return True
 
         return False
+
+    def _bounded_body(self, body):
+        '''Trim str & bytes bodies to body_max_processing_size, other types are passed as is'''
+        limit = self.body_max_processing_size
+        if limit and isinstance(body, (bytes, bytearray, str)) and len(body) > limit:
+            return body[:limit]
+        return body
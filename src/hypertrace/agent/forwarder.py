@@ -0,0 +1,395 @@
+'''Ship span batches from worker processes to a single forwarder process over a unix socket.
+
+Workers serialize each batch to an OTLP ExportTraceServiceRequest and write it as a
+length prefixed frame to the forwarder socket, so they don't hold a collector
+connection of their own. The forwarder merges the batches of every worker and
+exports them to the collector.'''
+import argparse
+import gzip
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing
+
+import grpc
+import requests
+from opentelemetry.exporter.otlp.proto.common._internal.trace_encoder import encode_spans
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2_grpc import TraceServiceStub
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# big endian payload size
+_FRAME_HEADER = struct.Struct('>I')
+# a corrupt header must not make the forwarder allocate gigabytes
+_MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+_GRPC_COMPRESSION = {
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+    'none': grpc.Compression.NoCompression,
+}
+
+
+def grpc_compression(compression: str) -> typing.Optional[grpc.Compression]:
+    '''The grpc compression of a configured name, an unknown name exports uncompressed'''
+    if not compression:
+        return None
+    channel_compression = _GRPC_COMPRESSION.get(compression.strip().lower())
+    if channel_compression is None:
+        logger.warning('Unknown exporter compression `%s`, exporting uncompressed', compression)
+        return grpc.Compression.NoCompression
+    return channel_compression
+
+
+def default_socket_path() -> str:
+    '''Socket path of a forwarder started by this process, in a new directory only
+    the current user can access so other local users can't connect to it'''
+    return os.path.join(tempfile.mkdtemp(prefix=f'hypertrace-forwarder-{os.getpid()}-'),
+                        'forwarder.sock')
+
+
+def _span_count(request: ExportTraceServiceRequest) -> int:
+    return sum(len(scope_spans.spans)
+               for resource_spans in request.resource_spans
+               for scope_spans in resource_spans.scope_spans)
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> typing.Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = conn.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _peer_closed(sock: socket.socket) -> bool:
+    '''The forwarder never writes to workers, readable means it closed the connection'''
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+
+class UnixSocketSpanExporter(SpanExporter):
+    '''Writes span batches to the forwarder socket, the connection is opened lazily,
+    kept for every export and reopened once if the forwarder restarted'''
+
+    def __init__(self, socket_path: str, timeout: float = 10):
+        '''constructor'''
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._sock = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _send(self, frame: bytes) -> None:
+        if self._sock is not None and _peer_closed(self._sock):
+            # the forwarder restarted, a write would only fail after the frame is lost
+            self._close()
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            try:
+                sock.connect(self._socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        self._sock.sendall(frame)
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        payload = encode_spans(spans).SerializeToString()
+        frame = _FRAME_HEADER.pack(len(payload)) + payload
+        with self._lock:
+            if self._pid != os.getpid():
+                # a connection inherited through fork is shared with the parent
+                self._sock = None
+                self._pid = os.getpid()
+            for attempt in range(2):
+                try:
+                    self._send(frame)
+                    return SpanExportResult.SUCCESS
+                except OSError as err:
+                    self._close()
+                    if attempt:
+                        logger.debug('Failed to send %s spans to the forwarder at %s: %s',
+                                     len(spans), self._socket_path, err)
+        return SpanExportResult.FAILURE
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def otlp_http_sender(endpoint: str, headers: dict = None, compression: str = None,
+                     timeout: float = 10, cert_file: str = None):
+    '''Return a `send(request) -> bool` posting requests to an OTLP/HTTP collector'''
+    session = requests.Session()
+    session.headers.update(headers or {})
+    session.headers['Content-Type'] = 'application/x-protobuf'
+    use_gzip = compression == 'gzip'
+    if use_gzip:
+        session.headers['Content-Encoding'] = 'gzip'
+
+    def send(request: ExportTraceServiceRequest) -> bool:
+        data = request.SerializeToString()
+        if use_gzip:
+            data = gzip.compress(data)
+        response = session.post(endpoint, data=data, timeout=timeout, verify=cert_file or True)
+        if not response.ok:
+            logger.error('Collector rejected %s spans: status=%s', _span_count(request),
+                         response.status_code)
+        return response.ok
+    return send
+
+
+def otlp_grpc_sender(endpoint: str, headers: dict = None, compression: str = None,  # pylint: disable=R0913,R0917
+                     timeout: float = 10, secure: bool = False, cert_file: str = None):
+    '''Return a `send(request) -> bool` exporting requests to an OTLP/gRPC collector'''
+    channel_compression = grpc_compression(compression)
+    if secure:
+        root_certificates = None
+        if cert_file:
+            with open(cert_file, 'rb') as certificates:
+                root_certificates = certificates.read()
+        channel = grpc.secure_channel(endpoint, grpc.ssl_channel_credentials(root_certificates),
+                                      compression=channel_compression)
+    else:
+        channel = grpc.insecure_channel(endpoint, compression=channel_compression)
+    stub = TraceServiceStub(channel)
+    metadata = tuple((key.lower(), value) for key, value in (headers or {}).items())
+
+    def send(request: ExportTraceServiceRequest) -> bool:
+        stub.Export(request, metadata=metadata, timeout=timeout)
+        return True
+    return send
+
+
+class SpanForwarder:
+    '''Receives span batches on a unix socket and exports them merged, at least every
+    schedule_delay_millis or as soon as max_batch_spans spans are waiting'''
+
+    def __init__(self, socket_path: str, send, max_batch_spans: int = 512,
+                 schedule_delay_millis: float = 5000):
+        '''constructor'''
+        self.socket_path = socket_path
+        self._send = send
+        self._max_batch_spans = max_batch_spans
+        self._schedule_delay = schedule_delay_millis / 1e3
+        self._pending = ExportTraceServiceRequest()
+        self._pending_spans = 0
+        self._condition = threading.Condition()
+        self._server = None
+        self._connections = set()
+        self._closed = False
+        self._export_lock = threading.Lock()
+
+    def start(self) -> None:
+        '''Listen on the socket and start the accept and export threads'''
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # the socket is created owner only, other users can't connect before a chmod
+        umask = os.umask(0o177)
+        try:
+            self._server.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        self._server.listen(128)
+        threading.Thread(target=self._accept_loop, name='HypertraceForwarderAccept',
+                         daemon=True).start()
+        threading.Thread(target=self._export_loop, name='HypertraceForwarderExport',
+                         daemon=True).start()
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read_loop, args=(conn,), name='HypertraceForwarderReader',
+                             daemon=True).start()
+
+    def _read_loop(self, conn: socket.socket) -> None:
+        self._connections.add(conn)
+        with conn:
+            try:
+                while True:
+                    header = _recv_exactly(conn, _FRAME_HEADER.size)
+                    if header is None:
+                        return
+                    (size,) = _FRAME_HEADER.unpack(header)
+                    if size > _MAX_FRAME_SIZE:
+                        logger.error('Dropping forwarder connection, frame of %s bytes is too large', size)
+                        return
+                    payload = _recv_exactly(conn, size)
+                    if payload is None:
+                        return
+                    self.add(ExportTraceServiceRequest.FromString(payload))
+            except Exception as err:  # pylint: disable=W0703
+                if not self._closed:
+                    logger.error('Dropping forwarder connection: %s', err)
+            finally:
+                self._connections.discard(conn)
+
+    def add(self, request: ExportTraceServiceRequest) -> None:
+        '''Queue the spans of a worker batch'''
+        with self._condition:
+            self._pending.resource_spans.extend(request.resource_spans)
+            self._pending_spans += _span_count(request)
+            if self._pending_spans >= self._max_batch_spans:
+                self._condition.notify()
+
+    def _take_pending(self) -> typing.Optional[ExportTraceServiceRequest]:
+        with self._condition:
+            if not self._pending_spans:
+                return None
+            request = self._pending
+            self._pending = ExportTraceServiceRequest()
+            self._pending_spans = 0
+            return request
+
+    def _export_loop(self) -> None:
+        while not self._closed:
+            with self._condition:
+                if self._pending_spans < self._max_batch_spans:
+                    self._condition.wait(self._schedule_delay)
+            self.flush()
+
+    def flush(self) -> None:
+        '''Export the queued spans'''
+        with self._export_lock:
+            request = self._take_pending()
+            if request is None:
+                return
+            try:
+                self._send(request)
+            except Exception as err:  # pylint: disable=W0703
+                logger.error('Failed to export %s spans: %s', _span_count(request), err)
+
+    def close(self) -> None:
+        '''Stop accepting batches and export the queued ones'''
+        self._closed = True
+        if self._server is not None:
+            self._server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        for conn in list(self._connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._condition:
+            self._condition.notify()
+        self.flush()
+
+
+def _child_env() -> dict:
+    '''The forwarder must not be auto instrumented itself'''
+    from hypertrace.agent import autoinstrumentation  # pylint: disable=C0415
+    autoinstrumentation_path = os.path.dirname(os.path.abspath(autoinstrumentation.__file__))
+    env = dict(os.environ)
+    python_path = [path for path in env.get('PYTHONPATH', '').split(os.pathsep)
+                   if path and os.path.abspath(path) != autoinstrumentation_path]
+    env['PYTHONPATH'] = os.pathsep.join(python_path)
+    return env
+
+
+def start_forwarder_process(options: dict, startup_timeout: float = 5) -> subprocess.Popen:
+    '''Start a forwarder process exporting with options, the options are passed on
+    stdin so the token doesn't show up in the process list. The forwarder exits
+    when this process does.'''
+    options = dict(options, parent_pid=os.getpid())
+    process = subprocess.Popen([sys.executable, '-m', 'hypertrace.agent.forwarder'],  # pylint: disable=R1732
+                               stdin=subprocess.PIPE, env=_child_env())
+    process.stdin.write(json.dumps(options).encode('utf-8'))
+    process.stdin.close()
+
+    deadline = time.monotonic() + startup_timeout
+    while not os.path.exists(options['socket_path']) and time.monotonic() < deadline:
+        if process.poll() is not None:
+            logger.error('Span forwarder exited with status %s', process.returncode)
+            break
+        time.sleep(0.01)
+    logger.info('Started span forwarder(pid %s) listening on %s', process.pid, options['socket_path'])
+    return process
+
+
+def stop_forwarder_process(process: subprocess.Popen, timeout: float = 10) -> None:
+    '''Stop a forwarder process, it exports its queued spans before exiting'''
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        logger.error('Span forwarder(pid %s) did not exit in %ss, killing it', process.pid, timeout)
+        process.kill()
+        process.wait()
+
+
+def otlp_sender(options: dict):
+    '''Build the sender of the `reporter`(otlp or otlp_http) in options'''
+    common = {'headers': options.get('headers'),
+              'compression': options.get('compression'),
+              'timeout': options.get('timeout') or 10,
+              'cert_file': options.get('cert_file')}
+    if options.get('reporter') == 'otlp_http':
+        return otlp_http_sender(options['endpoint'], **common)
+    return otlp_grpc_sender(options['endpoint'], secure=options.get('secure', False), **common)
+
+
+def main() -> None:
+    '''Forwarder process entry point, options are read as json from stdin'''
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Hypertrace span forwarder, reads its options from stdin')
+    parser.parse_args()
+    options = json.loads(sys.stdin.read())
+
+    send = otlp_sender(options)
+    if options.get('spool'):
+        from hypertrace.agent.spool import DiskSpool  # pylint: disable=C0415
+        send = DiskSpool(send=send, **options['spool']).submit
+    forwarder = SpanForwarder(options['socket_path'], send,
+                              max_batch_spans=options.get('max_batch_spans') or 512,
+                              schedule_delay_millis=options.get('schedule_delay_millis') or 5000)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    forwarder.start()
+    parent_pid = options.get('parent_pid')
+    while not stopping.wait(1):
+        if parent_pid and os.getppid() != parent_pid:
+            break
+    forwarder.close()
+
+
+if __name__ == '__main__':
+    main()
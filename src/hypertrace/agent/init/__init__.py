@@ -1,21 +1,38 @@
 '''Initialize all the components using configuration from AgentConfig'''
 import sys
 import os
+import json
 import traceback
 import logging
 from typing import Union
 
+import grpc
+import requests
+from requests.adapters import HTTPAdapter
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider, export
 from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter as OTLPGrpcSpanExporter
+from opentelemetry.exporter.otlp.proto.http import Compression as HttpCompression
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter as OTLPHttpSpanExporter
 # from opentelemetry.exporter.zipkin.proto.http import ZipkinExporter
 from opentelemetry.trace import ProxyTracerProvider
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from hypertrace.agent import constants
 from hypertrace.agent.config import config_pb2, AgentConfig
+from hypertrace.agent.filter.registry import Registry
+from hypertrace.agent.attribute_compaction import AttributeCompactingSpanExporter
+from hypertrace.agent.forwarder import UnixSocketSpanExporter, default_socket_path, \
+    grpc_compression, otlp_sender, start_forwarder_process, stop_forwarder_process
+from hypertrace.agent.sampling import build_sampler
+from hypertrace.agent.span_processor import BoundedBatchSpanProcessor, ReplaceableSpanProcessor
+from hypertrace.agent.spool import DiskSpool, SpoolingSpanExporter
+from hypertrace.agent.startup_profile import startup_profiler
+
+_OTLP_REPORTERS = {
+    config_pb2.TraceReporterType.OTLP: 'otlp',
+    config_pb2.TraceReporterType.OTLP_HTTP: 'otlp_http',
+}
 
 # Initialize logger
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
@@ -28,6 +45,16 @@ class AgentInit:  # pylint: disable=R0902,R0903
         '''constructor'''
         logger.debug('Initializing AgentInit object.')
         self._config = agent_config
+        self._forwarder = None
+        self._forwarder_socket_path = None
+        # the options the forwarder was started with and the pid of the process that started it
+        self._forwarder_options = None
+        self._forwarder_pid = None
+        # added to the tracer provider once, holds the processors of the export pipeline
+        self._span_processor = None
+        self._pid = os.getpid()
+        # component -> state of the config it was last initialized with
+        self._applied = {}
 
         # Only available in python > 3.7
         # this does prevent user from having to add post fork hooks to their
@@ -38,21 +65,70 @@ class AgentInit:  # pylint: disable=R0902,R0903
 
     def post_fork(self):
         """Used to reinitialize exporter & processors in separate worker processes"""
+        # runs from the at fork handler and from server hooks(ex: gunicorn post_fork),
+        # the worker's pipeline is only built once
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        if self._span_processor is None:
+            logger.debug('Agent was not configured before forking, nothing to reinitialize.')
+            return
+        logger.debug('Replacing the span processors inherited by worker %s.', self._pid)
+        self._applied.pop('span_processors', None)
         self.apply_config(None)  # pylint:disable=W0212
 
     def apply_config(self, agent_config: (Union[None, AgentConfig])):
-        """Initialize various aspects of the agent based on the most recent config"""
+        """Initialize various aspects of the agent based on the most recent config,
+        components whose config didn't change since they were initialized are kept"""
         if agent_config:
             self._config = agent_config
 
-        self.init_trace_provider()
-        self.init_propagation()
+        with startup_profiler().phase('apply_config.trace_provider'):
+            self.init_trace_provider()
+        self._apply_if_changed('propagation', self._propagation_state(), self.init_propagation)
+        self._apply_if_changed('filters', self._filters_state(), self.init_filters)
+        self._apply_if_changed('span_processors', self._span_processors_state(),
+                               self.init_span_processors)
+
+    def _apply_if_changed(self, component: str, state, init) -> None:
+        if self._applied.get(component) == state:
+            logger.debug('%s config is unchanged, skipping its initialization', component)
+            return
+        with startup_profiler().phase(f'apply_config.{component}'):
+            init()
+        self._applied[component] = state
+
+    def _propagation_state(self):
+        return tuple(sorted(self._config.agent_config.propagation_formats))
+
+    def _filters_state(self):
+        return self._config.agent_config.data_capture.body_max_processing_size_bytes
+
+    def _span_processors_state(self) -> str:
+        '''Every config value the export pipeline is built from'''
+        agent_config = self._config.agent_config
+        reporting = agent_config.reporting
+        return json.dumps({
+            'console': bool(self._config.use_console_span_exporter()),
+            'service_name': agent_config.service_name,
+            'reporting': [reporting.endpoint, bool(reporting.secure), reporting.trace_reporter_type,
+                          reporting.token, reporting.cert_file],
+            'exporter': self._config.exporter_options(),
+            'attribute_compaction': self._config.attribute_compaction(),
+            'span_processor': self._config.span_processor_options(),
+            'forwarder': self._config.forwarder_options(),
+            'spool': self._config.spool_options(),
+        }, sort_keys=True, default=str)
 
+    def init_span_processors(self) -> None:
+        '''Build the export pipeline, replacing the current one'''
         if self._config.use_console_span_exporter():
             self.set_console_span_processor()
         else:
             self.init_exporter()
-
+        if self._config.use_console_span_exporter() or not self._config.forwarder_options()['enabled']:
+            # the replaced pipeline flushed its spans to the forwarder, it is no longer used
+            self._stop_forwarder()
 
     def init_trace_provider(self) -> None:
         '''Initialize trace provider and set resource attributes.'''
@@ -71,7 +147,8 @@ class AgentInit:  # pylint: disable=R0902,R0903
                 resource_attributes.update(
                     self._config.agent_config.resource_attributes)
             tracer_provider = TracerProvider(
-                resource=Resource.create(resource_attributes)
+                resource=Resource.create(resource_attributes),
+                sampler=build_sampler(**self._config.sampling())
             )
             trace.set_tracer_provider(tracer_provider)
         else:
@@ -81,13 +158,39 @@ class AgentInit:  # pylint: disable=R0902,R0903
     def init_exporter(self) -> None:
         """Initialize exporter"""
         reporter_type = self._config.agent_config.reporting.trace_reporter_type
-        exporter = self._init_exporter(reporter_type)
+        if self._config.forwarder_options()['enabled']:
+            exporter = self._init_forwarder_exporter(reporter_type)
+        elif self._config.spool_options()['enabled']:
+            exporter = self._init_spool_exporter(reporter_type)
+        else:
+            exporter = self._init_exporter(reporter_type)
         if exporter is None:
             logger.warning("Unable to initialize exporter")
+            self._set_span_processors([])
             return
 
-        span_processor = BatchSpanProcessor(exporter)
-        trace.get_tracer_provider().add_span_processor(span_processor)
+        compaction = self._config.attribute_compaction()
+        if compaction['enabled']:
+            exporter = AttributeCompactingSpanExporter(exporter,
+                                                       merge_headers=compaction['merge_headers'],
+                                                       max_span_bytes=compaction['max_span_bytes'])
+
+        self._set_span_processors([self._init_span_processor(exporter)])
+
+    def _set_span_processors(self, processors) -> None:
+        '''Replace the processors of the export pipeline'''
+        if self._span_processor is None:
+            self._span_processor = ReplaceableSpanProcessor()
+            trace.get_tracer_provider().add_span_processor(self._span_processor)
+        self._span_processor.replace(processors)
+
+    def _init_span_processor(self, exporter) -> BoundedBatchSpanProcessor:
+        options = self._config.span_processor_options()
+        try:
+            return BoundedBatchSpanProcessor(exporter, **options)
+        except ValueError as err:
+            logger.error('Invalid span processor config %s, using the defaults: %s', options, err)
+            return BoundedBatchSpanProcessor(exporter)
 
     def init_propagation(self) -> None:
         '''Initialize requested context propagation protocols.'''
@@ -112,13 +215,13 @@ class AgentInit:  # pylint: disable=R0902,R0903
         composite_propagators = CompositePropagator(propagator_list)
         set_global_textmap(composite_propagators)
 
+    def init_filters(self) -> None:
+        '''Configure how much of a body registered filters are allowed to inspect.'''
+        Registry().set_body_max_processing_size(
+            self._config.agent_config.data_capture.body_max_processing_size_bytes)
+
     def _set_wrapper_fields(self, wrapper):
-        data_cap = self._config.agent_config.data_capture
-        wrapper.set_process_request_headers(data_cap.http_headers.request)
-        wrapper.set_process_request_body(data_cap.http_body.request)
-        wrapper.set_process_response_headers(data_cap.http_headers.response)
-        wrapper.set_process_response_body(data_cap.http_body.response)
-        wrapper.set_body_max_size(data_cap.body_max_size_bytes)
+        wrapper.apply_agent_config(self._config)
 
     def init_library_instrumentation(self, instrumentation_name, wrapper_instance):
         """used to configure instrumentation wrapper settings + apply instrumentation"""
@@ -144,7 +247,7 @@ class AgentInit:  # pylint: disable=R0902,R0903
             service_name=self._config.agent_config.service_name)
         simple_export_span_processor = SimpleSpanProcessor(
             console_span_exporter)
-        trace.get_tracer_provider().add_span_processor(simple_export_span_processor)
+        self._set_span_processors([simple_export_span_processor])
 
     def _init_exporter(self, trace_reporter_type):
         exporter_type = ''
@@ -157,11 +260,10 @@ class AgentInit:  # pylint: disable=R0902,R0903
                 #)
             elif trace_reporter_type == config_pb2.TraceReporterType.OTLP:
                 exporter_type = 'otlp'
-                exporter = OTLPGrpcSpanExporter(endpoint=self._config.agent_config.reporting.endpoint,
-                                            insecure= not self._config.agent_config.reporting.secure)
+                exporter = self._init_otlp_grpc_exporter()
             elif trace_reporter_type == config_pb2.TraceReporterType.OTLP_HTTP:
                 exporter_type = 'otlp_http'
-                exporter = OTLPHttpSpanExporter(endpoint=self._config.agent_config.reporting.endpoint)
+                exporter = self._init_otlp_http_exporter()
 
             if exporter:
                 logger.info('Initialized %s exporter reporting to `%s`',
@@ -177,3 +279,138 @@ class AgentInit:  # pylint: disable=R0902,R0903
                          err,
                          traceback.format_exc())
             return None
+
+    def _init_forwarder_exporter(self, trace_reporter_type):
+        '''Export through a forwarder process, started once by the process that
+        initializes the agent and shared by its forked workers. It is restarted
+        when its options change.'''
+        reporter = _OTLP_REPORTERS.get(trace_reporter_type)
+        if reporter is None:
+            logger.error('The span forwarder only supports OTLP reporters, exporting in process')
+            return self._init_exporter(trace_reporter_type)
+
+        processor_options = self._config.span_processor_options()
+        spool_options = self._config.spool_options()
+        options = dict(self._otlp_sender_options(reporter),
+                       socket_path=self._config.forwarder_options()['socket_path'],
+                       max_batch_spans=processor_options['max_export_batch_size'],
+                       schedule_delay_millis=processor_options['schedule_delay_millis'],
+                       spool=_spool_arguments(spool_options) if spool_options['enabled'] else None)
+        if self._forwarder is not None and options != self._forwarder_options:
+            logger.info('Span forwarder options changed, restarting it')
+            # the current pipeline exports its spans before the forwarder stops
+            if self._span_processor is not None:
+                self._span_processor.force_flush()
+            self._stop_forwarder()
+
+        if self._forwarder is None:
+            socket_path = options['socket_path'] or default_socket_path()
+            try:
+                self._forwarder = start_forwarder_process(dict(options, socket_path=socket_path))
+            except Exception as err:  # pylint: disable=W0703
+                logger.error('Failed to start the span forwarder, exporting in process: exception=%s, '
+                             'stacktrace=%s', err, traceback.format_exc())
+                return self._init_exporter(trace_reporter_type)
+            self._forwarder_socket_path = socket_path
+            self._forwarder_options = options
+            self._forwarder_pid = os.getpid()
+        return UnixSocketSpanExporter(self._forwarder_socket_path,
+                                      timeout=self._config.exporter_options()['timeout'] or 10)
+
+    def _stop_forwarder(self) -> None:
+        '''Stop the forwarder started by this process, a forked worker leaves the
+        forwarder it shares with its parent running'''
+        process, self._forwarder = self._forwarder, None
+        if process is None or self._forwarder_pid != os.getpid():
+            return
+        try:
+            stop_forwarder_process(process)
+        except Exception as err:  # pylint: disable=W0703
+            logger.error('Failed to stop the span forwarder: exception=%s, stacktrace=%s',
+                         err, traceback.format_exc())
+        if not self._forwarder_options['socket_path']:
+            # the private directory of the default socket path
+            try:
+                os.rmdir(os.path.dirname(self._forwarder_socket_path))
+            except OSError:
+                pass
+
+    def _init_spool_exporter(self, trace_reporter_type):
+        '''Export in process, spooling batches to disk while the collector is unavailable'''
+        reporter = _OTLP_REPORTERS.get(trace_reporter_type)
+        if reporter is None:
+            logger.error('The span spool only supports OTLP reporters, exporting without it')
+            return self._init_exporter(trace_reporter_type)
+        try:
+            spool = DiskSpool(send=otlp_sender(self._otlp_sender_options(reporter)),
+                              **_spool_arguments(self._config.spool_options()))
+        except Exception as err:  # pylint: disable=W0703
+            logger.error('Failed to initialize the span spool, exporting without it: exception=%s, '
+                         'stacktrace=%s', err, traceback.format_exc())
+            return self._init_exporter(trace_reporter_type)
+        logger.info('Initialized %s exporter spooling to `%s`', reporter, spool.directory)
+        return SpoolingSpanExporter(spool)
+
+    def _otlp_sender_options(self, reporter: str) -> dict:
+        '''Options of forwarder.otlp_sender'''
+        reporting = self._config.agent_config.reporting
+        exporter_options = self._config.exporter_options()
+        return {
+            'reporter': reporter,
+            'endpoint': reporting.endpoint,
+            'secure': bool(reporting.secure),
+            'cert_file': reporting.cert_file or None,
+            'headers': self._exporter_headers(),
+            'compression': exporter_options['compression'],
+            'timeout': exporter_options['timeout'],
+        }
+
+    def _exporter_headers(self) -> dict:
+        '''Configured exporter headers, plus the reporting token as a bearer token'''
+        headers = dict(self._config.exporter_options()['headers'])
+        token = self._config.agent_config.reporting.token
+        if token:
+            headers.setdefault('authorization', f'Bearer {token}')
+        return headers
+
+    def _init_otlp_grpc_exporter(self) -> OTLPGrpcSpanExporter:
+        reporting = self._config.agent_config.reporting
+        options = self._config.exporter_options()
+        credentials = None
+        if reporting.secure and reporting.cert_file:
+            with open(reporting.cert_file, 'rb') as cert_file:
+                credentials = grpc.ssl_channel_credentials(root_certificates=cert_file.read())
+        return OTLPGrpcSpanExporter(endpoint=reporting.endpoint,
+                                    insecure=not reporting.secure,
+                                    credentials=credentials,
+                                    headers=self._exporter_headers() or None,
+                                    timeout=options['timeout'],
+                                    compression=grpc_compression(options['compression']))
+
+    def _init_otlp_http_exporter(self) -> OTLPHttpSpanExporter:
+        reporting = self._config.agent_config.reporting
+        options = self._config.exporter_options()
+        # one pool of keep-alive connections to the collector, exports never retry
+        # on a new connection since the BatchSpanProcessor already handles failures
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=options['http_pool_size'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        compression = None
+        if options['compression']:
+            try:
+                compression = HttpCompression(options['compression'])
+            except ValueError:
+                logger.warning('Unknown exporter compression `%s`, exporting uncompressed',
+                               options['compression'])
+                compression = HttpCompression.NoCompression
+        return OTLPHttpSpanExporter(endpoint=reporting.endpoint,
+                                    certificate_file=reporting.cert_file or None,
+                                    headers=self._exporter_headers() or None,
+                                    timeout=options['timeout'],
+                                    compression=compression,
+                                    session=session)
+
+
+def _spool_arguments(spool_options: dict) -> dict:
+    return {key: value for key, value in spool_options.items() if key != 'enabled'}
@@ -4,13 +4,28 @@ import os.path
 import inspect
 import traceback
 import json
-import logging
 
+from google.protobuf.json_format import MessageToDict
 from opentelemetry.attributes import BoundedAttributes
 from opentelemetry.trace.span import Span
 
+from hypertrace.agent.instrumentation.body_capture import BodyCapture, capture_body
+from hypertrace.agent.instrumentation.capture_policy import CapturePolicy, CapturePolicyTable
+from hypertrace.agent.instrumentation.body_serializers import default_body_serializers, \
+    serialize_protobuf
+from hypertrace.agent.instrumentation.content_type import ContentTypeClassifier, find_content_type
+from hypertrace.agent.instrumentation.header_capture import HeaderCapturePlan
+from hypertrace.agent.instrumentation.redaction import NO_REDACTION, compile_redactor
+from hypertrace.agent.instrumentation.span_names import SpanNameTable
+from hypertrace.agent import custom_logger
+
 # Setup logger name
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
+
+
+def _bool_value(value) -> bool:
+    '''Unwrap a BoolValue, a BoolValue message itself is always truthy'''
+    return bool(getattr(value, 'value', value))
 
 
 # This is a base class for all Hypertrace Instrumentation wrapper classes
@@ -36,34 +51,64 @@ class BaseInstrumentorWrapper:
         self._process_request_body = False
         self._process_response_body = False
         self._max_body_size = 128 * 1024
+        self._max_body_processing_size = 1024 * 1024
+        self._header_capture_rules = {}
+        self._header_capture_plans = {}
+        self._content_type_classifier = ContentTypeClassifier()
+        self._serialize_bodies = False
+        self._body_serializers = default_body_serializers()
+        self._redactor = NO_REDACTION
+        self._capture_policy_rules = []
+        self._capture_policies = None
+        self._span_names = SpanNameTable()
+
+    def apply_agent_config(self, config) -> None:
+        '''Configure data capture from an AgentConfig'''
+        data_cap = config.agent_config.data_capture
+        self.set_process_request_headers(data_cap.http_headers.request)
+        self.set_process_request_body(data_cap.http_body.request)
+        self.set_process_response_headers(data_cap.http_headers.response)
+        self.set_process_response_body(data_cap.http_body.response)
+        self.set_body_max_size(data_cap.body_max_size_bytes)
+        self.set_body_max_processing_size(data_cap.body_max_processing_size_bytes)
+        self.set_header_capture_rules(**config.header_capture_rules())
+        self.set_body_capture_content_types(config.body_capture_content_types())
+        self.set_body_serialization(config.body_capture_serialize())
+        self.set_redaction_rules(**config.redaction_rules())
+        self.set_capture_policies(config.capture_policies())
+        self.set_unmatched_route_templating(config.span_naming()['template_unmatched_routes'])
 
     # Set whether request headers should be put in extended span, takes a BoolValue as input
     def set_process_request_headers(self, process_request_headers) -> None:
         '''Should it process request headers?'''
+        self._process_request_headers = _bool_value(process_request_headers)
+        self._capture_policies = None
         logger.debug('Setting self._process_request_headers to \'%s\'',
-                     process_request_headers.value)
-        self._process_request_headers = process_request_headers
+                     self._process_request_headers)
 
     # Set whether response headers should be put in extended span, takes a BoolValue as input
     def set_process_response_headers(self, process_response_headers) -> None:
         '''Should it process response headers?'''
+        self._process_response_headers = _bool_value(process_response_headers)
+        self._capture_policies = None
         logger.debug('Setting self._process_response_headers to \'%s\'',
-                     process_response_headers.value)
-        self._process_response_headers = process_response_headers
+                     self._process_response_headers)
 
     # Set whether request body should be put in extended span, takes a BoolValue as input
     def set_process_request_body(self, process_request_body) -> None:
         '''should it process request body?'''
+        self._process_request_body = _bool_value(process_request_body)
+        self._capture_policies = None
         logger.debug('Setting self._process_request_body to \'%s\'',
-                     process_request_body.value)
-        self._process_request_body = process_request_body
+                     self._process_request_body)
 
     # Set whether response body should be put in extended span, takes a BoolValue as input
     def set_process_response_body(self, process_response_body) -> None:
         '''should it process response body?'''
+        self._process_response_body = _bool_value(process_response_body)
+        self._capture_policies = None
         logger.debug('Setting self._process_response_body to \'%s\'',
-                     process_response_body.value)
-        self._process_response_body = process_response_body
+                     self._process_response_body)
 
     # Set max body size
     def set_body_max_size(self, max_body_size) -> None:
@@ -71,6 +116,84 @@ class BaseInstrumentorWrapper:
         logger.debug('Setting self.body_max_size to %s.', max_body_size)
         self._max_body_size = max_body_size
 
+    # Set max body processing size
+    def set_body_max_processing_size(self, max_body_processing_size) -> None:
+        '''Set the max number of body bytes this instrumentor will read or inspect.'''
+        logger.debug('Setting self.body_max_processing_size to %s.', max_body_processing_size)
+        self._max_body_processing_size = max_body_processing_size
+
+    # Set per route overrides of the process request/response headers/body settings
+    def set_capture_policies(self, rules) -> None:
+        '''Set the per route capture rules, see capture_policy.CapturePolicyTable'''
+        logger.debug('Setting capture policies to %s', rules)
+        self._capture_policy_rules = list(rules or [])
+        self._capture_policies = None
+
+    def _capture_policy_table(self) -> CapturePolicyTable:
+        table = self._capture_policies
+        if table is None:
+            table = self._capture_policies = CapturePolicyTable(
+                self._capture_policy_rules,
+                CapturePolicy(self._process_request_headers, self._process_request_body,
+                              self._process_response_headers, self._process_response_body))
+        return table
+
+    def capture_policy(self, method, route) -> CapturePolicy:
+        '''Capture settings for a request method and route/path, a single memoized lookup'''
+        return self._capture_policy_table().resolve(method, route)
+
+    def set_unmatched_route_templating(self, enabled) -> None:
+        '''Name requests that matched no route after their templated path'''
+        self._span_names.template_unmatched = bool(enabled)
+
+    def add_route_span_names(self, route: str, methods) -> None:
+        '''Precompute the span names of a route when it is registered'''
+        self._span_names.add_route(route, methods)
+
+    def span_name(self, method: str, route: str = None, path: str = None) -> str:
+        '''"METHOD route" name of a server span, see span_names.SpanNameTable'''
+        return self._span_names.name(method, route, path)
+
+    # Set header allow/deny/redact lists, invalidates any precomputed capture plans
+    def set_header_capture_rules(self, allow=None, deny=None, redact=None) -> None:
+        '''Set which headers are captured and which are redacted.'''
+        logger.debug('Setting header capture rules allow=%s, deny=%s, redact=%s',
+                     allow, deny, redact)
+        self._header_capture_rules = {'allow': allow, 'deny': deny, 'redact': redact}
+        self._header_capture_plans = {}
+
+    # Set keys and regexes that are masked in captured headers and bodies
+    def set_redaction_rules(self, keys=None, patterns=None) -> None:
+        '''Set the field/header names and value patterns that are redacted.'''
+        logger.debug('Setting redaction rules keys=%s, patterns=%s', keys, patterns)
+        self._redactor = compile_redactor(keys, patterns)
+        self._header_capture_plans = {}
+
+    def header_capture_plan(self, prefix: str) -> HeaderCapturePlan:
+        '''Return the capture plan for a header attribute prefix, built on first use'''
+        plan = self._header_capture_plans.get(prefix)
+        if plan is None:
+            redactor = self._redactor if self._redactor.enabled() else None
+            plan = HeaderCapturePlan(prefix, redactor=redactor, **self._header_capture_rules)
+            self._header_capture_plans[prefix] = plan
+        return plan
+
+    # Set which content types have their body captured
+    def set_body_capture_content_types(self, content_types) -> None:
+        '''Set the media types, `+suffix` and `type/*` entries whose body is captured.'''
+        logger.debug('Setting body capture content types to %s', content_types)
+        self._content_type_classifier = ContentTypeClassifier(content_types)
+
+    # Set whether captured bodies are normalized by their content type serializer
+    def set_body_serialization(self, serialize_bodies) -> None:
+        '''Should captured bodies be compacted/normalized based on their content type?'''
+        self._serialize_bodies = _bool_value(serialize_bodies)
+        logger.debug('Setting self._serialize_bodies to %s', self._serialize_bodies)
+
+    def register_body_serializer(self, content_type: str, serializer) -> None:
+        '''Register a `serializer(body: str) -> str` for a media type or `+suffix`'''
+        self._body_serializers.register(content_type, serializer)
+
     # we need the headers lowercased multiple times
     # just do it once upfront
     def lowercase_headers(self, headers):
@@ -79,22 +202,26 @@ class BaseInstrumentorWrapper:
 
     def add_headers_to_span(self, prefix: str, span: Span, headers: dict):
         '''set header attributes on the span'''
-        for header_key, header_value in headers.items():
-            span.set_attribute(f"{prefix}{header_key}", header_value)
+        self.header_capture_plan(prefix).apply(span, headers)
+
+    def should_capture_request_body(self, span: Span, headers, policy: CapturePolicy = None) -> bool:
+        '''Only read a request body if it will end up on a recording span'''
+        process_request_body = self._process_request_body if policy is None else policy.request_body
+        return process_request_body and span.is_recording() \
+            and self.eligible_based_on_content_type(headers)
 
-    _ALLOWED_CONTENT_TYPES = [
-        "application/json",
-        "application/graphql",
-        'application/x-www-form-urlencoded'
-    ]
+    def should_capture_response_body(self, span: Span, headers, policy: CapturePolicy = None) -> bool:
+        '''Only read a response body if it will end up on a recording span'''
+        process_response_body = self._process_response_body if policy is None else policy.response_body
+        return process_response_body and span.is_recording() \
+            and self.eligible_based_on_content_type(headers)
 
     # We need the content type to do some escaping
     # so if we return a content type, that indicates valid for capture,
     # otherwise don't capture
     def eligible_based_on_content_type(self, headers: dict):
         '''find content-type in headers'''
-        content_type = headers.get("content-type")
-        return content_type in self._ALLOWED_CONTENT_TYPES
+        return self._content_type_classifier.is_eligible(find_content_type(headers))
 
     def _capture_headers(self, record_headers: bool, header_prefix: str,  # pylint:disable=R0913,R0917
                          span, headers: dict, record_body):
@@ -102,13 +229,11 @@ class BaseInstrumentorWrapper:
             if not span.is_recording():
                 return False
 
-            logger.debug('Span is Recording!')
-            lowercased_headers = self.lowercase_headers(headers)
             if record_headers:
-                self.add_headers_to_span(header_prefix, span, lowercased_headers)
+                self.add_headers_to_span(header_prefix, span, headers)
 
             if record_body:
-                content_type_recordable = self.eligible_based_on_content_type(lowercased_headers)
+                content_type_recordable = self.eligible_based_on_content_type(headers)
                 return content_type_recordable
             return False
         except:  # pylint: disable=W0702
@@ -120,30 +245,21 @@ class BaseInstrumentorWrapper:
     def _generic_handler(self, record_headers: bool, header_prefix: str,  # pylint:disable=R0913,R0917
                          record_body: bool, body_prefix: str,
                          span: Span, headers: dict, body):
-        logger.debug('Entering BaseInstrumentationWrapper.generic_handler().')
         try:  # pylint: disable=R1702
-            if not span.is_recording():
+            if not (record_headers or record_body) or not span.is_recording():
                 return span
 
-            logger.debug('Span is Recording!')
-            lowercased_headers = self.lowercase_headers(headers)
+            if logger.debug_enabled:
+                logger.debug('Entering BaseInstrumentationWrapper.generic_handler().')
             if record_headers:
-                self.add_headers_to_span(header_prefix, span, lowercased_headers)
+                self.add_headers_to_span(header_prefix, span, headers)
 
             if record_body:
-                content_type = self.eligible_based_on_content_type(lowercased_headers)
-
-                if content_type is False:
+                content_type = find_content_type(headers)
+                if not self._content_type_classifier.is_eligible(content_type):
                     return span
 
-                body_str = None
-                if isinstance(body, bytes):
-                    body_str = body.decode('UTF8', 'backslashreplace')
-                else:
-                    body_str = body
-
-                request_body_str = self.grab_first_n_bytes(body_str)
-                span.set_attribute(body_prefix, request_body_str)
+                span.set_attribute(body_prefix, self.capture_serialized_body(content_type, body))
 
         except:  # pylint: disable=W0702
             logger.debug('An error occurred in genericRequestHandler: exception=%s, stacktrace=%s',
@@ -157,50 +273,53 @@ class BaseInstrumentorWrapper:
     def generic_request_handler(self,  # pylint: disable=R0912
                                 request_headers: dict,
                                 request_body,
-                                span: Span) -> Span:
+                                span: Span,
+                                policy: CapturePolicy = None) -> Span:
         '''Add extended request data to the span'''
-        logger.debug('Entering BaseInstrumentationWrapper.genericRequestHandler().')
-        return self._generic_handler(self._process_request_headers, self.HTTP_REQUEST_HEADER_PREFIX,
-                                     self._process_request_body, self.HTTP_REQUEST_BODY_PREFIX,
+        if policy is None:
+            policy = self._capture_policy_table().default
+        return self._generic_handler(policy.request_headers, self.HTTP_REQUEST_HEADER_PREFIX,
+                                     policy.request_body, self.HTTP_REQUEST_BODY_PREFIX,
                                      span, request_headers, request_body)
 
     # Generic HTTP Response Handler
     def generic_response_handler(self,  # pylint: disable=R0912
                                  response_headers: dict,
                                  response_body,
-                                 span: Span) -> Span:  # pylint: disable=R0912
+                                 span: Span,
+                                 policy: CapturePolicy = None) -> Span:  # pylint: disable=R0912
         '''generic response handler'''
-        logger.debug(
-            'Entering BaseInstrumentationWrapper.genericResponseHandler().')
-        return self._generic_handler(self._process_response_headers, self.HTTP_RESPONSE_HEADER_PREFIX,
-                                     self._process_response_body, self.HTTP_RESPONSE_BODY_PREFIX,
+        if policy is None:
+            policy = self._capture_policy_table().default
+        return self._generic_handler(policy.response_headers, self.HTTP_RESPONSE_HEADER_PREFIX,
+                                     policy.response_body, self.HTTP_RESPONSE_BODY_PREFIX,
                                      span, response_headers, response_body)
 
     # Generic RPC Request Handler
     def generic_rpc_request_handler(self,
                                     request_headers: dict,
                                     request_body,
-                                    span: Span) -> Span:
+                                    span: Span,
+                                    policy: CapturePolicy = None) -> Span:
         '''Add extended request rpc data to span.'''
-        logger.debug(
-            'Entering BaseInstrumentationWrapper.genericRpcRequestHandler().')
         try:
             # Is the span currently recording?
             if not span.is_recording():
                 return span
+            if policy is None:
+                policy = self._capture_policy_table().default
 
-            logger.debug('Span is Recording!')
-            lowercased_headers = self.lowercase_headers(request_headers)
+            if logger.debug_enabled:
+                logger.debug(
+                    'Entering BaseInstrumentationWrapper.genericRpcRequestHandler().')
 
             # Log rpc metatdata if requested
-            if self._process_request_headers:
-                self.add_headers_to_span(self.RPC_REQUEST_METADATA_PREFIX, span, lowercased_headers)
+            if policy.request_headers:
+                self.add_headers_to_span(self.RPC_REQUEST_METADATA_PREFIX, span, request_headers)
             # Log rpc body if requested
-            if self._process_response_body:
-                request_body_str = str(request_body)
-                request_body_str = self.grab_first_n_bytes(request_body_str)
+            if policy.request_body:
                 span.set_attribute(self.RPC_REQUEST_BODY_PREFIX,
-                                   request_body_str)
+                                   self.capture_body(str(request_body)))
         except:  # pylint: disable=W0702
             logger.debug('An error occurred in genericRequestHandler: exception=%s, stacktrace=%s',
                          sys.exc_info()[0],
@@ -214,28 +333,30 @@ class BaseInstrumentorWrapper:
     def generic_rpc_response_handler(self,
                                      response_headers: dict,
                                      response_body,
-                                     span: Span) -> Span:
+                                     span: Span,
+                                     policy: CapturePolicy = None) -> Span:
         '''Add extended response rpc data to span'''
-        logger.debug(
-            'Entering BaseInstrumentationWrapper.genericRpcResponseHandler().')
         try:
             # is the span currently recording?
             if not span.is_recording():
                 return span
+            if policy is None:
+                policy = self._capture_policy_table().default
 
-            logger.debug('Span is Recording!')
-            lowercased_headers = self.lowercase_headers(response_headers)
+            if logger.debug_enabled:
+                logger.debug(
+                    'Entering BaseInstrumentationWrapper.genericRpcResponseHandler().')
             # Log rpc metadata if requested?
-            if self._process_response_headers:
-                logger.debug('Dumping Response Headers:')
-                self.add_headers_to_span(self.RPC_RESPONSE_METADATA_PREFIX, span, lowercased_headers)
+            if policy.response_headers:
+                if logger.debug_enabled:
+                    logger.debug('Dumping Response Headers:')
+                self.add_headers_to_span(self.RPC_RESPONSE_METADATA_PREFIX, span, response_headers)
             # Log rpc body if requested
-            if self._process_response_body:
-                response_body_str = str(response_body)
-                logger.debug('Processing response body')
-                response_body_str = self.grab_first_n_bytes(response_body_str)
+            if policy.response_body:
+                if logger.debug_enabled:
+                    logger.debug('Processing response body')
                 span.set_attribute(
-                    self.RPC_RESPONSE_BODY_PREFIX, response_body_str)
+                    self.RPC_RESPONSE_BODY_PREFIX, self.capture_body(str(response_body)))
             return span
         except:  # pylint: disable=W0702
             logger.debug('An error occurred in genericResponseHandler: exception=%s, stacktrace=%s',
@@ -254,7 +375,8 @@ class BaseInstrumentorWrapper:
         body_len = len(body)
         max_body_size = self._max_body_size
         if max_body_size and body_len > max_body_size:
-            logger.debug('message body size is greater than max size.')
+            if logger.debug_enabled:
+                logger.debug('message body size is greater than max size.')
             return True
         return False
 
@@ -264,6 +386,47 @@ class BaseInstrumentorWrapper:
         if body in (None, ''):
             return ''
         if self.check_body_size(body):  # pylint: disable=R1705
-            return body[0, self._max_body_size]
+            return body[:self._max_body_size]
         else:
             return body
+
+    def body_capture_limit(self) -> int:
+        '''Number of body bytes that will be captured, the smaller of
+        max_body_size & max_body_processing_size, 0 means unbounded'''
+        limits = [limit for limit in (self._max_body_size, self._max_body_processing_size) if limit]
+        return min(limits) if limits else 0
+
+    def body_read_limit(self, filter_limit: int = None) -> int:
+        '''Number of body bytes the agent needs to read: what is captured, or what the
+        serializer sees when bodies are serialized, and filter_limit bytes when filters
+        evaluate the body. 0 means the whole body'''
+        limits = [self._max_body_processing_size if self._serialize_bodies
+                  else self.body_capture_limit()]
+        if filter_limit is not None:
+            limits.append(filter_limit)
+        return 0 if 0 in limits else max(limits)
+
+    def new_body_capture(self) -> BodyCapture:
+        '''Return an incremental body capture bounded by body_capture_limit'''
+        return BodyCapture(self.body_capture_limit())
+
+    def capture_body(self, body) -> str:
+        '''Return the first N (body_capture_limit) bytes of a body as a string, body can be
+        bytes, str, memoryview, a file-like object or an iterator of chunks.
+        Redaction rules are applied to the captured text'''
+        return self._redactor.redact(capture_body(body, self.body_capture_limit()))
+
+    def capture_serialized_body(self, content_type, body) -> str:
+        '''Capture a body, normalized by the serializer of its content type when enabled.
+        The serializer sees up to max_body_processing_size bytes so a compacted body
+        can fit in max_body_size'''
+        if not self._serialize_bodies or self._body_serializers.serializer_for(content_type) is None:
+            return self.capture_body(body)
+        body = capture_body(body, self._max_body_processing_size)
+        return self.capture_body(self._body_serializers.serialize(content_type, body))
+
+    def serialize_message(self, message) -> str:
+        '''Serialize a protobuf message for rpc body capture'''
+        if self._serialize_bodies:
+            return serialize_protobuf(message)
+        return json.dumps(MessageToDict(message))
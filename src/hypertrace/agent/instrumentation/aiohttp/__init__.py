@@ -1,5 +1,4 @@
 '''Hypertrace instrumentation logic for aiohttp-client'''
-import logging
 import traceback
 import types
 import typing
@@ -13,9 +12,10 @@ from opentelemetry.instrumentation.aiohttp_client.version import __version__
 from opentelemetry.trace import TracerProvider, get_tracer
 from opentelemetry.instrumentation.aiohttp_client import AioHttpClientInstrumentor
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent import custom_logger
 
 # Initialize logger with local module name
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
 
 # Max time to wait for response data to be read.
 MAX_WAIT_TIME = 0.1 # seconds
@@ -71,11 +71,10 @@ def create_trace_config(
             trace_config_ctx: types.SimpleNamespace,
             params: aiohttp.TraceRequestChunkSentParams
     ):
-        logger.debug('Entering hypertrace on_request_chunk_sent().')
+        if logger.debug_enabled:
+            logger.debug('Entering hypertrace on_request_chunk_sent().')
         if hasattr(params, 'chunk') and params.chunk is not None:
-            decoded_chunk = params.chunk.decode()
-            logger.debug('request chunk: %s', decoded_chunk)
-            trace_config_ctx.request_body += decoded_chunk
+            trace_config_ctx.request_body.write(params.chunk)
 
     # This runs after an exception occurs
     async def on_request_exception( # pylint: disable=W0613
@@ -83,7 +82,8 @@ def create_trace_config(
             trace_config_ctx: types.SimpleNamespace,
             params: aiohttp.TraceRequestExceptionParams,
     ):
-        logger.debug('Entering on_request_exception().')
+        if logger.debug_enabled:
+            logger.debug('Entering on_request_exception().')
 
 
     # This runs after the request
@@ -92,11 +92,19 @@ def create_trace_config(
             trace_config_ctx: types.SimpleNamespace,
             params: aiohttp.TraceRequestEndParams,
     ) -> None:
-        logger.debug('Entering hypertrace on_request_end().')
-        # utf8_decoder = codecs.getincrementaldecoder('utf-8')
-        response_body = b''
+        span = trace.get_current_span()
+        trace_config_ctx.end_callback_called = True
+        trace_config_ctx.span = span
+        # non sampled requests don't need the response read
+        if not span.is_recording():
+            return
+
+        if logger.debug_enabled:
+            logger.debug('Entering hypertrace on_request_end().')
+        response_body = aiohttp_client_wrapper.new_body_capture()
         if hasattr(params.response, 'content') \
-          and params.response.content is not None:
+          and params.response.content is not None \
+          and aiohttp_client_wrapper.should_capture_response_body(span, params.response.headers):
             content_stream = params.response.content
             # A temporary dual end queue to copy data into
             # and use to reset the stream.
@@ -104,7 +112,8 @@ def create_trace_config(
             # Read all the data in the response buffer. This
             # will block until it receives the expected number of bytes
             # or the connection times out and move on with already read data.
-            logger.debug('Reading data---->')
+            if logger.debug_enabled:
+                logger.debug('Reading data---->')
             try:
                 while not content_stream.at_eof():
                     response_chunk = b''
@@ -113,28 +122,23 @@ def create_trace_config(
                        MAX_WAIT_TIME
                     )
                     tmp_deque.append(response_chunk)
-                    response_body += response_chunk
+                    response_body.write(response_chunk)
             except asyncio.TimeoutError as err: # pylint: disable=W0703
                 logger.error('No data to display, exception=%s, stacktrace=%s',
                              err,
                              traceback.print_exc())
             finally:
-                logger.debug('response_body: %s', str(response_body))
                 # Reset response.content_stream
                 content_stream._cursor = 0 # pylint: disable=W0212
                 content_stream._buffer = tmp_deque # pylint: disable=W0212
         request_body = ''
         if hasattr(trace_config_ctx, 'request_body') and trace_config_ctx.request_body is not None:
-            request_body = trace_config_ctx.request_body
-        span = trace.get_current_span()
+            request_body = trace_config_ctx.request_body.getvalue()
         # Add headers & body to span
-        if span.is_recording():
-            aiohttp_client_wrapper.generic_request_handler(
-                params.headers, request_body, span)
-            aiohttp_client_wrapper.generic_response_handler(
-                params.response.headers, response_body, span)
-        trace_config_ctx.end_callback_called = True
-        trace_config_ctx.span = span
+        aiohttp_client_wrapper.generic_request_handler(
+            params.headers, request_body, span)
+        aiohttp_client_wrapper.generic_response_handler(
+            params.response.headers, response_body.getvalue(), span)
 
     def _trace_config_ctx_factory(**kwargs):
         kwargs.setdefault("trace_request_ctx", {})
@@ -142,7 +146,7 @@ def create_trace_config(
             tracer=tracer, \
             url_filter=url_filter, \
             **kwargs, \
-            request_body='', \
+            request_body=aiohttp_client_wrapper.new_body_capture(), \
         )
 
     trace_config = aiohttp.TraceConfig(
@@ -1,5 +1,4 @@
 '''Hypertrace wrapper around OTel Lambda Instrumentor'''  # pylint: disable=R0801
-import logging
 import os
 from typing import Any, Callable
 from wrapt import wrap_function_wrapper
@@ -19,7 +18,8 @@ from opentelemetry.trace import (
 from opentelemetry.instrumentation import aws_lambda
 
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+from hypertrace.agent import custom_logger
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
 
 
 class AwsLambdaInstrumentorWrapper(AwsLambdaInstrumentor, BaseInstrumentorWrapper):
@@ -101,7 +101,8 @@ class AwsLambdaInstrumentorWrapper(AwsLambdaInstrumentor, BaseInstrumentorWrappe
                         cookies = lambda_event.get('cookies', [])
                         if len(cookies) > 0:
                             cookie_header = ';'.join(cookies)
-                            span.set_attribute('http.request.header.cookie', cookie_header)
+                            wrapper_instance.add_headers_to_span(
+                                wrapper_instance.HTTP_REQUEST_HEADER_PREFIX, span, {'cookie': cookie_header})
                     elif lambda_request_context.get('path', None):
                         span.set_attribute(SpanAttributes.HTTP_METHOD, lambda_request_context.get('httpMethod', None))
                         span.set_attribute(SpanAttributes.HTTP_SCHEME, lambda_request_context.get('protocol', None))
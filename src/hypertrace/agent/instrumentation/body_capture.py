@@ -0,0 +1,258 @@
+'''Bounded, incremental capture of request & response bodies'''
+import codecs
+import logging
+from collections.abc import Iterator
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# How much we ask a file-like body for in a single read() call
+_READ_CHUNK_SIZE = 16 * 1024
+
+
+class BodyCapture:
+    '''Accumulates body chunks until max_size bytes have been seen, anything past
+    the limit is never copied or decoded. A falsy max_size means no limit.'''
+
+    def __init__(self, max_size: int):
+        '''constructor'''
+        self._max_size = max_size
+        self._buffer = bytearray()
+        self._truncated = False
+
+    def remaining(self):
+        '''Number of bytes that can still be captured, None if unbounded'''
+        if not self._max_size:
+            return None
+        return max(self._max_size - len(self._buffer), 0)
+
+    def is_full(self) -> bool:
+        '''Has the capture limit been reached?'''
+        return self._truncated or (bool(self._max_size) and len(self._buffer) >= self._max_size)
+
+    def is_truncated(self) -> bool:
+        '''Was any data dropped because it was past the limit?'''
+        return self._truncated
+
+    def write(self, chunk) -> bool:
+        '''Append a chunk(bytes, bytearray, memoryview or str),
+        returns False once no more data will be accepted'''
+        if chunk is None:
+            return not self.is_full()
+        if self.is_full():
+            if len(chunk) > 0:
+                self._truncated = True
+            return False
+
+        remaining = self.remaining()
+        if isinstance(chunk, str):
+            # every character is at least one byte, so we never need to
+            # encode more than `remaining + 1` characters to know we are over
+            if remaining is not None:
+                chunk = chunk[:remaining + 1]
+            chunk = chunk.encode('UTF8', 'backslashreplace')
+
+        view = memoryview(chunk)
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        if remaining is not None and len(view) > remaining:
+            self._buffer += view[:remaining]
+            self._truncated = True
+            return False
+
+        self._buffer += view
+        return not self.is_full()
+
+    def consume(self, body) -> None:
+        '''Feed an entire body into the capture, stopping as soon as the limit is reached.
+        File-like objects & iterators are consumed, callers that need the data afterwards
+        must pass a replayable stream.'''
+        if body is None:
+            return
+        if isinstance(body, (bytes, bytearray, memoryview, str)):
+            self.write(body)
+        elif hasattr(body, 'read'):
+            self._consume_readable(body)
+        elif isinstance(body, (list, tuple, Iterator)):
+            for chunk in body:
+                if not self.write(chunk):
+                    break
+        else:
+            self.write(str(body))
+
+    def _consume_readable(self, stream) -> None:
+        while True:
+            remaining = self.remaining()
+            size = _READ_CHUNK_SIZE if remaining is None else min(_READ_CHUNK_SIZE, remaining + 1)
+            chunk = stream.read(size)
+            if not chunk or not self.write(chunk):
+                return
+
+    def getvalue(self) -> str:
+        '''Decode the captured bytes, a multi-byte character split by the limit is dropped'''
+        decoder = codecs.getincrementaldecoder('UTF8')('backslashreplace')
+        return decoder.decode(bytes(self._buffer), final=not self._truncated)
+
+
+def capture_body(body, max_size: int) -> str:
+    '''Return at most max_size bytes of body decoded as a string'''
+    body_capture = BodyCapture(max_size)
+    body_capture.consume(body)
+    return body_capture.getvalue()
+
+
+class ReplayableInput:
+    '''Wraps a WSGI input stream whose first bytes were read ahead for capture,
+    reads return those bytes again before continuing with the stream'''
+
+    def __init__(self, stream, prefix: bytes):
+        '''constructor'''
+        self._stream = stream
+        self._prefix = prefix
+        self._offset = 0
+
+    def _replayed(self) -> bool:
+        return self._offset >= len(self._prefix)
+
+    def read(self, size: int = -1) -> bytes:
+        '''Read up to size bytes, everything when size is negative or None'''
+        if self._replayed():
+            return self._stream.read() if size is None or size < 0 else self._stream.read(size)
+        if size is None or size < 0:
+            data = self._prefix[self._offset:] + self._stream.read()
+            self._offset = len(self._prefix)
+            return data
+        data = self._prefix[self._offset:self._offset + size]
+        self._offset += len(data)
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        '''Read into a writable buffer, werkzeug's LimitedStream prefers it over read'''
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self, size: int = -1) -> bytes:
+        '''Read a line, at most size bytes when size is positive'''
+        if self._replayed():
+            return self._stream.readline() if size is None or size < 0 \
+                else self._stream.readline(size)
+        end = len(self._prefix)
+        if size is not None and size >= 0:
+            end = min(end, self._offset + size)
+        newline = self._prefix.find(b'\n', self._offset, end)
+        if newline != -1:
+            end = newline + 1
+        line = self._prefix[self._offset:end]
+        self._offset = end
+        if newline == -1 and self._replayed():
+            # the line goes on past the prefix
+            if size is None or size < 0:
+                line += self._stream.readline()
+            elif len(line) < size:
+                line += self._stream.readline(size - len(line))
+        return line
+
+    def readlines(self, hint: int = -1) -> list:
+        '''Read the remaining lines'''
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def tee_stream(stream, limit: int, content_length: int = -1):
+    '''Read the first limit bytes of a body stream, plus one to detect that the body
+    is longer, returns them and a stream replaying them before the rest of the body.
+    A falsy limit reads the whole body, a negative content_length reads until EOF.'''
+    size = limit + 1 if limit else -1
+    if content_length >= 0:
+        size = content_length if size < 0 else min(size, content_length)
+
+    chunks = []
+    read = 0
+    while size < 0 or read < size:
+        chunk = stream.read(_READ_CHUNK_SIZE if size < 0 else min(_READ_CHUNK_SIZE, size - read))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        read += len(chunk)
+    prefix = b''.join(chunks)
+    return prefix, ReplayableInput(stream, prefix)
+
+
+def tee_wsgi_input(environ: dict, limit: int) -> bytes:
+    '''Read the first limit bytes of a WSGI request body, plus one to detect that
+    the body is longer, and put them back in front of `wsgi.input` for the app.
+    A falsy limit reads the whole body.'''
+    stream = environ.get('wsgi.input')
+    if stream is None:
+        return b''
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH') or -1)
+    except ValueError:
+        content_length = -1
+    if content_length < 0 and not environ.get('wsgi.input_terminated'):
+        # without a length reading could block on the connection, werkzeug treats
+        # such a body as empty too
+        return b''
+
+    prefix, environ['wsgi.input'] = tee_stream(stream, limit, content_length)
+    return prefix
+
+
+class CapturingIterable:
+    '''Passes a WSGI response iterable through, copying the first bytes of every chunk
+    into a BodyCapture as the server sends them. on_close(capture) runs once, when the
+    iterable is exhausted or closed, whichever comes first.'''
+
+    def __init__(self, iterable, capture: BodyCapture, on_close):
+        '''constructor'''
+        self._iterable = iterable
+        self._iterator = None
+        self._capture = capture
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = iter(self._iterable)
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self._finish()
+            raise
+        self._capture.write(chunk)
+        return chunk
+
+    def close(self) -> None:
+        '''Close the wrapped iterable as required by PEP 3333, then finish the capture'''
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        if on_close is None:
+            return
+        try:
+            on_close(self._capture)
+        except Exception as err:  # pylint: disable=W0703
+            logger.error('Failed to finish a response body capture: exception=%s', err)
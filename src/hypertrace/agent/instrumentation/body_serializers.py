@@ -0,0 +1,142 @@
+'''Content type keyed serializers that normalize captured bodies before they are added to a span'''
+import functools
+import json
+import logging
+import re
+from urllib.parse import parse_qsl
+
+from google.protobuf.json_format import MessageToDict
+
+from hypertrace.agent.instrumentation.content_type import parse_media_type
+
+try:
+    import orjson  # pylint: disable=E0401
+except ImportError:
+    orjson = None  # pylint: disable=C0103
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# content-type values are client controlled, bound the number of remembered lookups
+_MAX_CACHED_CONTENT_TYPES = 256
+
+# graphql string literals are kept verbatim, comments, commas and whitespace are ignored tokens
+_GRAPHQL_TOKENS = re.compile(r'("""(?:\\"""|[^"]|"(?!""))*"""|"(?:\\.|[^"\\\n])*")|((?:[\s,]+|#[^\n\r]*)+)')
+_GRAPHQL_PUNCTUATORS = frozenset('!$&().:=@[]{}|')
+
+
+def json_loads(body):
+    '''Parse JSON with orjson when installed'''
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def json_dumps(value) -> str:
+    '''Serialize to compact JSON with orjson when installed'''
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def serialize_json(body: str) -> str:
+    '''Compact a JSON document, bodies that don't parse(ex: truncated ones) are returned as is'''
+    try:
+        return json_dumps(json_loads(body))
+    except (ValueError, TypeError):
+        return body
+
+
+def serialize_form(body: str) -> str:
+    '''Decode an application/x-www-form-urlencoded body into a JSON object,
+    repeated fields become lists'''
+    fields = {}
+    for name, value in parse_qsl(body, keep_blank_values=True):
+        if name not in fields:
+            fields[name] = value
+        elif isinstance(fields[name], list):
+            fields[name].append(value)
+        else:
+            fields[name] = [fields[name], value]
+    return json_dumps(fields)
+
+
+def _graphql_token(match) -> str:
+    literal = match.group(1)
+    if literal is not None:
+        return literal
+    # ignored tokens are only needed to separate two names or values
+    source = match.string
+    start, end = match.span()
+    if start == 0 or end == len(source) or source[start - 1] in _GRAPHQL_PUNCTUATORS \
+            or source[end] in _GRAPHQL_PUNCTUATORS:
+        return ''
+    return ' '
+
+
+def serialize_graphql(body: str) -> str:
+    '''Extract the query of an application/graphql body without comments and
+    insignificant whitespace'''
+    return _GRAPHQL_TOKENS.sub(_graphql_token, body)
+
+
+def serialize_protobuf(message) -> str:
+    '''Serialize a protobuf message to compact JSON'''
+    return json_dumps(MessageToDict(message))
+
+
+class BodySerializerRegistry:
+    '''Maps content types to serializers, entries can be an exact media type
+    (`application/json`) or a structured syntax suffix(`+json`).
+    Lookups are memoized per raw content-type value.'''
+
+    def __init__(self):
+        '''constructor'''
+        self._exact = {}
+        self._suffixes = {}
+        self.serializer_for = functools.lru_cache(maxsize=_MAX_CACHED_CONTENT_TYPES)(self._lookup)
+
+    def register(self, content_type: str, serializer) -> None:
+        '''Register a `serializer(body: str) -> str` for a content type'''
+        content_type = content_type.strip().lower()
+        if content_type.startswith('+'):
+            self._suffixes[content_type] = serializer
+        else:
+            self._exact[content_type] = serializer
+        self.serializer_for.cache_clear()
+
+    def _lookup(self, content_type):
+        if not content_type:
+            return None
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode('latin-1')
+        media_type = parse_media_type(content_type)
+        serializer = self._exact.get(media_type)
+        if serializer is not None:
+            return serializer
+        for suffix, suffix_serializer in self._suffixes.items():
+            if media_type.endswith(suffix):
+                return suffix_serializer
+        return None
+
+    def serialize(self, content_type, body: str) -> str:
+        '''Serialize a captured body, unknown content types and failures return the body as is'''
+        serializer = self.serializer_for(content_type)
+        if serializer is None or not body:
+            return body
+        try:
+            return serializer(body)
+        except Exception as err:  # pylint: disable=W0703
+            logger.debug('Failed to serialize body: content_type=%s, exception=%s',
+                         content_type, err)
+            return body
+
+
+def default_body_serializers() -> BodySerializerRegistry:
+    '''Registry with the serializers shipped with the agent'''
+    registry = BodySerializerRegistry()
+    registry.register('application/json', serialize_json)
+    registry.register('+json', serialize_json)
+    registry.register('application/x-www-form-urlencoded', serialize_form)
+    registry.register('application/graphql', serialize_graphql)
+    return registry
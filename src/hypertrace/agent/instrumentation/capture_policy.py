@@ -0,0 +1,137 @@
+'''Per route overrides of the global header and body capture settings'''
+import functools
+import logging
+import re
+from collections import namedtuple
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+CapturePolicy = namedtuple('CapturePolicy',
+                           ['request_headers', 'request_body', 'response_headers', 'response_body'])
+
+# request paths are client controlled, bound the number of remembered decisions
+_MAX_CACHED_ROUTES = 1024
+
+# a templated segment: flask/django `<int:id>`, starlette `{id}` or `:id`
+_TEMPLATE_SEGMENT = re.compile(r'^(?:<[^>]*>|\{[^}]*\}|:\w+)$')
+
+
+def _split(route: str) -> list:
+    return [segment for segment in route.split('/') if segment]
+
+
+def _is_template(segment: str) -> bool:
+    return segment[0] in '<{:' and _TEMPLATE_SEGMENT.match(segment) is not None
+
+
+class _Node:  # pylint: disable=R0903
+    '''A path segment in the policy trie, exact and prefix map a method(None for any)
+    to the policy of the route ending here'''
+    __slots__ = ('children', 'template', 'exact', 'prefix')
+
+    def __init__(self):
+        self.children = {}
+        self.template = None
+        self.exact = {}
+        self.prefix = {}
+
+
+def _for_method(policies: dict, method):
+    if not policies:
+        return None
+    policy = policies.get(method)
+    if policy is None:
+        policy = policies.get(None)
+    return policy
+
+
+class CapturePolicyTable:
+    '''Resolves the capture settings of a request from a list of rules:
+
+        {'route': '/ingest/*', 'methods': ['POST'], 'request_body': False, 'response_body': False}
+
+    - route: an exact path(`/health`), a prefix(`/admin/*`) or a template
+      (`/users/<id>`, `/users/{id}`) where a templated segment matches any segment
+    - methods: optional, the rule applies to every method when missing
+    - request_headers, request_body, response_headers, response_body: optional
+      overrides, settings that are not overridden keep their global value
+
+    The most specific rule wins: an exact or templated route over a prefix, a
+    literal segment over a templated one and a longer prefix over a shorter one.
+    Rules are compiled into a segment trie and each resolved route is memoized.'''
+
+    def __init__(self, rules, default: CapturePolicy):
+        '''constructor'''
+        self.default = default
+        self._root = _Node()
+        self._rule_count = 0
+        for rule in rules or []:
+            try:
+                self._add(rule)
+            except (AttributeError, KeyError, TypeError) as err:
+                logger.error('Ignoring invalid capture policy %s: %s', rule, err)
+        if self._rule_count:
+            self.resolve = functools.lru_cache(maxsize=_MAX_CACHED_ROUTES)(self._resolve)
+        else:
+            self.resolve = self._resolve_default
+
+    def _add(self, rule: dict) -> None:
+        route = rule['route'].strip()
+        is_prefix = route.endswith('*')
+        segments = _split(route.rstrip('*'))
+
+        node = self._root
+        for segment in segments:
+            if _is_template(segment):
+                if node.template is None:
+                    node.template = _Node()
+                node = node.template
+            else:
+                node = node.children.setdefault(segment, _Node())
+
+        policy = self.default._replace(**{field: bool(rule[field])
+                                          for field in CapturePolicy._fields if field in rule})
+        policies = node.prefix if is_prefix else node.exact
+        for method in rule.get('methods') or [None]:
+            policies[method.upper() if method else None] = policy
+        self._rule_count += 1
+
+    def _resolve_default(self, method, route) -> CapturePolicy:  # pylint: disable=W0613
+        return self.default
+
+    def _match(self, node: _Node, segments: list, index: int, method):
+        '''Return (policy, specificity) of the best rule for segments[index:] under node'''
+        best = None
+        prefix = _for_method(node.prefix, method)
+        if prefix is not None:
+            best = (prefix, (0, index))
+
+        if index == len(segments):
+            exact = _for_method(node.exact, method)
+            if exact is not None:
+                return exact, (1, index)
+            return best or (None, None)
+
+        segment = segments[index]
+        candidates = []
+        if not _is_template(segment):
+            child = node.children.get(segment)
+            if child is not None:
+                candidates.append(child)
+        if node.template is not None:
+            candidates.append(node.template)
+
+        for child in candidates:
+            policy, specificity = self._match(child, segments, index + 1, method)
+            if policy is not None and (best is None or specificity > best[1]):
+                best = (policy, specificity)
+                if specificity[0] == 1:
+                    # an exact match through a literal segment can't be beaten
+                    break
+        return best or (None, None)
+
+    def _resolve(self, method, route) -> CapturePolicy:
+        policy, _ = self._match(self._root, _split(route or ''), 0,
+                                method.upper() if method else None)
+        return policy or self.default
@@ -0,0 +1,66 @@
+'''Decide whether a body is eligible for capture based on its content-type header'''
+import functools
+import logging
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Entries can be:
+# - an exact media type: `application/json`
+# - a structured syntax suffix: `+json` matches `application/vnd.api+json`
+# - a type wildcard: `text/*`
+DEFAULT_CAPTURE_CONTENT_TYPES = [
+    'application/json',
+    'application/graphql',
+    'application/x-www-form-urlencoded',
+    '+json',
+]
+
+# content-type values are client controlled, bound the number of remembered decisions
+_MAX_CACHED_CONTENT_TYPES = 256
+
+
+def parse_media_type(content_type: str) -> str:
+    '''Return the lowercased `type/subtype` of a content-type value without parameters'''
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+def find_content_type(headers):
+    '''Look up the content-type header without lowercasing every header name'''
+    if not headers:
+        return None
+    content_type = headers.get('content-type') or headers.get('Content-Type')
+    if content_type is not None:
+        return content_type
+    for header_name, header_value in headers.items():
+        if header_name.lower() == 'content-type':
+            return header_value
+    return None
+
+
+class ContentTypeClassifier:  # pylint: disable=R0903
+    '''Memoizes capture decisions in a bounded LRU keyed by the raw header value,
+    so repeated content-types cost a single cache lookup'''
+
+    def __init__(self, content_types=None):
+        '''constructor'''
+        if content_types is None:
+            content_types = DEFAULT_CAPTURE_CONTENT_TYPES
+        entries = [entry.strip().lower() for entry in content_types if entry and entry.strip()]
+        self._exact = frozenset(entry for entry in entries if not entry.startswith('+')
+                                and not entry.endswith('/*'))
+        self._suffixes = tuple(entry for entry in entries if entry.startswith('+'))
+        self._types = tuple(entry[:-1] for entry in entries if entry.endswith('/*'))
+        self.is_eligible = functools.lru_cache(maxsize=_MAX_CACHED_CONTENT_TYPES)(self._classify)
+
+    def _classify(self, content_type) -> bool:
+        if not content_type:
+            return False
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode('latin-1')
+        media_type = parse_media_type(content_type)
+        if media_type in self._exact:
+            return True
+        if self._suffixes and media_type.endswith(self._suffixes):
+            return True
+        return bool(self._types) and media_type.startswith(self._types)
@@ -0,0 +1,34 @@
+'''End a server span once its streamed response body was sent'''
+import threading
+
+
+class DeferredSpanEnd:
+    '''Holds back span.end() until the instrumentation ended the span and release()
+    was called, ex: once the server closed a streamed response'''
+
+    def __init__(self, span):
+        '''constructor'''
+        self._span = span
+        self._pending = 2
+        self._lock = threading.Lock()
+        # shadows Span.end on this instance until the instrumentation calls it
+        span.end = self._instrumentation_end
+
+    @classmethod
+    def install(cls, span):
+        '''Defer the end of span, None when the span doesn't allow it'''
+        if not hasattr(span, '__dict__'):
+            return None
+        return cls(span)
+
+    def _instrumentation_end(self, end_time=None):  # pylint: disable=W0613
+        del self._span.end
+        self.release()
+
+    def release(self) -> None:
+        '''Called once the response is done, the span ends on the last of both calls'''
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self._span.end()
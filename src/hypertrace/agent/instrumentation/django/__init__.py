@@ -1,5 +1,4 @@
 '''Hypertrace django instrumentor module wrapper.''' # pylint: disable=R0401
-import logging
 import traceback
 from types import MethodType
 
@@ -10,8 +9,27 @@ from django.core.exceptions import PermissionDenied  # pylint:disable=C0415
 from hypertrace.agent import constants
 from hypertrace.agent.filter.registry import Registry, TYPE_HTTP
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.body_capture import BodyCapture, CapturingIterable, tee_stream
+from hypertrace.agent.instrumentation.deferred_span import DeferredSpanEnd
+from hypertrace.agent import custom_logger
 
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
+
+
+def _request_body(wrapper, request, has_filters):
+    '''Read the bounded prefix of the request body the agent needs, the app still reads
+    the whole body, request.POST and request.FILES included'''
+    body = getattr(request, '_body', None)
+    if body is not None:
+        return body
+    stream = getattr(request, '_stream', None)
+    if stream is None or getattr(request, '_read_started', False):
+        # the body was consumed already, ex: by another middleware
+        return None
+    filter_limit = Registry().body_max_processing_size if has_filters else None
+    prefix, request._stream = tee_stream(  # pylint: disable=W0212
+        stream, wrapper.body_read_limit(filter_limit))
+    return prefix
 
 
 class DjangoInstrumentationWrapper(BaseInstrumentorWrapper):
@@ -28,8 +46,21 @@ class DjangoInstrumentationWrapper(BaseInstrumentorWrapper):
     def request_hook(self, span: Span, request):
         """django request hook before request is processed by app"""
         try:
-            body = request.body
-            self.generic_request_handler(request.headers, body, span)
+            # non sampled requests without filters don't need any request data
+            recording = span.is_recording()
+            has_filters = Registry().has_filters()
+            if not recording and not has_filters:
+                return
+
+            # the view isn't resolved yet, policies are matched against the path
+            policy = self.capture_policy(request.method, request.path_info)
+            body = None
+            if has_filters or self.should_capture_request_body(span, request.headers, policy):
+                body = _request_body(self, request, has_filters)
+            self.generic_request_handler(request.headers, body, span, policy)
+            if not has_filters:
+                return
+
             full_url = request.build_absolute_uri()
             block_result = Registry().apply_filters(span,
                                                     full_url,
@@ -51,13 +82,44 @@ class DjangoInstrumentationWrapper(BaseInstrumentorWrapper):
                          traceback.format_exc())
 
 
-    def response_hook(self, span, _request, response):
+    def response_hook(self, span, request, response):
         """django response hook before response is written out"""
         try:
-            body = response.content
-            self.generic_response_handler(response.headers, body, span)
+            if not span.is_recording():
+                return
+
+            policy = self.capture_policy(request.method, request.path_info)
+            body = None
+            if self.should_capture_response_body(span, response.headers, policy):
+                if not response.streaming:
+                    body = response.content
+                elif self._capture_streamed_response(span, response, policy):
+                    # captured while the server sends it
+                    return
+            self.generic_response_handler(response.headers, body, span, policy)
         except Exception as err:  # pylint:disable=W0703
             logger.debug(constants.INST_RUNTIME_EXCEPTION_MSSG,
                          'django response hook',
                          err,
                          traceback.format_exc())
+
+    def _capture_streamed_response(self, span, response, policy) -> bool:
+        '''Capture the first bytes of a streamed body as the server sends them, the span
+        ends once the response is closed. Returns False when the body can't be captured'''
+        if getattr(response, 'is_async', False):
+            return False
+        deferred = DeferredSpanEnd.install(span)
+        if deferred is None:
+            return False
+        response_headers = response.headers
+
+        def on_close(body_capture):
+            try:
+                self.generic_response_handler(response_headers, body_capture.getvalue(), span, policy)
+            finally:
+                deferred.release()
+
+        response.streaming_content = CapturingIterable(response.streaming_content,
+                                                       BodyCapture(self.body_read_limit()),
+                                                       on_close)
+        return True
@@ -1,5 +1,4 @@
 """includes a middleware.__call__ wrapper and the fast api instrumentor implementation + hooks"""
-import logging
 from functools import wraps
 
 from fastapi import HTTPException
@@ -16,8 +15,9 @@ from opentelemetry.propagate import extract
 
 from hypertrace.agent.filter.registry import Registry, TYPE_HTTP
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent import custom_logger
 
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
 
 
 # We need to replace the entire __call__ method so that we can
@@ -41,18 +41,21 @@ async def replaced_ot_middleware_call(self, scope, receive, send): # pylint:disa
     span_name, additional_attributes = self.default_span_details(scope)
 
     messages = []
-    more_body = True
-    while more_body:
-        message = await receive()
-        messages.append(message)
-        more_body = message.get("more_body", False)
-    body = b''.join([message.get("body", b"") for message in messages])
-
     try:
         with self.tracer.start_as_current_span(
                 span_name,
                 kind=trace.SpanKind.SERVER,
         ) as span:
+            body = b''
+            # only buffer the request body if it can be captured or filtered
+            if span.is_recording() or Registry().has_filters():
+                more_body = True
+                while more_body:
+                    message = await receive()
+                    messages.append(message)
+                    more_body = message.get("more_body", False)
+                body = b''.join([message.get("body", b"") for message in messages])
+
             if span.is_recording():
                 attributes = collect_request_attributes(scope)
                 attributes.update(additional_attributes)
@@ -70,18 +73,19 @@ async def replaced_ot_middleware_call(self, scope, receive, send): # pylint:disa
                 ) as receive_span:
                     if messages:
                         return messages.pop(0)
-                        # Once that's done we can just await any other messages.
+                    # Once that's done we can just await any other messages.
+                    message = await receive()
                     if receive_span.is_recording():
                         if message["type"] == "websocket.receive":
                             set_status_code(receive_span, 200)
                         receive_span.set_attribute("type", message["type"])
-                    return await receive()
+                    return message
 
             @wraps(send)
             async def wrapped_send(message):
                 send_span = span
                 if callable(self.client_response_hook):
-                    self.client_response_hook(send_span, message)
+                    self.client_response_hook(send_span, scope, message)
                 if send_span.is_recording():
                     if message["type"] == "http.response.start":
                         status_code = message["status"]
@@ -142,9 +146,17 @@ class FastAPIInstrumentorWrapper(BaseInstrumentorWrapper):
 
     def server_request_hook(self, span, req_data, body):
         """this function is used to capture request attributes"""
+        has_filters = Registry().has_filters()
+        if not span.is_recording() and not has_filters:
+            return True
+
         headers = dict(Headers(raw=req_data['headers']))
+        self.generic_request_handler(headers, body, span,
+                                     self.capture_policy(req_data.get('method'), req_data.get('path')))
+        if not has_filters:
+            return True
+
         request_url = str(Request(req_data).url)
-        self.generic_request_handler(headers, body, span)
 
         block_result = Registry().apply_filters(span,
                                                 request_url,
@@ -156,31 +168,27 @@ class FastAPIInstrumentorWrapper(BaseInstrumentorWrapper):
             return False
         return True
 
-    def client_response_hook(self, span, resp_data):
+    def client_response_hook(self, span, scope, resp_data):
         """used to capture the response data
         this function is called twice, once during each resp_phase"""
+        if not span.is_recording():
+            return
+
         resp_phase = resp_data['type']
         if resp_phase == "http.response.start":
             status_code = resp_data["status"]
             set_status_code(span, status_code)
             headers = dict(Headers(raw=resp_data['headers']))
-            should_capture_body = self._capture_headers(self._process_response_headers,
+            policy = self.capture_policy(scope.get('method'), scope.get('path'))
+            should_capture_body = self._capture_headers(policy.response_headers,
                                                         self.HTTP_RESPONSE_HEADER_PREFIX,
-                                                        span, headers, self._process_response_body)
+                                                        span, headers, policy.response_body)
             span.set_attribute('hypertrace.capture', should_capture_body)
 
         elif resp_phase == 'http.response.body':
             should_capture = span.attributes.get('hypertrace.capture')
             if should_capture:
-                body_data = resp_data['body']
-                body_str = None
-                if isinstance(body_data, bytes):
-                    body_str = body_data.decode('UTF8', 'backslashreplace')
-                else:
-                    body_str = body_data
-
-                resp_body_str = self.grab_first_n_bytes(body_str)
-                span.set_attribute('http.response.body', resp_body_str)
+                span.set_attribute('http.response.body', self.capture_body(resp_data['body']))
 
     def uninstrument(self):
         """Used to uninstrument fast api app"""
@@ -1,5 +1,4 @@
 '''Hypertrace flask instrumentor module wrapper.'''  # pylint: disable=R0401
-import logging
 import traceback
 import flask
 from opentelemetry.instrumentation.flask import (
@@ -13,13 +12,63 @@ from werkzeug.exceptions import Forbidden
 from hypertrace.agent import constants  # pylint: disable=R0801
 from hypertrace.agent.filter.registry import Registry, TYPE_HTTP
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.body_capture import BodyCapture, CapturingIterable
+from hypertrace.agent.instrumentation.deferred_span import DeferredSpanEnd
+from hypertrace.agent.instrumentation.wsgi import read_request_body
 
 from hypertrace.agent.config import AgentConfig
+from hypertrace.agent import custom_logger
 
 _InstrumentedFlask._commenter_options = {}  # pylint:disable=W0212
 
 # Initialize logger
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
+
+
+def _capture_policy(flask_wrapper, request):
+    '''Capture policy of the matched url rule, the path when no rule matched'''
+    url_rule = request.url_rule
+    return flask_wrapper.capture_policy(request.method,
+                                        url_rule.rule if url_rule is not None else request.path)
+
+
+def _add_route_span_names(flask_wrapper, url_rules) -> None:
+    '''Precompute the span names of registered url rules'''
+    for url_rule in url_rules:
+        flask_wrapper.add_route_span_names(url_rule.rule, url_rule.methods)
+
+
+def _request_body(flask_wrapper, request, has_filters) -> bytes:
+    '''Read the bounded prefix of the request body the agent needs, the app still
+    reads the whole body from wsgi.input'''
+    cached = getattr(request, '_cached_data', None)
+    if cached is not None:
+        return cached
+    if 'stream' in request.__dict__ or 'form' in request.__dict__:
+        # the app started reading the body, what is left can't be put back
+        return request.get_data()
+    return read_request_body(flask_wrapper, request.environ, has_filters)
+
+
+def _capture_streamed_response(flask_wrapper, response, span, policy) -> bool:
+    '''Capture the first bytes of a streamed or passthrough body as the server sends
+    them, returns False when the span end can't be deferred'''
+    deferred = DeferredSpanEnd.install(span)
+    if deferred is None:
+        return False
+    response_headers = response.headers
+
+    def on_close(body_capture):
+        try:
+            flask_wrapper.generic_response_handler(
+                response_headers, body_capture.getvalue(), span, policy)
+        finally:
+            deferred.release()
+
+    response.response = CapturingIterable(response.response,
+                                          BodyCapture(flask_wrapper.body_read_limit()),
+                                          on_close)
+    return True
 
 
 # Per request pre-handler
@@ -28,28 +77,47 @@ def _hypertrace_before_request(flask_wrapper):
 
     def hypertrace_before_request() -> None:
         '''Hypertrace before_request() method'''
-        logger.debug('Entering _hypertrace_before_request().')
         try:
             # Read span from flask "environment". The global flask.request
             # object keeps track of which request belong to the currently
             # active thread. See
             #   https://flask.palletsprojects.com/en/1.1.x/api/#flask.request
             span = flask.request.environ.get(_ENVIRON_SPAN_KEY)
+            if span is None:
+                return
+            # non sampled requests without filters don't need any request data
+            recording = span.is_recording()
+            has_filters = Registry().has_filters()
+            if not recording and not has_filters:
+                return
+
+            if logger.debug_enabled:
+                logger.debug('Entering _hypertrace_before_request().')
             # Pull request headers
             # for now, assuming single threaded mode (multiple python processes)
             request_headers = flask.request.headers
-            # Pull message body
-            request_body = flask.request.data  # same
+            policy = _capture_policy(flask_wrapper, flask.request)
+            # Pull message body, only when something will use it
+            request_body = None
+            if has_filters or flask_wrapper.should_capture_request_body(span, request_headers, policy):
+                request_body = _request_body(flask_wrapper, flask.request, has_filters)
+
+            if recording:
+                url_rule = flask.request.url_rule
+                span.update_name(flask_wrapper.span_name(
+                    flask.request.method, url_rule.rule if url_rule is not None else None,
+                    flask.request.path))
 
-            span.update_name(str(flask.request.method) + ' ' + str(flask.request.url_rule))
+                # Call base request handler
+                flask_wrapper.generic_request_handler(request_headers, request_body, span, policy)
 
-            # Call base request handler
-            flask_wrapper.generic_request_handler(request_headers, request_body, span)
+            if not has_filters:
+                return
 
             block_result = Registry().apply_filters(span,
                                                     flask.request.url,
-                                                    flask.request.headers,
-                                                    flask.request.data,
+                                                    request_headers,
+                                                    request_body,
                                                     TYPE_HTTP)
             if block_result:
                 logger.debug('should block evaluated to true, aborting with 403')
@@ -75,20 +143,29 @@ def _hypertrace_after_request(flask_wrapper) -> flask.wrappers.Response:
     def hypertrace_after_request(response):
         '''Hypertrace after_request method.'''
         try:
-            logger.debug('Entering _hypertrace_after_request().')
             # Read span from flask "environment"
             span = flask.request.environ.get(_ENVIRON_SPAN_KEY)
+            if span is None or not span.is_recording():
+                return response
+
+            if logger.debug_enabled:
+                logger.debug('Entering _hypertrace_after_request().')
             # Pull response headers
             response_headers = response.headers
+            policy = _capture_policy(flask_wrapper, flask.request)
 
             response_body = ""
-            # dont extract response content if body is a file
-            if not response.direct_passthrough:
-                response_body = response.data
+            if flask_wrapper.should_capture_response_body(span, response_headers, policy):
+                if response.is_streamed or response.direct_passthrough:
+                    # reading the body here would buffer it, it's captured as it's sent
+                    if _capture_streamed_response(flask_wrapper, response, span, policy):
+                        return response
+                else:
+                    response_body = response.get_data()
 
             # Call base response handler
             flask_wrapper.generic_response_handler(
-                response_headers, response_body, span)
+                response_headers, response_body, span, policy)
             return response
         except Exception as err:  # pylint: disable=W0703
             logger.error(constants.INST_RUNTIME_EXCEPTION_MSSG,
@@ -104,6 +181,8 @@ def _hypertrace_after_request(flask_wrapper) -> flask.wrappers.Response:
 class _HypertraceInstrumentedFlask(_InstrumentedFlask, BaseInstrumentorWrapper):
     """Hypertrace Wrapper class around OTel _InstrumentedFlask. This replaces
     the flask.Flask class definition."""
+    # the config the agent applied to FlaskInstrumentorWrapper, shared by every app
+    _hypertrace_config = None
 
     def __init__(self, *args, **kwargs):
         _InstrumentedFlask.__init__(self, *args, **kwargs)
@@ -111,12 +190,23 @@ class _HypertraceInstrumentedFlask(_InstrumentedFlask, BaseInstrumentorWrapper):
         BaseInstrumentorWrapper.__init__(self)
         self.before_request(_hypertrace_before_request(self))
         self.after_request(_hypertrace_after_request(self))
-        config: AgentConfig = AgentConfig()
-        self.set_process_request_headers(config.agent_config.data_capture.http_headers.request)
-        self.set_process_request_body(config.agent_config.data_capture.http_body.request)
-        self.set_process_response_headers(config.agent_config.data_capture.http_headers.response)
-        self.set_process_response_body(config.agent_config.data_capture.http_body.response)
-        self.set_body_max_size(config.agent_config.data_capture.body_max_size_bytes)
+        config: AgentConfig = self._hypertrace_config or AgentConfig()
+        self.apply_agent_config(config)
+        # rules registered by Flask.__init__, ex: static
+        _add_route_span_names(self, self.url_map.iter_rules())
+
+    def add_url_rule(self, rule, endpoint=None, view_func=None,  # pylint:disable=R0913,R0917
+                     provide_automatic_options=None, **options):
+        super().add_url_rule(rule, endpoint, view_func, provide_automatic_options, **options)
+        if not hasattr(self, '_span_names'):
+            # called by Flask.__init__ before the wrapper is initialized
+            return
+        try:
+            if endpoint is None and view_func is not None:
+                endpoint = view_func.__name__
+            _add_route_span_names(self, self.url_map.iter_rules(endpoint))
+        except Exception as err:  # pylint: disable=W0703
+            logger.debug('Failed to precompute span names of %s: %s', rule, err)
 
 
 # Main Flask Instrumentor Wrapper class.
@@ -128,6 +218,11 @@ class FlaskInstrumentorWrapper(FlaskInstrumentor, BaseInstrumentorWrapper):
         super().__init__()
         self._app = None
 
+    def apply_agent_config(self, config) -> None:
+        super().apply_agent_config(config)
+        # apps created once flask.Flask is replaced are configured the same way
+        _HypertraceInstrumentedFlask._hypertrace_config = config  # pylint: disable=W0212
+
     def with_app(self, app=None):
         """when instrumenting via code we need to instrument
         the app directly, this is conditionally called from agent.instrument"""
@@ -136,6 +231,7 @@ class FlaskInstrumentorWrapper(FlaskInstrumentor, BaseInstrumentorWrapper):
     def instrument(self, **kwargs):
         if self._app:
             # code based instrumentation
+            _add_route_span_names(self, self._app.url_map.iter_rules())
             before_hook = _hypertrace_before_request(self)
             after_hook = _hypertrace_after_request(self)
             FlaskInstrumentorWrapper.instrument_app(self._app)
@@ -1,9 +1,6 @@
 '''Hypertrace wrapper around OTel GRPC instrumentor'''
-import json
-import logging
 import traceback
 import grpc
-from google.protobuf.json_format import MessageToDict
 from opentelemetry import trace
 from opentelemetry.instrumentation.grpc import (
     GrpcInstrumentorServer,
@@ -17,9 +14,10 @@ from wrapt import wrap_function_wrapper as _wrap # pylint: disable=R0801
 from hypertrace.agent import constants
 from hypertrace.agent.filter.registry import Registry, TYPE_RPC
 from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent import custom_logger
 
 # Initialize logger with local module name
-logger = logging.getLogger(__name__) # pylint: disable=C0103
+logger = custom_logger.get_agent_logger(__name__) # pylint: disable=C0103
 
 # The main entry point for a wrapper around the OTel grpc:server instrumentation module
 class GrpcInstrumentorServerWrapper(GrpcInstrumentorServer, BaseInstrumentorWrapper):
@@ -119,16 +117,18 @@ class _OpenTelemetryWrapperServicerContext(_server._OpenTelemetryServicerContext
     '''grpc:server telemetry context'''
     def __init__(self, servicer_context, active_span):
         '''constructor'''
-        logger.debug(
-            'Entering _OpenTelemetryWrapperServicerContext.__init__().')
+        if logger.debug_enabled:
+            logger.debug(
+                'Entering _OpenTelemetryWrapperServicerContext.__init__().')
         super().__init__(servicer_context, active_span)
         self._response_headers = ()
 
     def set_trailing_metadata(self, *args, **kwargs) -> None:
         """Override trailing metadata(response headers) method.
         Allows us to capture the response headers"""
-        logger.debug(
-            'Entering _OpenTelemetryWrapperServicerContext.set_trailing_metadata().')
+        if logger.debug_enabled:
+            logger.debug(
+                'Entering _OpenTelemetryWrapperServicerContext.set_trailing_metadata().')
         self._response_headers = args
         return self._servicer_context.set_trailing_metadata(*args, **kwargs)
 
@@ -150,18 +150,21 @@ class OpenTelemetryServerInterceptorWrapper(_server.OpenTelemetryServerIntercept
 
     def intercept_service(self, continuation, handler_call_details):
         '''Setup interceptor'''
-        logger.debug(
-            'Entering OpenTelemetryServerInterceptorWrapper.intercept_service().')
+        if logger.debug_enabled:
+            logger.debug(
+                'Entering OpenTelemetryServerInterceptorWrapper.intercept_service().')
 
         def telemetry_wrapper(behavior, request_streaming, response_streaming): # pylint: disable=W0613
             '''Setup interceptor helper for unary requests.'''
-            logger.debug(
-                'Entering OpenTelemetryServerInterceptorWrapper.telemetry_wrapper().')
+            if logger.debug_enabled:
+                logger.debug(
+                    'Entering OpenTelemetryServerInterceptorWrapper.telemetry_wrapper().')
 
             def telemetry_interceptor(request_or_iterator, context) -> None:
                 '''Process request for hypertrace.'''
-                logger.debug(
-                    'Entering OpenTelemetryServerInterceptorWrapper.telemetry_interceptor().')
+                if logger.debug_enabled:
+                    logger.debug(
+                        'Entering OpenTelemetryServerInterceptorWrapper.telemetry_interceptor().')
                 # handle streaming responses specially
                 if response_streaming:
                     return self._intercept_server_stream(
@@ -172,34 +175,51 @@ class OpenTelemetryServerInterceptorWrapper(_server.OpenTelemetryServerIntercept
                     )
 
                 span = context._active_span # pylint: disable=W0212
-
-                invocation_metadata = dict(handler_call_details.invocation_metadata)
-                req_dict = MessageToDict(request_or_iterator)
-                self._gisw.generic_rpc_request_handler(
-                    invocation_metadata, json.dumps(req_dict), span)
+                # non sampled requests without filters don't need any request data
+                recording = span.is_recording()
+                has_filters = Registry().has_filters()
+
+                invocation_metadata = {}
+                if recording or has_filters:
+                    invocation_metadata = dict(handler_call_details.invocation_metadata)
+                policy = None
+                if recording:
+                    # rpc policies are matched against the full method name, ex: /pkg.Service/*
+                    policy = self._gisw.capture_policy(None, handler_call_details.method)
+                    request_body = None
+                    if policy.request_body:
+                        request_body = self._gisw.serialize_message(request_or_iterator)
+                    self._gisw.generic_rpc_request_handler(
+                        invocation_metadata, request_body, span, policy)
                 try:
-                    block_result = Registry().apply_filters(span,
-                                                            '',
-                                                            invocation_metadata,
-                                                            request_or_iterator,
-                                                            TYPE_RPC)
-                    if block_result:
-                        logger.debug('should block evaluated to true, aborting with 403')
-                        return context.abort(grpc.StatusCode.PERMISSION_DENIED, 'Permission Denied')
+                    if has_filters:
+                        block_result = Registry().apply_filters(span,
+                                                                '',
+                                                                invocation_metadata,
+                                                                request_or_iterator,
+                                                                TYPE_RPC)
+                        if block_result:
+                            logger.debug('should block evaluated to true, aborting with 403')
+                            return context.abort(grpc.StatusCode.PERMISSION_DENIED, 'Permission Denied')
 
                     # Capture response
                     context = _OpenTelemetryWrapperServicerContext(
                         context, span)
                     response = behavior(request_or_iterator, context)
+                    if not recording:
+                        return response
+
                     trailing_metadata = context.get_trailing_metadata()
                     if len(trailing_metadata) > 0:
                         trailing_metadata = dict(trailing_metadata[0])
                     else:
                         trailing_metadata = {}
 
-                    response_dict = MessageToDict(response)
+                    response_body = None
+                    if policy.response_body:
+                        response_body = self._gisw.serialize_message(response)
                     self._gisw.generic_rpc_response_handler(
-                        trailing_metadata, json.dumps(response_dict), span)
+                        trailing_metadata, response_body, span, policy)
 
                     return response
                 except Exception as error: # pylint: disable=W0703
@@ -221,8 +241,9 @@ class OpenTelemetryServerInterceptorWrapper(_server.OpenTelemetryServerIntercept
             request_or_iterator,
             context) -> None:
         '''Setup interceptor helper for streaming requests.'''
-        logger.debug(
-            'Entering OpenTelemetryServerInterceptorWrapper.intercept_server_stream().')
+        if logger.debug_enabled:
+            logger.debug(
+                'Entering OpenTelemetryServerInterceptorWrapper.intercept_server_stream().')
         # COME_BACK -- need to implement this
 
 # Wrapper around client-side interceptor
@@ -236,8 +257,9 @@ class OpenTelemetryClientInterceptorWrapper(_client.OpenTelemetryClientIntercept
 
     def intercept_unary(self, request, metadata, client_info, invoker) -> None:
         '''Process unary request for hypertrace.'''
-        logger.debug(
-            'Entering OpenTelemetryClientInterceptorWrapper.intercept_unary().')
+        if logger.debug_enabled:
+            logger.debug(
+                'Entering OpenTelemetryClientInterceptorWrapper.intercept_unary().')
         try:
             # Not sure how to obtain span object here
             result = invoker(request, metadata)  # pylint:disable=W0612
@@ -0,0 +1,85 @@
+'''Precomputed header capture plans used to turn headers into span attributes'''
+import logging
+
+from opentelemetry.trace.span import Span
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+REDACTED_VALUE = '[redacted]'
+
+# header names are client controlled, don't let the name cache grow without bound
+_MAX_CACHED_HEADER_NAMES = 1024
+
+# marker for a header name that is not captured
+_SKIP = object()
+
+
+def _normalize(header_names) -> frozenset:
+    if not header_names:
+        return frozenset()
+    return frozenset(name.strip().lower() for name in header_names if name.strip())
+
+
+class HeaderCapturePlan:
+    '''Maps raw header names to their final span attribute key once, applying
+    allow/deny/redact lists, so each request only does a dict lookup per header.
+
+    - allow: if not empty only these headers are captured
+    - deny: these headers are never captured
+    - redact: these headers are captured with their value replaced
+    - redactor: a redaction.Redactor, its keys are redacted headers and its
+      patterns are masked in the other header values
+    '''
+
+    def __init__(self, prefix: str, allow=None, deny=None, redact=None,  # pylint:disable=R0913,R0917
+                 redactor=None):
+        '''constructor'''
+        self._prefix = prefix
+        self._allow = _normalize(allow)
+        self._deny = _normalize(deny)
+        self._redact = _normalize(redact)
+        if redactor is not None:
+            self._redact = self._redact | redactor.keys
+        self._redact_value = redactor.redact_value if redactor is not None and redactor.patterns \
+            else None
+        self._keys = {}
+
+    def _resolve(self, header_name: str):
+        lowercased = header_name.lower()
+        if lowercased in self._deny or (self._allow and lowercased not in self._allow):
+            entry = _SKIP
+        else:
+            entry = (f"{self._prefix}{lowercased}", lowercased in self._redact)
+
+        if len(self._keys) < _MAX_CACHED_HEADER_NAMES:
+            self._keys[header_name] = entry
+        return entry
+
+    def attributes(self, headers) -> dict:
+        '''Build the span attributes for headers, a mapping or an iterable of pairs'''
+        attributes = {}
+        if not headers:
+            return attributes
+
+        keys = self._keys
+        items = headers.items() if hasattr(headers, 'items') else headers
+        for header_name, header_value in items:
+            entry = keys.get(header_name)
+            if entry is None:
+                entry = self._resolve(header_name)
+            if entry is _SKIP:
+                continue
+            attribute_key, redacted = entry
+            if redacted:
+                header_value = REDACTED_VALUE
+            elif self._redact_value is not None:
+                header_value = self._redact_value(header_value)
+            attributes[attribute_key] = header_value
+        return attributes
+
+    def apply(self, span: Span, headers) -> None:
+        '''Set all captured headers on the span in a single call'''
+        attributes = self.attributes(headers)
+        if attributes:
+            span.set_attributes(attributes)
@@ -0,0 +1,120 @@
+'''Run callbacks once a module has been imported.
+
+A finder at the front of `sys.meta_path` lets the other finders locate watched
+modules and wraps their loader, the callbacks run right after the module body
+executed, before the import statement that triggered it returns.'''
+import importlib.abc
+import logging
+import sys
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# module name -> {hook key -> callback(module)}
+_HOOKS = {}
+_LOCK = threading.RLock()
+
+
+def register_post_import_hook(module_name: str, key: str, callback) -> None:
+    '''Call callback(module) once module_name is imported, right away when it already is.
+
+    A hook registered again under the same key replaces the pending one.'''
+    with _LOCK:
+        module = sys.modules.get(module_name)
+        if module is None:
+            _HOOKS.setdefault(module_name, {})[key] = callback
+            _install_finder()
+            return
+    _run_hook(module_name, key, callback, module)
+
+
+def clear_post_import_hooks() -> None:
+    '''Forget the pending hooks'''
+    with _LOCK:
+        _HOOKS.clear()
+        _remove_finder()
+
+
+def pending_post_import_hooks() -> dict:
+    '''module name -> keys of the hooks waiting for it to be imported'''
+    with _LOCK:
+        return {module_name: sorted(hooks) for module_name, hooks in _HOOKS.items()}
+
+
+def _run_hooks(module) -> None:
+    with _LOCK:
+        hooks = _HOOKS.pop(module.__name__, {})
+        if not _HOOKS:
+            _remove_finder()
+    for key, callback in hooks.items():
+        _run_hook(module.__name__, key, callback, module)
+
+
+def _run_hook(module_name: str, key: str, callback, module) -> None:
+    logger.debug('%s was imported, running the %s import hook', module_name, key)
+    try:
+        callback(module)
+    except Exception as err:  # pylint: disable=W0703
+        logger.error('The %s import hook for %s failed: exception=%s, stacktrace=%s',
+                     key, module_name, err, traceback.format_exc())
+
+
+class _HookedLoader(importlib.abc.Loader):
+    '''Runs the hooks of a module once the loader it wraps executed it'''
+
+    def __init__(self, loader):
+        '''constructor'''
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # the module keeps its own loader, ex: for importlib.resources
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._loader.exec_module(module)
+        _run_hooks(module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _PostImportFinder(importlib.abc.MetaPathFinder):
+    '''Finds watched modules through the other finders and wraps their loader'''
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in _HOOKS:
+            return None
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, 'find_spec', None)
+            if find_spec is None:
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+                # namespace packages and legacy loaders are left alone
+                return spec
+            spec.loader = _HookedLoader(spec.loader)
+            return spec
+        return None
+
+
+_FINDER = _PostImportFinder()
+
+
+def _install_finder() -> None:
+    if _FINDER not in sys.meta_path:
+        sys.meta_path.insert(0, _FINDER)
+
+
+def _remove_finder() -> None:
+    try:
+        sys.meta_path.remove(_FINDER)
+    except ValueError:
+        pass
@@ -1,6 +1,8 @@
 '''this module acts as a driver for instrumentation definitions + application'''
 import logging
 
+from hypertrace.agent.instrumentation.import_hook import clear_post_import_hooks
+
 FLASK_KEY = 'flask'
 DJANGO_KEY = 'django'
 FAST_API_KEY = 'fastapi'
@@ -22,12 +24,29 @@ SUPPORTED_LIBRARIES = [
     LAMBDA, BOTO, BOTOCORE
 ]
 
+# map of library_key => module whose import triggers the instrumentation,
+# libraries without one are instrumented right away
+LIBRARY_MODULES = {
+    FLASK_KEY: 'flask',
+    DJANGO_KEY: 'django',
+    FAST_API_KEY: 'fastapi',
+    GRPC_SERVER_KEY: 'grpc',
+    GRPC_CLIENT_KEY: 'grpc',
+    POSTGRESQL_KEY: 'psycopg2',
+    MYSQL_KEY: 'mysql.connector',
+    REQUESTS_KEY: 'requests',
+    AIOHTTP_CLIENT_KEY: 'aiohttp',
+    BOTO: 'boto',
+    BOTOCORE: 'botocore',
+}
+
 # map of library_key => instrumentation wrapper instance
 _INSTRUMENTATION_STATE = {}
 
 logger = logging.getLogger(__name__)
 
 def _uninstrument_all():
+    clear_post_import_hooks()
     for key, value in _INSTRUMENTATION_STATE.items():
         logger.debug("Uninstrumenting %s", key)
         value.uninstrument()
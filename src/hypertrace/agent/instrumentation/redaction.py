@@ -0,0 +1,141 @@
+'''Mask sensitive values in captured headers and bodies before they are added to a span'''
+import functools
+import logging
+import re
+
+from hypertrace.agent.instrumentation.header_capture import REDACTED_VALUE
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# json: "key": "value", a value truncated by body capture has no closing quote
+_JSON_KEY_RULE = r'("(?:{keys})"\s*:\s*)(?:"(?:\\.|[^"\\])*(?:"|$)|[^\s,\]}}]+)'
+# form/query string: key=value, form values are url encoded and never contain a raw quote
+_FORM_KEY_RULE = r'((?<![^\s&;?])(?:{keys})=)[^\s&;"]*'
+
+_JSON_MASK = f'"{REDACTED_VALUE}"'
+
+
+def _normalize_keys(keys) -> tuple:
+    if not keys:
+        return ()
+    return tuple(sorted({key.strip().lower() for key in keys if key and key.strip()}))
+
+
+def _normalize_patterns(patterns) -> tuple:
+    if not patterns:
+        return ()
+    return tuple(dict.fromkeys(pattern for pattern in patterns if pattern))
+
+
+class Redactor:
+    '''Replaces sensitive values with `[redacted]`.
+
+    - keys: field names whose value is masked in JSON and form bodies, and header
+      names whose value is masked, matched case-insensitively
+    - patterns: regexes whose matches are masked in bodies and header values
+
+    Rules are compiled once. Keys are located with substring searches over the
+    lowercased body and case-sensitive scans with a literal prefix, which are much
+    cheaper than a case-insensitive alternation, and all patterns are combined
+    into a single regex.'''
+
+    def __init__(self, keys=None, patterns=None):
+        '''constructor'''
+        self.keys = frozenset(_normalize_keys(keys))
+        self._json_pattern = self._form_pattern = self._ignorecase_patterns = None
+        if self.keys:
+            # longest first so a key that prefixes another doesn't shadow it
+            alternation = '|'.join(re.escape(key) for key in sorted(self.keys, key=len, reverse=True))
+            json_rule = _JSON_KEY_RULE.format(keys=alternation)
+            form_rule = _FORM_KEY_RULE.format(keys=alternation)
+            self._json_pattern = re.compile(json_rule)
+            self._form_pattern = re.compile(form_rule)
+            self._ignorecase_patterns = (re.compile(json_rule, re.IGNORECASE),
+                                         re.compile(form_rule, re.IGNORECASE))
+
+        self.patterns = []
+        for pattern in _normalize_patterns(patterns):
+            try:
+                re.compile(pattern)
+            except re.error as err:
+                logger.error('Ignoring invalid redaction pattern %s: %s', pattern, err)
+                continue
+            self.patterns.append(pattern)
+        self._value_pattern = re.compile('|'.join(f'(?:{pattern})' for pattern in self.patterns)) \
+            if self.patterns else None
+
+    def enabled(self) -> bool:
+        '''Is there anything to redact?'''
+        return bool(self.keys) or self._value_pattern is not None
+
+    def is_sensitive_key(self, name: str) -> bool:
+        '''Is the value of this (lowercased) header or field name always masked?'''
+        return name in self.keys
+
+    def _redact_keys(self, body: str) -> str:
+        lowered = body.lower()
+        if len(lowered) != len(body):
+            # lower() expanded a character so offsets don't line up, use the slower
+            # case-insensitive patterns on the original body
+            json_pattern, form_pattern = self._ignorecase_patterns
+            body = json_pattern.sub(lambda match: match.group(1) + _JSON_MASK, body)
+            return form_pattern.sub(lambda match: match.group(1) + REDACTED_VALUE, body)
+
+        if not any(key in lowered for key in self.keys):
+            return body
+
+        masks = []
+        if '"' in lowered:
+            masks.extend((match.end(1), match.end(), _JSON_MASK)
+                         for match in self._json_pattern.finditer(lowered))
+        if '=' in lowered:
+            masks.extend((match.end(1), match.end(), REDACTED_VALUE)
+                         for match in self._form_pattern.finditer(lowered))
+        if not masks:
+            return body
+
+        masks.sort()
+        parts = []
+        position = 0
+        for start, end, mask in masks:
+            if start < position:
+                continue
+            parts.append(body[position:start])
+            parts.append(mask)
+            position = end
+        parts.append(body[position:])
+        return ''.join(parts)
+
+    def redact(self, body):
+        '''Mask sensitive keys and pattern matches in a body'''
+        if not body or not isinstance(body, str):
+            return body
+        if self.keys:
+            body = self._redact_keys(body)
+        if self._value_pattern is not None:
+            body = self._value_pattern.sub(REDACTED_VALUE, body)
+        return body
+
+    def redact_value(self, value):
+        '''Mask pattern matches in a single value, like a header'''
+        if self._value_pattern is None or not value or not isinstance(value, str):
+            return value
+        return self._value_pattern.sub(REDACTED_VALUE, value)
+
+
+NO_REDACTION = Redactor()
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(keys: tuple, patterns: tuple) -> Redactor:
+    return Redactor(keys, patterns)
+
+
+def compile_redactor(keys=None, patterns=None) -> Redactor:
+    '''Return a compiled Redactor, the same rules share one instance across wrappers'''
+    keys = _normalize_keys(keys)
+    patterns = _normalize_patterns(patterns)
+    if not keys and not patterns:
+        return NO_REDACTION
+    return _compile(keys, patterns)
@@ -0,0 +1,48 @@
+'''Span names of server requests, computed once per method and route'''
+import re
+
+# a path segment that most likely is an id: a number, a uuid or hex digest,
+# or a long token containing digits
+_ID_SEGMENT = re.compile(r'^(?:\d+|[0-9a-fA-F-]{8,}|(?=[^/]*\d)[^/]{16,})$')
+ID_PLACEHOLDER = '{id}'
+# unmatched paths are client controlled, deeper segments are dropped
+MAX_TEMPLATE_SEGMENTS = 4
+
+
+def template_path(path: str) -> str:
+    '''Template a path that matched no route: id like segments are replaced and
+    only the first MAX_TEMPLATE_SEGMENTS segments are kept'''
+    segments = [segment for segment in path.split('/') if segment]
+    templated = [ID_PLACEHOLDER if _ID_SEGMENT.match(segment) else segment
+                 for segment in segments[:MAX_TEMPLATE_SEGMENTS]]
+    if len(segments) > MAX_TEMPLATE_SEGMENTS:
+        templated.append('*')
+    return '/' + '/'.join(templated)
+
+
+class SpanNameTable:
+    '''"METHOD route" span names, cached per method and route. Only matched routes are
+    cached, their number is bounded by the app. Requests that matched no route are
+    named "METHOD None", or after their templated path when template_unmatched is set.'''
+
+    def __init__(self, template_unmatched: bool = False):
+        '''constructor'''
+        self.template_unmatched = template_unmatched
+        self._names = {}
+
+    def add_route(self, route: str, methods) -> None:
+        '''Precompute the names of a route when it is registered'''
+        for method in methods or ():
+            self._names[(method, route)] = f'{method} {route}'
+
+    def name(self, method: str, route: str = None, path: str = None) -> str:
+        '''The span name of a request, route is None when the request matched no route'''
+        if route is None:
+            if self.template_unmatched and path is not None:
+                return f'{method} {template_path(path)}'
+            return f'{method} None'
+        key = (method, route)
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = f'{method} {route}'
+        return name
@@ -0,0 +1,118 @@
+'''Hypertrace WSGI middleware, instruments any WSGI app (Falcon, Pyramid, Bottle, ...)'''
+import traceback
+from wsgiref.util import request_uri
+
+from opentelemetry import trace
+from opentelemetry.instrumentation.wsgi import OpenTelemetryMiddleware
+
+from hypertrace.agent import constants
+from hypertrace.agent.config import AgentConfig
+from hypertrace.agent.filter.registry import Registry, TYPE_HTTP
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.body_capture import BodyCapture, CapturingIterable, \
+    tee_wsgi_input
+from hypertrace.agent import custom_logger
+
+logger = custom_logger.get_agent_logger(__name__)  # pylint: disable=C0103
+
+# environ keys of headers that don't have the HTTP_ prefix
+_UNPREFIXED_HEADERS = {'CONTENT_TYPE': 'content-type', 'CONTENT_LENGTH': 'content-length'}
+
+
+def wsgi_request_headers(environ) -> dict:
+    '''Request headers of a WSGI environ, keyed by their lowercased HTTP name'''
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers[key[5:].replace('_', '-').lower()] = value
+        elif key in _UNPREFIXED_HEADERS and value:
+            headers[_UNPREFIXED_HEADERS[key]] = value
+    return headers
+
+
+def read_request_body(wrapper: BaseInstrumentorWrapper, environ, has_filters: bool) -> bytes:
+    '''Read the bounded prefix of the request body the agent needs, it is put back in
+    front of wsgi.input so the app still reads the whole body'''
+    filter_limit = Registry().body_max_processing_size if has_filters else None
+    return tee_wsgi_input(environ, wrapper.body_read_limit(filter_limit))
+
+
+class HypertraceWSGIMiddleware(OpenTelemetryMiddleware, BaseInstrumentorWrapper):
+    '''Traces a WSGI app, captures its request & response data and applies the
+    registered filters. ex: app = HypertraceWSGIMiddleware(app)'''
+
+    def __init__(self, wsgi, config: AgentConfig = None, tracer_provider=None):
+        OpenTelemetryMiddleware.__init__(self, self._hypertrace_app,
+                                         tracer_provider=tracer_provider)
+        BaseInstrumentorWrapper.__init__(self)
+        self._app = wsgi
+        self.apply_agent_config(config or AgentConfig())
+
+    def _hypertrace_app(self, environ, start_response):
+        '''Runs the app within the request span'''
+        span = trace.get_current_span()
+        # non sampled requests without filters don't need any request data
+        recording = span.is_recording()
+        has_filters = Registry().has_filters()
+        if not recording and not has_filters:
+            return self._app(environ, start_response)
+
+        policy = self.capture_policy(environ.get('REQUEST_METHOD'), environ.get('PATH_INFO', ''))
+        try:
+            blocked = self._handle_request(environ, span, policy, recording, has_filters)
+        except Exception as err:  # pylint: disable=W0703
+            logger.error(constants.INST_RUNTIME_EXCEPTION_MSSG,
+                         'wsgi request handler',
+                         err,
+                         traceback.format_exc())
+            blocked = False
+        if blocked:
+            logger.debug('should block evaluated to true, aborting with 403')
+            start_response('403 Forbidden', [('Content-Length', '0')])
+            return []
+        if not recording:
+            return self._app(environ, start_response)
+        return self._call_app(environ, start_response, span, policy)
+
+    def _handle_request(self, environ, span, policy, recording, has_filters) -> bool:  # pylint:disable=R0913,R0917
+        '''Capture the request data, returns whether a filter blocked the request'''
+        headers = wsgi_request_headers(environ)
+        body = None
+        if has_filters or self.should_capture_request_body(span, headers, policy):
+            body = read_request_body(self, environ, has_filters)
+        if recording:
+            self.generic_request_handler(headers, body, span, policy)
+        if not has_filters:
+            return False
+        return Registry().apply_filters(span, request_uri(environ), headers, body, TYPE_HTTP)
+
+    def _call_app(self, environ, start_response, span, policy):
+        '''Call the app, its response body is captured while the server iterates it'''
+        response = {}
+
+        def hypertrace_start_response(status, response_headers, *args):
+            try:
+                headers = {name.lower(): value for name, value in response_headers}
+                response['headers'] = headers
+                response['capture_body'] = self.should_capture_response_body(span, headers, policy)
+                if not response['capture_body']:
+                    self.generic_response_handler(headers, '', span, policy)
+            except Exception as err:  # pylint: disable=W0703
+                logger.error(constants.INST_RUNTIME_EXCEPTION_MSSG,
+                             'wsgi start_response',
+                             err,
+                             traceback.format_exc())
+            return start_response(status, response_headers, *args)
+
+        iterable = self._app(environ, hypertrace_start_response)
+        # apps may call start_response on the first iteration, the body is then
+        # copied until we know whether it's needed
+        if not policy.response_body or response.get('capture_body') is False:
+            return iterable
+
+        def on_close(body_capture):
+            if response.get('capture_body'):
+                self.generic_response_handler(
+                    response['headers'], body_capture.getvalue(), span, policy)
+
+        return CapturingIterable(iterable, BodyCapture(self.body_read_limit()), on_close)
@@ -0,0 +1,99 @@
+'''Samplers built from the `_sampling` agent config'''
+import logging
+import threading
+import time
+from typing import Optional, Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, Decision, ParentBased, Sampler, \
+    SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import Link, SpanKind, get_current_span
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class RateLimitingSampler(Sampler):
+    '''Samples at most `traces_per_second` traces per process with a token bucket.
+
+    The bucket holds up to one second worth of tokens so short bursts are sampled,
+    a sustained higher rate is capped. Traces are first offered to the delegate
+    sampler, only the ones it samples consume a token.'''
+
+    def __init__(self, traces_per_second: float, delegate: Sampler = ALWAYS_ON, clock=time.monotonic):
+        '''constructor'''
+        if traces_per_second <= 0:
+            raise ValueError('traces_per_second must be positive')
+        self._rate = float(traces_per_second)
+        self._capacity = max(self._rate, 1.0)
+        self._delegate = delegate
+        self._clock = clock
+        self._tokens = self._capacity
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        '''Maximum number of sampled traces per second'''
+        return self._rate
+
+    def _take_token(self) -> bool:
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._last_refill
+            if elapsed > 0:
+                self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+                self._last_refill = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def should_sample(self,  # pylint: disable=R0913,R0917
+                      parent_context: Optional[Context],
+                      trace_id: int,
+                      name: str,
+                      kind: Optional[SpanKind] = None,
+                      attributes: Attributes = None,
+                      links: Optional[Sequence[Link]] = None,
+                      trace_state: Optional[TraceState] = None) -> SamplingResult:
+        result = self._delegate.should_sample(parent_context, trace_id, name, kind,
+                                              attributes, links, trace_state)
+        if result.decision is Decision.DROP or self._take_token():
+            return result
+        return SamplingResult(Decision.DROP, None,
+                              get_current_span(parent_context).get_span_context().trace_state)
+
+    def get_description(self) -> str:
+        return f'RateLimitingSampler{{{self._rate}, {self._delegate.get_description()}}}'
+
+
+def build_sampler(ratio: float = 1.0, rate_limit: float = 0,
+                  parent_based: bool = True) -> Optional[Sampler]:
+    '''Build the sampler for the configured ratio and rate limit.
+
+    Root spans are sampled by TraceIdRatioBased(ratio), then limited to rate_limit
+    traces per second when it is positive. When parent_based is set child spans
+    follow the decision of their parent. Returns None for the default settings so
+    the tracer provider keeps its default(ParentBased(ALWAYS_ON) or OTEL_TRACES_SAMPLER).'''
+    if ratio is None or not 0.0 <= ratio <= 1.0:
+        logger.error('Invalid sampling ratio %s, expected a value between 0 and 1, '
+                     'sampling every trace', ratio)
+        ratio = 1.0
+    rate_limit = rate_limit or 0
+    if rate_limit < 0:
+        logger.error('Invalid sampling rate limit %s, rate limiting disabled', rate_limit)
+        rate_limit = 0
+
+    if ratio == 1.0 and not rate_limit and parent_based:
+        return None
+
+    sampler = ALWAYS_ON if ratio == 1.0 else TraceIdRatioBased(ratio)
+    if rate_limit:
+        sampler = RateLimitingSampler(rate_limit, sampler)
+    if parent_based:
+        sampler = ParentBased(sampler)
+    logger.debug('Using sampler %s', sampler.get_description())
+    return sampler
@@ -0,0 +1,169 @@
+'''Span processors of the agent's export pipeline: a BatchSpanProcessor with a
+configurable policy for spans that don't fit in its queue and a processor that lets
+the pipeline be replaced'''
+import logging
+import os
+import threading
+import typing
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
+from opentelemetry.trace import StatusCode
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# a full queue evicts its oldest span, the BatchSpanProcessor behavior
+DROP_OLDEST = 'drop_oldest'
+# a full queue rejects the span being added
+DROP_NEWEST = 'drop_newest'
+# a full queue rejects new spans unless they have an error status, those evict the oldest span
+KEEP_ERRORS = 'keep_errors'
+
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, KEEP_ERRORS)
+
+
+class BoundedBatchSpanProcessor(BatchSpanProcessor):
+    '''A BatchSpanProcessor that applies a drop policy when its queue is full and
+    counts the spans it dropped.'''
+
+    def __init__(self, span_exporter: SpanExporter,  # pylint: disable=R0913,R0917
+                 max_queue_size: int = None,
+                 schedule_delay_millis: float = None,
+                 max_export_batch_size: int = None,
+                 export_timeout_millis: float = None,
+                 drop_policy: str = DROP_OLDEST):
+        '''constructor'''
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'drop_policy must be one of {", ".join(DROP_POLICIES)}')
+        self.drop_policy = drop_policy
+        self._drop_lock = threading.Lock()
+        self._dropped_spans = 0
+        self._dropped_error_spans = 0
+        super().__init__(span_exporter,
+                         max_queue_size=max_queue_size,
+                         schedule_delay_millis=schedule_delay_millis,
+                         max_export_batch_size=max_export_batch_size,
+                         export_timeout_millis=export_timeout_millis)
+
+    @property
+    def dropped_spans(self) -> int:
+        '''Number of spans dropped because the queue was full'''
+        return self._dropped_spans
+
+    @property
+    def dropped_error_spans(self) -> int:
+        '''Number of dropped spans that had an error status'''
+        return self._dropped_error_spans
+
+    def _record_drop(self, span: ReadableSpan) -> None:
+        with self._drop_lock:
+            self._dropped_spans += 1
+            if _is_error(span):
+                self._dropped_error_spans += 1
+            first_drop = self._dropped_spans == 1
+        if first_drop:
+            logger.warning('Span queue is full(max_queue_size=%s), dropping spans with the %s policy',
+                           self.max_queue_size, self.drop_policy)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if len(self.queue) < self.max_queue_size or self.done \
+                or not span.context.trace_flags.sampled:
+            super().on_end(span)
+            return
+
+        if self.drop_policy == DROP_NEWEST \
+                or (self.drop_policy == KEEP_ERRORS and not _is_error(span)):
+            self._record_drop(span)
+            return
+
+        # DROP_OLDEST, or an error span under KEEP_ERRORS: make room by evicting
+        # the oldest span, the worker exports from the same end
+        try:
+            self._record_drop(self.queue.pop())
+        except IndexError:
+            # the worker emptied the queue in the meantime
+            pass
+        super().on_end(span)
+
+    def _at_fork_reinit(self):
+        self._drop_lock = threading.Lock()
+        super()._at_fork_reinit()
+
+    def shutdown(self) -> None:
+        if self._dropped_spans:
+            logger.warning('Dropped %s spans(%s with an error status) because the span queue was full',
+                           self._dropped_spans, self._dropped_error_spans)
+        super().shutdown()
+
+
+def _is_error(span: ReadableSpan) -> bool:
+    return span.status is not None and span.status.status_code is StatusCode.ERROR
+
+
+class ReplaceableSpanProcessor(SpanProcessor):
+    '''Hands spans to the processors of the agent's export pipeline.
+
+    It is added to the tracer provider once, applying the config again or
+    reinitializing a forked worker replaces the processors it holds instead of
+    adding more processors to the provider.'''
+
+    def __init__(self):
+        '''constructor'''
+        self._processors = ()
+        self._pid = os.getpid()
+
+    @property
+    def processors(self) -> tuple:
+        '''The processors spans are handed to'''
+        return self._processors
+
+    def replace(self, processors: typing.Sequence[SpanProcessor]) -> None:
+        '''Hand spans to processors from now on and shut the previous ones down.
+
+        Processors inherited from the parent process are only stopped, their
+        exporters(ex: connections to the collector) still belong to the parent.'''
+        previous = self._processors
+        inherited = self._pid != os.getpid()
+        self._processors = tuple(processors)
+        self._pid = os.getpid()
+        for processor in previous:
+            try:
+                if inherited:
+                    _stop_inherited(processor)
+                else:
+                    processor.shutdown()
+            except Exception as err:  # pylint: disable=W0703
+                logger.debug('Failed to shut down span processor %s: %s', processor, err)
+
+    def on_start(self, span: Span, parent_context: typing.Optional[Context] = None) -> None:
+        for processor in self._processors:
+            processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        for processor in self._processors:
+            processor.on_end(span)
+
+    def shutdown(self) -> None:
+        for processor in self._processors:
+            processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        flushed = True
+        for processor in self._processors:
+            flushed = processor.force_flush(timeout_millis) and flushed
+        return flushed
+
+
+def _stop_inherited(processor: SpanProcessor) -> None:
+    '''Stop the worker thread a BatchSpanProcessor restarts in a forked child'''
+    if not isinstance(processor, BatchSpanProcessor):
+        return
+    processor.done = True
+    # the condition is only safe to use once the processor reinitialized it in this
+    # process, a parent thread may have held the inherited lock when it forked.
+    # Otherwise the worker started by the reinitialization sees `done` right away
+    if getattr(processor, '_pid', None) == os.getpid():
+        with processor.condition:
+            processor.condition.notify_all()
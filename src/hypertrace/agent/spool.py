@@ -0,0 +1,371 @@
+'''Buffer span batches on disk while the collector is unavailable.
+
+Batches that fail to export are appended to segment files as length prefixed
+OTLP ExportTraceServiceRequest frames. A background thread replays the oldest
+segment through a memory map once the collector accepts exports again and
+deletes it when every batch was sent.'''
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import typing
+
+from google.protobuf.message import DecodeError
+from opentelemetry.exporter.otlp.proto.common._internal.trace_encoder import encode_spans
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# big endian payload size
+_FRAME_HEADER = struct.Struct('>I')
+
+_SEGMENT_PATTERN = 'segment-*-*.spool'
+
+_MIN_RETRY_SECONDS = 1.0
+_MAX_RETRY_SECONDS = 30.0
+
+
+def _segment_pid(path: str) -> int:
+    '''segment-<creation time ns>-<pid>.spool'''
+    return int(os.path.basename(path)[:-len('.spool')].split('-')[2])
+
+
+def _claim(path: str, pid: int) -> typing.Optional[str]:
+    '''Rename the segment of an exited process after pid, None when another
+    process claimed it first. The creation time is kept so segments still sort.'''
+    created = os.path.basename(path).split('-')[1]
+    claimed = os.path.join(os.path.dirname(path), f'segment-{created}-{pid}.spool')
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class SpoolStats:  # pylint: disable=R0902,R0903
+    '''Counters of a DiskSpool'''
+
+    def __init__(self):
+        '''constructor'''
+        self.spooled_batches = 0
+        self.spooled_bytes = 0
+        self.replayed_batches = 0
+        self.replayed_bytes = 0
+        self.replay_seconds = 0.0
+        self.dropped_batches = 0
+        self.dropped_bytes = 0
+
+    def replay_throughput(self) -> float:
+        '''Replayed bytes per second'''
+        if not self.replay_seconds:
+            return 0.0
+        return self.replayed_bytes / self.replay_seconds
+
+    def as_dict(self) -> dict:
+        '''The counters and the replay throughput'''
+        return dict(vars(self), replay_bytes_per_second=self.replay_throughput())
+
+
+class DiskSpool:  # pylint: disable=R0902
+    '''Sends OTLP requests, requests that can't be sent are spooled to directory and
+    replayed in the background.
+
+    - max_segment_bytes: a segment is closed once it reaches this size
+    - max_bytes: the oldest segments are deleted, and their spans dropped, to keep
+      the spool under this size
+
+    Segment names include the pid of their writer so the workers of a server can
+    share a directory. A segment left by a process that exited is claimed by renaming
+    it after the pid of the process replaying it, so only one worker replays it.
+    The directory must be owned by the current user.'''
+
+    def __init__(self, directory: str, send, max_segment_bytes: int = 8 * 1024 * 1024,
+                 max_bytes: int = 256 * 1024 * 1024):
+        '''constructor'''
+        self.directory = directory
+        self.stats = SpoolStats()
+        self._send = send
+        self._max_segment_bytes = max_segment_bytes
+        self._max_bytes = max_bytes
+        self._closed = False
+        self._pid = None
+        self._reset()
+
+    def _reset(self) -> None:
+        '''Start writing this process' own segments, also runs in forked children'''
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if os.stat(self.directory).st_uid != os.getuid():
+            # segments planted by another user would be replayed with this process' credentials
+            raise PermissionError(f'Spool directory {self.directory} is owned by another user')
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._writer_path = None
+        self._writer_size = 0
+        # replay progress of partly sent segments, guarded by _lock
+        self._replay_offsets = {}
+        # whether batches are spooled and not replayed yet, guarded by _lock. Segments
+        # found at startup may be other workers', the replay thread finds out.
+        self._backlog = bool(glob.glob(os.path.join(self.directory, _SEGMENT_PATTERN)))
+        self._failing = False
+        self._thread = threading.Thread(target=self._replay_loop, name='HypertraceSpoolReplay',
+                                        daemon=True)
+        self._thread.start()
+        if self._backlog:
+            self._wakeup.set()
+
+    def _check_fork(self) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _segments(self, claim: bool = False) -> list:
+        '''Segments of this process oldest first, with claim the segments of exited
+        processes are claimed and included'''
+        segments = []
+        for path in glob.glob(os.path.join(self.directory, _SEGMENT_PATTERN)):
+            try:
+                pid = _segment_pid(path)
+            except ValueError:
+                continue
+            if pid != self._pid:
+                if not claim or _pid_alive(pid):
+                    continue
+                path = _claim(path, self._pid)
+                if path is None:
+                    continue
+            segments.append(path)
+        segments.sort(key=os.path.basename)
+        return segments
+
+    def pending_bytes(self) -> int:
+        '''Size of the spooled batches'''
+        return sum(_size(path) for path in glob.glob(os.path.join(self.directory, _SEGMENT_PATTERN)))
+
+    def submit(self, request: ExportTraceServiceRequest) -> bool:
+        '''Send a request, spool it when the collector is unavailable or batches are
+        already waiting to be replayed'''
+        self._check_fork()
+        with self._lock:
+            backlog = self._backlog
+        if not backlog:
+            try:
+                if self._send(request):
+                    return True
+            except Exception as err:  # pylint: disable=W0703
+                logger.debug('Failed to export, spooling the batch: %s', err)
+        self._append(request.SerializeToString())
+        return False
+
+    def _append(self, payload: bytes) -> None:
+        frame = _FRAME_HEADER.pack(len(payload)) + payload
+        with self._lock:
+            if self._writer is None or self._writer_size >= self._max_segment_bytes:
+                self._roll()
+            self._writer.write(frame)
+            self._writer.flush()
+            self._writer_size += len(frame)
+            self._backlog = True
+            self.stats.spooled_batches += 1
+            self.stats.spooled_bytes += len(frame)
+        self._enforce_max_bytes()
+        if not self._failing:
+            self._wakeup.set()
+
+    def _roll(self) -> None:
+        '''Close the segment being written and open a new one, called with the lock held'''
+        if self._writer is not None:
+            self._writer.close()
+        # names sort in creation order
+        self._writer_path = os.path.join(
+            self.directory, f'segment-{time.time_ns():020d}-{self._pid}.spool')
+        self._writer = open(self._writer_path, 'ab')  # pylint: disable=R1732
+        self._writer_size = 0
+
+    def _close_writer(self) -> None:
+        '''Called with the lock held, the next spooled batch opens a new segment'''
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._writer_path = None
+        self._writer_size = 0
+
+    def _enforce_max_bytes(self) -> None:
+        segments = [(path, _size(path)) for path in self._segments()]
+        total = sum(size for _, size in segments)
+        for path, size in segments:
+            with self._lock:
+                if total <= self._max_bytes or path == self._writer_path:
+                    break
+                offset = self._replay_offsets.pop(path, 0)
+            try:
+                batches = self._count_frames(path, offset)
+                os.unlink(path)
+            except FileNotFoundError:
+                # replayed in the meantime
+                total -= size
+                continue
+            total -= size
+            self.stats.dropped_batches += batches
+            self.stats.dropped_bytes += size - offset
+            logger.warning('Span spool is over %s bytes, dropped %s batches from %s',
+                           self._max_bytes, batches, path)
+
+    @staticmethod
+    def _count_frames(path: str, offset: int = 0) -> int:
+        count = 0
+        with open(path, 'rb') as segment:
+            segment.seek(offset)
+            while True:
+                header = segment.read(_FRAME_HEADER.size)
+                if len(header) < _FRAME_HEADER.size:
+                    return count
+                segment.seek(_FRAME_HEADER.unpack(header)[0], os.SEEK_CUR)
+                count += 1
+
+    def _replay_segment(self, path: str) -> bool:
+        '''Send the batches of a closed segment, returns whether all of them were sent'''
+        with self._lock:
+            if path == self._writer_path:
+                # still being written, it is listed again once closed
+                return False
+            offset = self._replay_offsets.get(path, 0)
+        with open(path, 'rb') as segment:
+            if os.fstat(segment.fileno()).st_size == 0:
+                os.unlink(path)
+                return True
+            with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    while offset + _FRAME_HEADER.size <= len(mapped):
+                        (size,) = _FRAME_HEADER.unpack_from(mapped, offset)
+                        end = offset + _FRAME_HEADER.size + size
+                        if end > len(mapped):
+                            # a frame cut short by a crash
+                            break
+                        try:
+                            request = ExportTraceServiceRequest.FromString(
+                                view[offset + _FRAME_HEADER.size:end])
+                        except DecodeError:
+                            logger.error('Dropping the corrupt end of spool segment %s', path)
+                            self.stats.dropped_bytes += len(mapped) - offset
+                            break
+                        start = time.monotonic()
+                        try:
+                            sent = self._send(request)
+                        except Exception as err:  # pylint: disable=W0703
+                            logger.debug('Failed to replay spooled spans: %s', err)
+                            sent = False
+                        if not sent:
+                            with self._lock:
+                                self._replay_offsets[path] = offset
+                            return False
+                        self.stats.replay_seconds += time.monotonic() - start
+                        self.stats.replayed_batches += 1
+                        self.stats.replayed_bytes += end - offset
+                        offset = end
+                finally:
+                    view.release()
+        with self._lock:
+            self._replay_offsets.pop(path, None)
+        os.unlink(path)
+        return True
+
+    def replay(self) -> bool:
+        '''Replay every spooled batch, returns whether the spool is empty'''
+        self._check_fork()
+        with self._replay_lock:
+            while True:
+                with self._lock:
+                    # batches spooled from now on go to a new segment, which isn't listed
+                    self._close_writer()
+                    segments = self._segments(claim=True)
+                for path in segments:
+                    try:
+                        if not self._replay_segment(path):
+                            return False
+                    except FileNotFoundError:
+                        # dropped by _enforce_max_bytes
+                        with self._lock:
+                            self._replay_offsets.pop(path, None)
+                    except Exception as err:  # pylint: disable=W0703
+                        logger.error('Failed to replay spooled spans from %s: %s', path, err)
+                        return False
+                with self._lock:
+                    if self._writer_path is None:
+                        self._backlog = False
+                        return True
+                # batches were spooled while replaying, they are replayed next
+
+    def _replay_loop(self) -> None:
+        pid = os.getpid()
+        retry = _MIN_RETRY_SECONDS
+        while not self._closed and pid == os.getpid():
+            # wait for spooled batches, or retry with a backoff while the collector is down
+            self._wakeup.wait(retry if self._failing else None)
+            if self._closed:
+                return
+            self._wakeup.clear()
+            replayed = self.stats.replayed_batches
+            if self.replay():
+                self._failing = False
+                retry = _MIN_RETRY_SECONDS
+                if self.stats.replayed_batches != replayed:
+                    logger.info('Replayed spooled spans: %s', self.stats.as_dict())
+            else:
+                self._failing = True
+                retry = min(retry * 2, _MAX_RETRY_SECONDS)
+
+    def close(self) -> None:
+        '''Stop replaying, spooled batches are kept for the next process'''
+        self._closed = True
+        self._wakeup.set()
+        with self._lock:
+            self._close_writer()
+
+
+class SpoolingSpanExporter(SpanExporter):
+    '''Exports span batches through a DiskSpool'''
+
+    def __init__(self, spool: DiskSpool):
+        '''constructor'''
+        self.spool = spool
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        try:
+            self.spool.submit(encode_spans(spans))
+        except Exception as err:  # pylint: disable=W0703
+            logger.error('Failed to export or spool %s spans: %s', len(spans), err)
+            return SpanExportResult.FAILURE
+        # spooled batches are exported later, the batch processor must not retry them
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        self.spool.close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -0,0 +1,103 @@
+'''Record how long the phases of agent startup take, the memory they keep and the
+modules they import.
+
+Enabled with `HT_STARTUP_PROFILE=true`, the report is logged once `instrument()`
+returns. Memory is measured with tracemalloc, which slows startup down while the
+profile is recorded, so it is only meant for investigating cold starts.'''
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from hypertrace.env_var_settings import get_env_value
+
+# Setup logger name
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+_PROFILER = None
+_PROFILER_LOCK = threading.Lock()
+
+
+class StartupProfiler:
+    '''Records nested startup phases, a disabled profiler records nothing'''
+
+    def __init__(self, enabled: bool):
+        '''constructor'''
+        self.enabled = enabled
+        self.phases = []
+        self._depth = 0
+        self._tracing = False
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        '''Record the wall time, memory and imported modules of the enclosed block'''
+        if not self.enabled:
+            yield
+            return
+        if not self._reported and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        record = {'phase': name, 'depth': self._depth}
+        # phases are listed in the order they started
+        self.phases.append(record)
+        modules = len(sys.modules)
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._depth -= 1
+            record['imported_modules'] = len(sys.modules) - modules
+            record['memory_bytes'] = None
+            if memory is not None and tracemalloc.is_tracing():
+                record['memory_bytes'] = tracemalloc.get_traced_memory()[0] - memory
+            if self._reported:
+                # ex: a library instrumented when the app imported it
+                logger.info('Startup phase %s took %.1fms', name, record['seconds'] * 1000)
+
+    def report(self) -> dict:
+        '''The recorded phases and the time spent in top level phases'''
+        report = {
+            'phases': [dict(record) for record in self.phases],
+            'total_seconds': sum(record.get('seconds', 0) for record in self.phases
+                                 if record['depth'] == 0),
+        }
+        if tracemalloc.is_tracing():
+            report['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        return report
+
+    def finish(self) -> None:
+        '''Log the report and stop measuring memory, only the first call reports'''
+        if not self.enabled or self._reported:
+            return
+        report = self.report()
+        self._reported = True
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        lines = [f'Agent startup took {report["total_seconds"] * 1000:.1f}ms']
+        if 'peak_memory_bytes' in report:
+            lines[0] += f', peak traced memory {report["peak_memory_bytes"] / 1024:.0f}KiB'
+        for record in report['phases']:
+            memory = record.get('memory_bytes')
+            lines.append(f'{"  " * (record["depth"] + 1)}{record["phase"]}: '
+                         f'{record.get("seconds", 0) * 1000:.1f}ms, '
+                         f'{"-" if memory is None else f"{memory / 1024:.0f}KiB"}, '
+                         f'{record.get("imported_modules", 0)} modules imported')
+        logger.info('\n'.join(lines))
+
+
+def startup_profiler() -> StartupProfiler:
+    '''The process wide profiler, enabled by HT_STARTUP_PROFILE'''
+    global _PROFILER  # pylint: disable=W0603
+    if _PROFILER is None:
+        with _PROFILER_LOCK:
+            if _PROFILER is None:
+                enabled = (get_env_value('STARTUP_PROFILE') or '').lower() == 'true'
+                _PROFILER = StartupProfiler(enabled)
+    return _PROFILER
@@ -0,0 +1,86 @@
+'''Span attribute compaction test'''
+import json
+
+from opentelemetry.exporter.otlp.proto.common._internal.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from hypertrace.agent.attribute_compaction import AttributeCompactingSpanExporter, \
+    enforce_budget, merge_header_attributes
+
+TRACER = TracerProvider().get_tracer(__name__)
+
+
+class CollectingExporter(SpanExporter):
+    '''Keeps the exported spans'''
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+
+def _span(attributes):
+    span = TRACER.start_span('request', attributes=attributes)
+    span.end()
+    return span
+
+
+def _request_attributes(header_count=60):
+    attributes = {'http.method': 'GET', 'http.url': 'http://localhost/users'}
+    for i in range(header_count):
+        attributes[f'http.request.header.x-custom-header-{i}'] = f'value-{i}'
+        attributes[f'http.response.header.x-custom-header-{i}'] = f'value-{i}'
+    attributes['rpc.request.metadata.authority'] = 'localhost'
+    return attributes
+
+
+def test_merge_header_attributes():
+    '''Headers are merged into one JSON object per prefix, other attributes are kept'''
+    merged = merge_header_attributes({'http.method': 'GET',
+                                      'http.request.header.a': '1',
+                                      'http.request.header.b': '2',
+                                      'http.response.header.c': '3',
+                                      'rpc.request.metadata.d': '4',
+                                      'http.request.body': 'body'})
+    assert merged['http.method'] == 'GET'
+    assert merged['http.request.body'] == 'body'
+    assert json.loads(merged['http.request.headers']) == {'a': '1', 'b': '2'}
+    assert json.loads(merged['http.response.headers']) == {'c': '3'}
+    assert json.loads(merged['rpc.request.metadata']) == {'d': '4'}
+    assert len(merged) == 5
+
+
+def test_enforce_budget_truncates_largest_values_first():
+    '''Small values are kept intact'''
+    attributes = {'http.method': 'GET', 'http.request.body': 'a' * 1000, 'http.response.body': 'b' * 500}
+    budget = enforce_budget(attributes, 700)
+    assert budget['http.method'] == 'GET'
+    assert budget['http.response.body'] == 'b' * 500
+    assert sum(len(key) + len(value) for key, value in budget.items()) == 700
+    assert enforce_budget(attributes, 10000) is attributes
+
+
+def test_exporter_shares_values_across_batch():
+    '''Equal merged header values are a single string in the batch'''
+    collector = CollectingExporter()
+    exporter = AttributeCompactingSpanExporter(collector)
+    exporter.export([_span(_request_attributes()), _span(_request_attributes())])
+    first, second = collector.spans
+    assert first.attributes['http.request.headers'] is second.attributes['http.request.headers']
+    assert 'http.request.header.x-custom-header-0' not in first.attributes
+
+
+def test_compaction_shrinks_otlp_payload():
+    '''Benchmark, compacted spans encode to a smaller OTLP request'''
+    spans = [_span(dict(_request_attributes(), **{'http.request.body': 'x' * 20000}))
+             for _ in range(20)]
+    collector = CollectingExporter()
+    AttributeCompactingSpanExporter(collector, max_span_bytes=8192).export(spans)
+
+    original = len(encode_spans(spans).SerializeToString())
+    compacted = len(encode_spans(collector.spans).SerializeToString())
+    print(f'otlp payload: original {original} bytes, compacted {compacted} bytes')
+    assert compacted < original / 2
+    assert all(len(span.attributes) == 6 for span in collector.spans)
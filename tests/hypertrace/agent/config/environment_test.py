@@ -22,10 +22,36 @@ def test_env_config() -> None:
     os.environ["HT_DATA_CAPTURE_RPC_BODY_REQUEST"] = "False"
     os.environ["HT_DATA_CAPTURE_RPC_BODY_RESPONSE"] = "False"
     os.environ["HT_DATA_CAPTURE_BODY_MAX_SIZE_BYTES"] = "123456"
+    os.environ["HT_DATA_CAPTURE_BODY_MAX_PROCESSING_SIZE_BYTES"] = "234567"
     os.environ["HT_PROPAGATION_FORMATS"] = "B3,TRACECONTEXT"
     os.environ["HT_ENABLED"] = "False"
     os.environ["HT_ENABLE_CONSOLE_SPAN_EXPORTER"] = "True"
     os.environ["HT_RESOURCE_ATTRIBUTES"] = "1=123,b=456,d=89123"
+    os.environ["HT_DATA_CAPTURE_HEADERS_DENY"] = "x-internal,x-other"
+    os.environ["HT_DATA_CAPTURE_HEADERS_REDACT"] = "authorization"
+    os.environ["HT_DATA_CAPTURE_BODY_CONTENT_TYPES"] = "application/json,+json"
+    os.environ["HT_DATA_CAPTURE_BODY_SERIALIZE"] = "true"
+    os.environ["HT_DATA_CAPTURE_REDACT_KEYS"] = "password,token"
+    os.environ["HT_SAMPLING_RATIO"] = "0.25"
+    os.environ["HT_SAMPLING_RATE_LIMIT"] = "100"
+    os.environ["HT_SAMPLING_PARENT_BASED"] = "false"
+    os.environ["HT_SPAN_PROCESSOR_MAX_QUEUE_SIZE"] = "4096"
+    os.environ["HT_SPAN_PROCESSOR_SCHEDULE_DELAY_MILLIS"] = "1000"
+    os.environ["HT_SPAN_PROCESSOR_DROP_POLICY"] = "KEEP_ERRORS"
+    os.environ["HT_ATTRIBUTE_COMPACTION_ENABLED"] = "true"
+    os.environ["HT_ATTRIBUTE_COMPACTION_MAX_SPAN_BYTES"] = "65536"
+    os.environ["HT_REPORTING_CERT_FILE"] = "/etc/ssl/collector.pem"
+    os.environ["HT_EXPORTER_COMPRESSION"] = "GZIP"
+    os.environ["HT_EXPORTER_TIMEOUT"] = "5"
+    os.environ["HT_EXPORTER_HEADERS"] = "x-tenant=a,x-key=b=c"
+    os.environ["HT_FORWARDER_ENABLED"] = "true"
+    os.environ["HT_FORWARDER_SOCKET_PATH"] = "/run/hypertrace.sock"
+    os.environ["HT_SPOOL_ENABLED"] = "true"
+    os.environ["HT_SPOOL_DIRECTORY"] = "/var/spool/hypertrace"
+    os.environ["HT_SPOOL_MAX_BYTES"] = "1048576"
+    os.environ["HT_SPAN_NAMING_TEMPLATE_UNMATCHED_ROUTES"] = "true"
+    os.environ["HT_DATA_CAPTURE_POLICIES"] = '[{"route": "/ingest/*", "request_body": false}]'
+    os.environ["HT_DATA_CAPTURE_REDACT_PATTERNS"] = '["\\\\d{3}-\\\\d{2}-\\\\d{4}", "secret,\\\\w+"]'
     config = load_config_from_env()
     print(config)
     assert config['service_name'] == "pythonagent_002"
@@ -41,6 +67,7 @@ def test_env_config() -> None:
     assert config['data_capture']['rpc_body']['request'] is False
     assert config['data_capture']['rpc_body']['response'] is False
     assert config['data_capture']['body_max_size_bytes'] == 123456
+    assert config['data_capture']['body_max_processing_size_bytes'] == 234567
     assert 'B3' in config['propagation_formats']
     assert 'TRACECONTEXT' in config['propagation_formats']
     assert config['enabled'] is False
@@ -49,6 +76,22 @@ def test_env_config() -> None:
     assert resource_attrs['1'] == '123'
     assert resource_attrs['b'] == '456'
     assert resource_attrs['d'] == '89123'
+    assert config['_header_capture'] == {'deny': ['x-internal', 'x-other'], 'redact': ['authorization']}
+    assert config['_body_capture'] == {'content_types': ['application/json', '+json'], 'serialize': True}
+    assert config['_capture_policies'] == [{'route': '/ingest/*', 'request_body': False}]
+    assert config['_sampling'] == {'ratio': 0.25, 'rate_limit': 100.0, 'parent_based': False}
+    assert config['_span_processor'] == {'max_queue_size': 4096, 'schedule_delay_millis': 1000,
+                                         'drop_policy': 'keep_errors'}
+    assert config['_attribute_compaction'] == {'enabled': True, 'max_span_bytes': 65536}
+    assert config['reporting']['cert_file'] == '/etc/ssl/collector.pem'
+    assert config['_exporter'] == {'compression': 'gzip', 'timeout': 5,
+                                   'headers': {'x-tenant': 'a', 'x-key': 'b=c'}}
+    assert config['_forwarder'] == {'enabled': True, 'socket_path': '/run/hypertrace.sock'}
+    assert config['_spool'] == {'enabled': True, 'directory': '/var/spool/hypertrace',
+                                'max_bytes': 1048576}
+    assert config['_span_naming'] == {'template_unmatched_routes': True}
+    assert config['_redaction'] == {'keys': ['password', 'token'],
+                                    'patterns': [r'\d{3}-\d{2}-\d{4}', r'secret,\w+']}
     unset_env_variables()
 
 
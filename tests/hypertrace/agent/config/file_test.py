@@ -26,6 +26,7 @@ def test_load_from_file() -> None:
     assert not cfg["data_capture"]["rpc_body"]["response"]
     assert not cfg["data_capture"]["rpc_body"]["response"]
     assert cfg["data_capture"]["body_max_size_bytes"] == 123457
+    assert cfg["data_capture"]["body_max_processing_size_bytes"] == 234567
     assert 'B3' in cfg["propagation_formats"]
     assert not cfg["enabled"]
     assert cfg["_use_console_span_exporter"] is True
@@ -0,0 +1,59 @@
+'''Config snapshot test'''
+from unittest import mock
+
+import pytest
+
+from hypertrace.agent import config as agent_config
+from hypertrace.agent.config import AgentConfig, config_snapshot
+
+
+def test_config_is_loaded_once(monkeypatch):
+    monkeypatch.setenv('HT_SERVICE_NAME', 'snapshot-service')
+    first = AgentConfig()
+    with mock.patch.object(agent_config, 'load_config_from_env',
+                           wraps=agent_config.load_config_from_env) as load:
+        second = AgentConfig()
+        assert load.call_count == 0
+        assert second.agent_config.service_name == 'snapshot-service'
+
+        # a changed environment is loaded again
+        monkeypatch.setenv('HT_SERVICE_NAME', 'renamed-service')
+        third = AgentConfig()
+        assert load.call_count == 1
+        assert third.agent_config.service_name == 'renamed-service'
+    assert first.custom_config == second.custom_config
+
+
+def test_snapshot_is_read_only(monkeypatch):
+    monkeypatch.setenv('HT_SAMPLING_RATIO', '0.5')
+    snapshot = config_snapshot()
+    with pytest.raises(TypeError):
+        snapshot.config_dict['service_name'] = 'changed'
+    with pytest.raises(TypeError):
+        snapshot.custom_config['_sampling']['ratio'] = 1.0
+
+    # each AgentConfig gets its own copy to edit
+    config = AgentConfig()
+    config.custom_config['_sampling']['ratio'] = 0.1
+    assert AgentConfig().sampling()['ratio'] == 0.5
+
+
+def test_agent_configs_are_independent(monkeypatch):
+    monkeypatch.setenv('HT_SERVICE_NAME', 'independent-service')
+    first = AgentConfig()
+    second = AgentConfig()
+    assert first.agent_config is not second.agent_config
+    assert first.agent_config.data_capture is not second.agent_config.data_capture
+
+    first.agent_config.service_name = 'edited'
+    first.agent_config.reporting.endpoint = 'http://edited:4318/v1/traces'
+    first.agent_config.data_capture.body_max_size_bytes = 1
+    first.agent_config.data_capture.http_body.request.value = False
+    assert second.agent_config.service_name == 'independent-service'
+    assert second.agent_config.reporting.endpoint != 'http://edited:4318/v1/traces'
+    assert second.agent_config.data_capture.body_max_size_bytes != 1
+    assert second.agent_config.data_capture.http_body.request.value
+
+    # a config created later doesn't reset the edits either
+    AgentConfig()
+    assert first.agent_config.service_name == 'edited'
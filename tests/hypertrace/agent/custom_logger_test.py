@@ -0,0 +1,101 @@
+'''Unittests for the agent logger facade'''
+import logging
+
+from hypertrace.agent import custom_logger
+from hypertrace.agent.config import AgentConfig
+
+
+class RecordingHandler(logging.Handler):
+    '''Keeps the records that reach it'''
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_log_methods_are_the_logger_methods():
+    '''Log methods are bound from the wrapped logger, anything else is delegated'''
+    logger = custom_logger.get_agent_logger('ht.test.facade')
+    stdlib_logger = logging.getLogger('ht.test.facade')
+    assert logger.debug == stdlib_logger.debug
+    assert logger.error == stdlib_logger.error
+    assert logger.name == 'ht.test.facade'
+
+
+def test_disabled_debug_logs_nothing():
+    '''With DEBUG off the guard is False and no record reaches a handler'''
+    stdlib_logger = logging.getLogger('ht.test.disabled')
+    stdlib_logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    stdlib_logger.addHandler(handler)
+    try:
+        logger = custom_logger.get_agent_logger('ht.test.disabled')
+        assert not logger.debug_enabled
+        logger.debug('Processing request body %s', 'x')
+        logger.info('served')
+        assert [record.getMessage() for record in handler.records] == ['served']
+    finally:
+        stdlib_logger.removeHandler(handler)
+
+
+def test_stdlib_level_changes_apply():
+    '''Levels changed through logging after the facade was created apply right away'''
+    stdlib_logger = logging.getLogger('ht.test.stdlib')
+    stdlib_logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    stdlib_logger.addHandler(handler)
+    try:
+        logger = custom_logger.get_agent_logger('ht.test.stdlib.child')
+        assert not logger.debug_enabled
+
+        stdlib_logger.setLevel(logging.DEBUG)
+        assert logger.debug_enabled
+        logger.debug('enabled')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            assert not logger.isEnabledFor(logging.ERROR)
+            logger.error('disabled')
+        finally:
+            logging.disable(logging.NOTSET)
+        assert [record.getMessage() for record in handler.records] == ['enabled']
+    finally:
+        stdlib_logger.removeHandler(handler)
+
+
+def test_refresh_log_level_from_env(monkeypatch):
+    '''A changed HT_LOG_LEVEL is applied to configured loggers and facades'''
+    name = 'ht.test.env'
+    monkeypatch.setenv('HT_LOG_LEVEL', 'ERROR')
+    configured = custom_logger.get_custom_logger(name)
+    logger = custom_logger.get_agent_logger(f'{name}.child')
+    try:
+        assert not logger.isEnabledFor(logging.WARNING)
+        assert not custom_logger.refresh_log_level()
+
+        monkeypatch.setenv('HT_LOG_LEVEL', 'DEBUG')
+        assert custom_logger.refresh_log_level()
+        assert configured.level == logging.DEBUG
+        assert logger.debug_enabled
+    finally:
+        custom_logger._configured_loggers.discard(name)  # pylint:disable=W0212
+        configured.handlers.clear()
+
+
+def test_config_reload_applies_log_level(monkeypatch):
+    '''A config reload picks up a changed HT_LOG_LEVEL'''
+    name = 'ht.test.reload'
+    monkeypatch.setenv('HT_LOG_LEVEL', 'INFO')
+    configured = custom_logger.get_custom_logger(name)
+    logger = custom_logger.get_agent_logger(f'{name}.child')
+    try:
+        assert not logger.debug_enabled
+        monkeypatch.setenv('HT_LOG_LEVEL', 'DEBUG')
+        AgentConfig()
+        assert configured.level == logging.DEBUG
+        assert logger.debug_enabled
+    finally:
+        custom_logger._configured_loggers.discard(name)  # pylint:disable=W0212
+        configured.handlers.clear()
@@ -27,6 +27,29 @@ def test_apply_filter_with_values_can_return_true():
     assert registry.apply_filters(NonRecordingSpan(None), 'a_url', {'key': 'v'}, 'body_data', TYPE_HTTP)
     registry.filters = []
 
+class RecordingBodyFilter(Filter):
+    '''Example of a filter that keeps the body it was asked to evaluate'''
+    bodies = []
+
+    def evaluate_url_and_headers(self, span: Span, url: str, headers: dict, request_type) -> bool:
+        return False
+
+    def evaluate_body(self, span: Span, body, headers: dict, request_type) -> bool:
+        RecordingBodyFilter.bodies.append(body)
+        return False
+
+def test_apply_filter_body_is_limited_to_max_processing_size():
+    '''Assert that filters never see more than body_max_processing_size bytes'''
+    registry = Registry()
+    registry.register(RecordingBodyFilter)
+    registry.set_body_max_processing_size(4)
+    registry.apply_filters(NonRecordingSpan(None), 'a_url', {}, b'0123456789', TYPE_HTTP)
+    registry.apply_filters(NonRecordingSpan(None), 'a_url', {}, '0123456789', TYPE_HTTP)
+    registry.set_body_max_processing_size(0)
+    registry.apply_filters(NonRecordingSpan(None), 'a_url', {}, b'0123456789', TYPE_HTTP)
+    assert RecordingBodyFilter.bodies == [b'0123', '0123', b'0123456789']
+    registry.filters = []
+
 def test_apply_filter_returns_false_by_default():
     '''Assert that apply_filters will return false by default'''
     registry = Registry()
@@ -0,0 +1,212 @@
+'''Span forwarder test'''
+import gzip
+import http.server
+import os
+import stat
+import threading
+import time
+
+import grpc
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from hypertrace.agent.forwarder import SpanForwarder, UnixSocketSpanExporter, \
+    grpc_compression, start_forwarder_process
+
+
+def _spans(worker, count):
+    tracer = TracerProvider(resource=Resource.create({'service.instance.id': worker})) \
+        .get_tracer(__name__)
+    spans = []
+    for i in range(count):
+        span = tracer.start_span(f'{worker}-{i}')
+        span.end()
+        spans.append(span)
+    return spans
+
+
+def _span_names(request):
+    return sorted(span.name for resource_spans in request.resource_spans
+                  for scope_spans in resource_spans.scope_spans
+                  for span in scope_spans.spans)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_forwarder_merges_worker_batches(tmp_path):
+    '''Batches written by several workers are exported as one request'''
+    exported = []
+    forwarder = SpanForwarder(str(tmp_path / 'forwarder.sock'), exported.append,
+                              max_batch_spans=1000, schedule_delay_millis=60000)
+    forwarder.start()
+    try:
+        workers = [UnixSocketSpanExporter(forwarder.socket_path) for _ in range(3)]
+        threads = [threading.Thread(target=lambda w=worker, n=i: [w.export(_spans(f'worker{n}', 10))
+                                                                for _ in range(2)])
+                   for i, worker in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert _wait_for(lambda: forwarder._pending_spans == 60)  # pylint:disable=W0212
+        forwarder.flush()
+        for worker in workers:
+            worker.shutdown()
+    finally:
+        forwarder.close()
+
+    assert len(exported) == 1
+    assert len(_span_names(exported[0])) == 60
+    assert not os.path.exists(forwarder.socket_path)
+
+
+def test_forwarder_exports_full_batches_early(tmp_path):
+    '''A full batch doesn't wait for the schedule delay'''
+    exported = []
+    forwarder = SpanForwarder(str(tmp_path / 'forwarder.sock'), exported.append,
+                              max_batch_spans=10, schedule_delay_millis=60000)
+    forwarder.start()
+    try:
+        UnixSocketSpanExporter(forwarder.socket_path).export(_spans('worker', 10))
+        assert _wait_for(lambda: exported)
+    finally:
+        forwarder.close()
+
+
+def test_exporter_reconnects_after_forwarder_restart(tmp_path):
+    '''The worker connection is reopened when the forwarder comes back'''
+    path = str(tmp_path / 'forwarder.sock')
+    exporter = UnixSocketSpanExporter(path, timeout=1)
+    assert exporter.export(_spans('worker', 1)) is SpanExportResult.FAILURE
+
+    for _ in range(2):
+        exported = []
+        forwarder = SpanForwarder(path, exported.append, max_batch_spans=1)
+        forwarder.start()
+        try:
+            assert exporter.export(_spans('worker', 1)) is SpanExportResult.SUCCESS
+            assert _wait_for(lambda: exported)
+        finally:
+            forwarder.close()
+    exporter.shutdown()
+
+
+class StandInCollector(http.server.BaseHTTPRequestHandler):
+    '''Decodes the OTLP/HTTP requests it receives'''
+    requests = []
+
+    def do_POST(self):  # pylint:disable=C0103
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        self.requests.append((self.headers.get('authorization'), ExportTraceServiceRequest.FromString(body)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint:disable=W0221
+        pass
+
+
+def test_forwarder_process_exports_to_collector(tmp_path):
+    '''The forwarder process exports the spans of its workers and flushes on exit'''
+    StandInCollector.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInCollector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = str(tmp_path / 'forwarder.sock')
+    process = start_forwarder_process({
+        'socket_path': path,
+        'reporter': 'otlp_http',
+        'endpoint': f'http://127.0.0.1:{server.server_address[1]}/v1/traces',
+        'headers': {'authorization': 'Bearer secret'},
+        'compression': 'gzip',
+        'schedule_delay_millis': 60000,
+    })
+    try:
+        assert os.path.exists(path)
+        for worker in ('worker1', 'worker2'):
+            exporter = UnixSocketSpanExporter(path)
+            assert exporter.export(_spans(worker, 5)) is SpanExportResult.SUCCESS
+            exporter.shutdown()
+        time.sleep(0.2)
+        process.terminate()
+        assert process.wait(10) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+        server.shutdown()
+        server.server_close()
+
+    assert len(StandInCollector.requests) == 1
+    authorization, request = StandInCollector.requests[0]
+    assert authorization == 'Bearer secret'
+    assert len(_span_names(request)) == 10
+    assert len(request.resource_spans) == 2
+
+
+def test_agent_starts_one_forwarder(agent, tmp_path):
+    '''Exporters created after the first one reuse the running forwarder'''
+    from hypertrace.agent.config import config_pb2  # pylint:disable=C0415
+    path = str(tmp_path / 'agent.sock')
+    agent._config.custom_config['_forwarder'] = {'enabled': True, 'socket_path': path}  # pylint:disable=W0212
+    init = agent._init  # pylint:disable=W0212
+    try:
+        first = init._init_forwarder_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+        process = init._forwarder  # pylint:disable=W0212
+        second = init._init_forwarder_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+        assert isinstance(first, UnixSocketSpanExporter) and isinstance(second, UnixSocketSpanExporter)
+        assert init._forwarder is process  # pylint:disable=W0212
+        assert os.path.exists(path)
+    finally:
+        init._forwarder.terminate()  # pylint:disable=W0212
+        init._forwarder.wait(10)  # pylint:disable=W0212
+
+
+def test_agent_restarts_forwarder_on_option_change(agent, tmp_path):
+    '''A forwarder started with other options is replaced, the private directory
+    of a default socket path is removed with it'''
+    from hypertrace.agent.config import config_pb2  # pylint:disable=C0415
+    agent._config.custom_config['_forwarder'] = {'enabled': True}  # pylint:disable=W0212
+    init = agent._init  # pylint:disable=W0212
+    try:
+        init._init_forwarder_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+        first, first_path = init._forwarder, init._forwarder_socket_path  # pylint:disable=W0212
+        assert stat.S_IMODE(os.stat(os.path.dirname(first_path)).st_mode) == 0o700
+
+        path = str(tmp_path / 'agent.sock')
+        agent._config.custom_config['_forwarder']['socket_path'] = path  # pylint:disable=W0212
+        init._init_forwarder_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+        assert init._forwarder is not first  # pylint:disable=W0212
+        assert first.poll() is not None
+        assert not os.path.exists(os.path.dirname(first_path))
+        assert os.path.exists(path)
+
+        second = init._forwarder  # pylint:disable=W0212
+        agent._config.custom_config['_span_processor'] = {'schedule_delay_millis': 100}  # pylint:disable=W0212
+        init._init_forwarder_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+        assert init._forwarder is not second  # pylint:disable=W0212
+        assert second.poll() is not None
+    finally:
+        init._stop_forwarder()  # pylint:disable=W0212
+
+
+def test_forwarder_socket_is_owner_only(tmp_path):
+    forwarder = SpanForwarder(str(tmp_path / 'forwarder.sock'), lambda request: None)
+    forwarder.start()
+    try:
+        assert stat.S_IMODE(os.stat(forwarder.socket_path).st_mode) == 0o600
+    finally:
+        forwarder.close()
+
+
+def test_grpc_compression_names():
+    assert grpc_compression(None) is None
+    assert grpc_compression(' GZIP ') is grpc.Compression.Gzip
+    assert grpc_compression('brotli') is grpc.Compression.NoCompression
@@ -23,3 +23,38 @@ def test_zipkin_exporter_can_init(agent):
     #exporter.shutdown()
     # assert isinstance(exporter, ZipkinExporter)
 
+
+def test_body_max_processing_size_is_applied(agent):
+    from hypertrace.agent.filter.registry import Registry
+    from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+    agent._config.agent_config.data_capture.body_max_processing_size_bytes = 2048
+    agent._init.init_filters()
+    wrapper = BaseInstrumentorWrapper()
+    agent._init._set_wrapper_fields(wrapper)
+    assert Registry().body_max_processing_size == 2048
+    assert wrapper._max_body_processing_size == 2048
+    Registry().set_body_max_processing_size(0)
+
+
+def test_apply_config_only_rebuilds_changed_components(agent):
+    from unittest import mock
+    init = agent._init
+    with mock.patch.object(init, 'init_propagation', wraps=init.init_propagation) as propagation, \
+            mock.patch.object(init, 'init_filters', wraps=init.init_filters) as filters, \
+            mock.patch.object(init, 'set_console_span_processor',
+                              wraps=init.set_console_span_processor) as console:
+        agent.instrument()
+        agent.instrument()
+        assert (propagation.call_count, filters.call_count, console.call_count) == (1, 1, 1)
+        assert len(init._span_processor.processors) == 1
+
+        service_name = agent._config.agent_config.service_name
+        with agent.edit_config() as config:
+            config.service_name = 'renamed-service'
+        try:
+            agent.instrument()
+        finally:
+            agent._config.agent_config.service_name = service_name
+        assert (propagation.call_count, filters.call_count, console.call_count) == (1, 1, 2)
+        assert len(init._span_processor.processors) == 1
+    init._span_processor.replace([])
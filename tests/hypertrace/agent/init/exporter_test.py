@@ -0,0 +1,141 @@
+"""Exporter config test against a local mock collector"""
+import http.server
+import threading
+from concurrent import futures
+from unittest import mock
+
+import grpc
+import pytest
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2, trace_service_pb2_grpc
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from hypertrace.agent.config import config_pb2
+
+TRACER = TracerProvider().get_tracer(__name__)
+
+
+def _spans(count=50):
+    spans = []
+    for i in range(count):
+        span = TRACER.start_span('GET /users', attributes={
+            'http.method': 'GET',
+            'http.url': f'http://localhost/users/{i}',
+            'http.request.header.user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
+            'http.response.body': '{"users": [{"name": "user", "email": "user@example.com"}]}' * 10})
+        span.end()
+        spans.append(span)
+    return spans
+
+
+class MockCollector(http.server.BaseHTTPRequestHandler):
+    '''Records the OTLP/HTTP requests it receives'''
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_POST(self):  # pylint:disable=C0103
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.requests.append({'bytes': len(body),
+                              'content-encoding': self.headers.get('Content-Encoding'),
+                              'authorization': self.headers.get('authorization'),
+                              'x-tenant': self.headers.get('x-tenant'),
+                              'client': self.client_address})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-protobuf')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint:disable=W0221
+        pass
+
+
+@pytest.fixture
+def collector():
+    MockCollector.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MockCollector)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/v1/traces'
+    server.shutdown()
+    server.server_close()
+
+
+def _http_exporter(agent, endpoint, compression):
+    agent._config.agent_config.reporting.endpoint = endpoint
+    agent._config.agent_config.reporting.token = 'secret'
+    agent._config.custom_config['_exporter'] = {'compression': compression,
+                                                'headers': {'x-tenant': 'tenant-1'}}
+    return agent._init._init_exporter(config_pb2.TraceReporterType.OTLP_HTTP)
+
+
+def test_otlp_http_compression_and_connection_reuse(agent, collector):
+    '''gzip shrinks the bytes on the wire, every export reuses one connection'''
+    sent = {}
+    for compression in ('none', 'gzip'):
+        MockCollector.requests = []
+        exporter = _http_exporter(agent, collector, compression)
+        for _ in range(3):
+            assert exporter.export(_spans()) is SpanExportResult.SUCCESS
+        exporter.shutdown()
+
+        assert len(MockCollector.requests) == 3
+        assert len({request['client'] for request in MockCollector.requests}) == 1
+        request = MockCollector.requests[0]
+        assert request['authorization'] == 'Bearer secret'
+        assert request['x-tenant'] == 'tenant-1'
+        assert request['content-encoding'] == (None if compression == 'none' else 'gzip')
+        sent[compression] = request['bytes']
+
+    print(f"otlp/http bytes per export: uncompressed {sent['none']}, gzip {sent['gzip']}")
+    assert sent['gzip'] < sent['none'] / 5
+
+
+class MockTraceService(trace_service_pb2_grpc.TraceServiceServicer):
+    '''Records the metadata of OTLP/gRPC exports'''
+    def __init__(self):
+        self.metadata = []
+
+    def Export(self, request, context):  # pylint:disable=C0103,W0613
+        self.metadata.append(dict(context.invocation_metadata()))
+        return trace_service_pb2.ExportTraceServiceResponse()
+
+
+def test_otlp_grpc_token_and_compression(agent):
+    '''The token is sent as metadata of gzip compressed exports'''
+    service = MockTraceService()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    trace_service_pb2_grpc.add_TraceServiceServicer_to_server(service, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    try:
+        agent._config.agent_config.reporting.endpoint = f'127.0.0.1:{port}'
+        agent._config.agent_config.reporting.secure = False
+        agent._config.agent_config.reporting.token = 'secret'
+        agent._config.custom_config['_exporter'] = {'compression': 'gzip', 'timeout': 5}
+        with mock.patch('opentelemetry.exporter.otlp.proto.grpc.exporter.insecure_channel',
+                        wraps=grpc.insecure_channel) as channel:
+            exporter = agent._init._init_exporter(config_pb2.TraceReporterType.OTLP)
+        assert channel.call_args.kwargs['compression'] is grpc.Compression.Gzip
+        assert exporter.export(_spans(5)) is SpanExportResult.SUCCESS
+        exporter.shutdown()
+    finally:
+        server.stop(None)
+    assert service.metadata[0]['authorization'] == 'Bearer secret'
+
+
+@pytest.mark.parametrize('compression, expected', [
+    ('GZIP', grpc.Compression.Gzip),
+    (' Deflate ', grpc.Compression.Deflate),
+    ('brotli', grpc.Compression.NoCompression),
+])
+def test_otlp_grpc_compression_values(agent, compression, expected):
+    '''Compression is case insensitive, an unknown value exports uncompressed'''
+    agent._config.agent_config.reporting.endpoint = '127.0.0.1:1'
+    agent._config.agent_config.reporting.secure = False
+    agent._config.custom_config['_exporter'] = {'compression': compression}
+    with mock.patch('opentelemetry.exporter.otlp.proto.grpc.exporter.insecure_channel',
+                    wraps=grpc.insecure_channel) as channel:
+        exporter = agent._init._init_exporter(config_pb2.TraceReporterType.OTLP)
+    assert exporter is not None
+    assert channel.call_args.kwargs['compression'] is expected
+    exporter.shutdown()
@@ -0,0 +1,87 @@
+'''Forked workers get their own export pipeline'''
+import json
+import os
+from unittest import mock
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from hypertrace.agent.span_processor import BoundedBatchSpanProcessor
+
+WORKERS = 4
+
+
+class PipeExporter(SpanExporter):
+    '''Writes the exported span names, with the pid of the process that created the exporter'''
+
+    def __init__(self, fd):
+        self._fd = fd
+        self._created_by = os.getpid()
+
+    def export(self, spans):
+        for span in spans:
+            _write(self._fd, {'exported': span.name, 'created_by': self._created_by})
+        return SpanExportResult.SUCCESS
+
+
+def _write(fd, message):
+    # below PIPE_BUF, writes from the workers don't interleave
+    os.write(fd, (json.dumps(message) + '\n').encode())
+
+
+def _worker(init, inherited, index, fd):
+    # the gunicorn post_fork hook runs after the at fork handler
+    init.post_fork()
+    processors = init._span_processor.processors  # pylint:disable=W0212
+    with trace.get_tracer(__name__).start_as_current_span(f'worker-{index}'):
+        pass
+    init._span_processor.force_flush()  # pylint:disable=W0212
+    _write(fd, {'worker': index,
+                'pid': os.getpid(),
+                'processors': len(processors),
+                'batch': isinstance(processors[0], BoundedBatchSpanProcessor),
+                'inherited': processors[0] is inherited,
+                'alive': processors[0].worker_thread.is_alive(),
+                'inherited_done': inherited.done})
+
+
+def test_forked_workers_have_one_live_pipeline(agent):
+    init = agent._init  # pylint:disable=W0212
+    agent._config.custom_config['_use_console_span_exporter'] = False
+    read_fd, write_fd = os.pipe()
+    with mock.patch.object(init, '_init_exporter', side_effect=lambda _: PipeExporter(write_fd)):
+        init.apply_config(None)
+        # applying the config again replaces the pipeline
+        init.apply_config(None)
+        assert len(init._span_processor.processors) == 1  # pylint:disable=W0212
+        inherited = init._span_processor.processors[0]  # pylint:disable=W0212
+
+        pids = []
+        for index in range(WORKERS):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    _worker(init, inherited, index, write_fd)
+                finally:
+                    os._exit(0)  # pylint:disable=W0212
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as messages:
+        messages = [json.loads(line) for line in messages]
+    init._span_processor.replace([])  # pylint:disable=W0212
+
+    reports = {message['worker']: message for message in messages if 'worker' in message}
+    exported = [message for message in messages if 'exported' in message]
+    assert sorted(reports) == list(range(WORKERS))
+    for index, report in reports.items():
+        assert report['processors'] == 1
+        assert report['batch']
+        assert not report['inherited']
+        assert report['alive']
+        assert report['inherited_done']
+        # exported exactly once, by the exporter the worker created
+        assert [message['created_by'] for message in exported
+                if message['exported'] == f'worker-{index}'] == [report['pid']]
@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+from pytest_django.lazy_django import skip_if_no_django
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.trace import Span
+
+from hypertrace.agent.filter import Filter
+from hypertrace.agent.filter.registry import Registry
+from tests.hypertrace.agent.instrumentation.django.testapp.wsgi import TEST_AGENT_INSTANCE
+
+memoryExporter = InMemorySpanExporter()
+TEST_AGENT_INSTANCE.register_processor(SimpleSpanProcessor(memoryExporter))
+
+UPLOAD_SIZE = 8 * 1024 * 1024
+
+
+class RecordingFilter(Filter):
+    bodies = []
+
+    def evaluate_url_and_headers(self, span: Span, url: str, headers: dict, request_type) -> bool:
+        return False
+
+    def evaluate_body(self, span: Span, body, headers: dict, request_type) -> bool:
+        RecordingFilter.bodies.append(body)
+        return False
+
+
+@pytest.fixture()
+def django_client() -> "django.test.client.Client":
+    """A Django test client instance."""
+    skip_if_no_django()
+
+    from django.test.client import Client
+
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def clear_instance():
+    memoryExporter.clear()
+    yield
+    memoryExporter.clear()
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.hypertrace.agent.instrumentation.django.testapp.settings')
+
+
+def _upload(django_client):
+    upload_file = io.BytesIO(b'a' * UPLOAD_SIZE)
+    upload_file.name = 'upload.bin'
+    response = django_client.post('/upload', data={'name': 'upload', 'file': upload_file})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_multipart_upload_is_not_buffered(django_client):
+    # multipart bodies aren't eligible for capture, the body isn't touched
+    assert _upload(django_client) == {'name': 'upload', 'size': UPLOAD_SIZE, 'body_read': False}
+    attrs = memoryExporter.get_finished_spans()[0].attributes
+    assert 'http.request.body' not in attrs
+
+
+def test_multipart_upload_with_filters(django_client):
+    Registry().register(RecordingFilter)
+    try:
+        # filters get a bounded prefix, the app still parses the whole upload
+        assert _upload(django_client) == {'name': 'upload', 'size': UPLOAD_SIZE, 'body_read': False}
+    finally:
+        Registry().filters = []
+        bodies, RecordingFilter.bodies = RecordingFilter.bodies, []
+    assert len(bodies) == 1
+    assert bodies[0].startswith(b'--')
+    assert len(bodies[0]) <= Registry().body_max_processing_size < UPLOAD_SIZE
+
+
+def test_streaming_response(django_client):
+    response = django_client.get('/stream/200')
+    assert response.status_code == 200
+    # the span ends once the streamed body was sent
+    assert not memoryExporter.get_finished_spans()
+    content = b''.join(response.streaming_content)
+    assert content.endswith(b'"]}')
+
+    span_list = memoryExporter.get_finished_spans()
+    assert len(span_list) == 1
+    attrs = span_list[0].attributes
+    assert attrs['http.response.header.content-type'] == 'application/json'
+    body = attrs['http.response.body']
+    assert body.startswith('{"chunks": ["aaa')
+    assert len(body) < len(content)
@@ -20,5 +20,7 @@ from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('test/<int:id>', views.path_variable)
+    path('test/<int:id>', views.path_variable),
+    path('upload', views.upload),
+    path('stream/<int:chunks>', views.stream)
 ]
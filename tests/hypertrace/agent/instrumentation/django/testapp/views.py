@@ -1,4 +1,19 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 
 def path_variable(request, id):
-    return JsonResponse({"data": id})
\ No newline at end of file
+    return JsonResponse({"data": id})
+
+def upload(request):
+    upload_file = request.FILES['file']
+    size = sum(len(chunk) for chunk in upload_file.chunks())
+    # request.body buffers the whole upload, it must not have been read
+    return JsonResponse({"name": request.POST['name'], "size": size,
+                         "body_read": hasattr(request, '_body')})
+
+def stream(request, chunks):
+    def generate():
+        yield b'{"chunks": ['
+        for index in range(chunks):
+            yield b'"' + b'a' * 1024 + b'"' + (b',' if index < chunks - 1 else b'')
+        yield b']}'
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -0,0 +1,26 @@
+'''Flask apps created after auto instrumentation share the agent config'''
+from unittest import mock
+
+import flask
+
+from hypertrace.agent.instrumentation import flask as flask_instrumentation
+
+
+def test_apps_share_agent_config(agent):
+    with agent.edit_config() as config:
+        body_max_size_bytes = config.data_capture.body_max_size_bytes
+        config.data_capture.body_max_size_bytes = 64
+    original_flask = flask.Flask
+    wrapper = flask_instrumentation.FlaskInstrumentorWrapper()
+    try:
+        agent.register_library('flask', wrapper)
+        assert flask.Flask is flask_instrumentation._HypertraceInstrumentedFlask
+
+        with mock.patch.object(flask_instrumentation, 'AgentConfig') as agent_config:
+            apps = [flask.Flask(f'app{i}') for i in range(3)]
+        agent_config.assert_not_called()
+        assert [app._max_body_size for app in apps] == [64, 64, 64]
+    finally:
+        agent._config.agent_config.data_capture.body_max_size_bytes = body_max_size_bytes
+        wrapper.uninstrument()
+        flask.Flask = original_flask
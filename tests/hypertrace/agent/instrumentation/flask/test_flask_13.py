@@ -0,0 +1,67 @@
+'''Large uploads are not buffered by the agent'''
+import io
+import tracemalloc
+
+import flask
+
+BODY_SIZE = 32 * 1024 * 1024
+
+
+class UploadStream(io.RawIOBase):
+    '''A request body of `size` bytes that is never held in memory'''
+
+    def __init__(self, size):
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        # the test client seeks to the end to measure the body
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = base + offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        count = max(min(len(buffer), self._size - self._position), 0)
+        if count:
+            start = b'{' if self._position == 0 else b'a'
+            buffer[:count] = start + b'a' * (count - 1)
+        self._position += count
+        return count
+
+
+def test_streaming_upload_is_not_buffered(agent, exporter):
+    app = flask.Flask(__name__)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        total = 0
+        for chunk in iter(lambda: flask.request.stream.read(64 * 1024), b''):
+            total += len(chunk)
+        return {'received': total}
+
+    agent.instrument(app)
+
+    tracemalloc.start()
+    try:
+        response = app.test_client().post('/upload',
+                                          input_stream=UploadStream(BODY_SIZE),
+                                          content_type='application/json')
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert response.json == {'received': BODY_SIZE}
+    assert peak < 4 * 1024 * 1024
+    span = exporter.get_finished_spans()[0]
+    body = span.attributes['http.request.body']
+    assert len(body) == agent._config.agent_config.data_capture.body_max_size_bytes
+    assert body.startswith('{a')
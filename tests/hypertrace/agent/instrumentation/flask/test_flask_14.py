@@ -0,0 +1,66 @@
+'''Streamed and passthrough response bodies are captured as they are sent'''
+import json
+
+import flask
+
+CHUNK_SIZE = 64 * 1024
+CHUNK_COUNT = 16
+
+
+def test_streamed_response_is_captured_while_sent(agent, exporter):
+    app = flask.Flask(__name__)
+    finished_while_streaming = []
+
+    @app.route('/stream')
+    def stream():
+        def generate():
+            yield '{"chunk": 0'
+            for _ in range(CHUNK_COUNT):
+                finished_while_streaming.append(len(exporter.get_finished_spans()))
+                yield 'a' * CHUNK_SIZE
+            yield '}'
+        return flask.Response(generate(), mimetype='application/json')
+
+    agent.instrument(app)
+
+    response = app.test_client().get('/stream', buffered=False)
+    # the view returned, the body has not been sent yet
+    assert not exporter.get_finished_spans()
+
+    chunks = iter(response.response)
+    first_chunk = next(chunks)
+    assert first_chunk == b'{"chunk": 0'
+    assert not exporter.get_finished_spans()
+
+    received = len(first_chunk) + sum(len(chunk) for chunk in chunks)
+    response.close()
+
+    assert received == CHUNK_COUNT * CHUNK_SIZE + len('{"chunk": 0}')
+    assert finished_while_streaming == [0] * CHUNK_COUNT
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 1
+    body = spans[0].attributes['http.response.body']
+    assert len(body) == agent._config.agent_config.data_capture.body_max_size_bytes
+    assert body.startswith('{"chunk": 0aaa')
+    assert spans[0].attributes['http.status_code'] == 200
+
+
+def test_passthrough_response_is_captured(agent, exporter, tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps({'file': 'content'}))
+    app = flask.Flask(__name__)
+
+    @app.route('/file')
+    def send():
+        return flask.send_file(path, mimetype='application/json')
+
+    agent.instrument(app)
+
+    with app.test_client() as client:
+        response = client.get('/file')
+        assert response.json == {'file': 'content'}
+        response.close()
+
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 1
+    assert spans[0].attributes['http.response.body'] == '{"file": "content"}'
@@ -0,0 +1,44 @@
+'''Flask span names are computed per route, unmatched requests can be templated'''
+import flask
+
+from hypertrace.agent.instrumentation import flask as flask_instrumentation
+
+
+def test_span_names(agent, exporter):
+    app = flask.Flask(__name__)
+
+    @app.route('/users/<int:user_id>')
+    def user(user_id):
+        return {'user': user_id}
+
+    wrapper = flask_instrumentation.FlaskInstrumentorWrapper()
+    wrapper.with_app(app)
+    agent.register_library('flask', wrapper)
+    with app.test_client() as client:
+        assert client.get('/users/1').status_code == 200
+        assert client.get('/missing/42/item').status_code == 404
+        wrapper.set_unmatched_route_templating(True)
+        assert client.get('/missing/43/item').status_code == 404
+        assert client.get('/users/2').status_code == 200
+
+    assert [span.name for span in exporter.get_finished_spans()] == \
+           ['GET /users/<int:user_id>', 'GET None', 'GET /missing/{id}/item', 'GET /users/<int:user_id>']
+
+
+def test_names_precomputed_at_registration(agent):
+    original_flask = flask.Flask
+    wrapper = flask_instrumentation.FlaskInstrumentorWrapper()
+    try:
+        agent.register_library('flask', wrapper)
+        app = flask.Flask(__name__)
+
+        @app.route('/items', methods=['POST'])
+        def items():
+            return {}
+
+        names = app._span_names._names  # pylint:disable=W0212
+        assert names[('POST', '/items')] == 'POST /items'
+        assert ('GET', '/static/<path:filename>') in names
+    finally:
+        wrapper.uninstrument()
+        flask.Flask = original_flask
@@ -0,0 +1,212 @@
+'''Unittests for bounded body capture'''
+import io
+import itertools
+import tracemalloc
+
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.sdk.trace import TracerProvider
+
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.body_capture import BodyCapture, CapturingIterable, \
+    ReplayableInput, capture_body, tee_wsgi_input
+
+
+class EndlessStream(io.RawIOBase):
+    '''A file-like object that produces `size` bytes without ever holding them in memory'''
+
+    def __init__(self, size):
+        self._remaining = size
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining)
+        buffer[:count] = b'a' * count
+        self._remaining -= count
+        self.bytes_read += count
+        return count
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_capture_body_types():
+    '''All supported body types produce the same capped value'''
+    expected = 'abcde'
+    assert capture_body(b'abcdefgh', 5) == expected
+    assert capture_body(bytearray(b'abcdefgh'), 5) == expected
+    assert capture_body(memoryview(b'abcdefgh'), 5) == expected
+    assert capture_body('abcdefgh', 5) == expected
+    assert capture_body(io.BytesIO(b'abcdefgh'), 5) == expected
+    assert capture_body(iter([b'ab', b'cd', b'efgh']), 5) == expected
+    assert capture_body([b'ab', 'cd', b'efgh'], 5) == expected
+    assert capture_body(None, 5) == ''
+    assert capture_body(b'abc', 5) == 'abc'
+
+
+def test_capture_body_no_limit():
+    '''A limit of 0 captures everything, matching body_max_size_bytes semantics'''
+    assert capture_body(b'abcdefgh', 0) == 'abcdefgh'
+
+
+def test_capture_body_split_multibyte_character():
+    '''A character cut in half by the limit is dropped instead of being escaped'''
+    body = 'aé€'.encode('UTF8')
+    assert capture_body(body, 2) == 'a'
+    assert capture_body(body, 3) == 'aé'
+    assert capture_body(body, 6) == 'aé€'
+
+
+def test_capture_body_invalid_utf8_is_escaped():
+    '''Invalid utf8 within the captured range is backslash escaped'''
+    assert capture_body(b'a\xffb', 10) == 'a\\xffb'
+
+
+def test_iterator_is_not_consumed_past_limit():
+    '''Iteration stops as soon as the limit is reached'''
+    chunks = iter([b'aaaa', b'bbbb', b'cccc'])
+    assert capture_body(chunks, 6) == 'aaaabb'
+    assert list(chunks) == [b'cccc']
+
+
+def test_endless_iterator_terminates():
+    '''An infinite body can be captured'''
+    assert capture_body(itertools.repeat(b'x' * 1024), 4096) == 'x' * 4096
+
+
+def test_stream_reads_are_bounded():
+    '''Only slightly more than the limit is read from file-like bodies'''
+    stream = EndlessStream(64 * 1024 * 1024)
+    assert len(capture_body(stream, 1024)) == 1024
+    assert stream.bytes_read <= 1025
+
+
+def test_body_capture_incremental_writes():
+    '''write() reports when the capture is full and flags truncation'''
+    body_capture = BodyCapture(4)
+    assert body_capture.write(b'ab')
+    assert not body_capture.is_truncated()
+    assert not body_capture.write(b'cdef')
+    assert body_capture.is_full()
+    assert body_capture.is_truncated()
+    assert not body_capture.write(b'gh')
+    assert body_capture.getvalue() == 'abcd'
+
+
+def test_constant_memory_regardless_of_payload_size():
+    '''Peak memory used while capturing does not grow with the size of the payload'''
+    limit = 128 * 1024
+
+    def capture_stream(size):
+        return lambda: capture_body(EndlessStream(size), limit)
+
+    small = _peak_memory(capture_stream(256 * 1024))
+    large = _peak_memory(capture_stream(64 * 1024 * 1024))
+    assert large < 4 * limit
+    assert large < small * 1.5
+
+    small_body = b'a' * (256 * 1024)
+    large_body = b'a' * (32 * 1024 * 1024)
+    small = _peak_memory(lambda: capture_body(small_body, limit))
+    large = _peak_memory(lambda: capture_body(large_body, limit))
+    assert large < 4 * limit
+    assert large < small * 1.5
+
+
+def test_wrapper_captures_truncated_body():
+    '''generic handlers put at most max_body_size bytes on the span'''
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.set_process_request_body(BoolValue(value=True))
+    wrapper.set_body_max_size(10)
+    span = TracerProvider().get_tracer(__name__).start_span('test')
+    wrapper.generic_request_handler({'Content-Type': 'application/json'},
+                                    b'{"key": "a much longer value"}', span)
+    assert span.attributes[BaseInstrumentorWrapper.HTTP_REQUEST_BODY_PREFIX] == '{"key": "a'
+
+
+def test_wrapper_capture_is_limited_by_max_processing_size():
+    '''body_max_processing_size caps capture when it is smaller than body_max_size'''
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.set_body_max_size(10)
+    wrapper.set_body_max_processing_size(4)
+    assert wrapper.capture_body(b'0123456789abc') == '0123'
+    wrapper.set_body_max_processing_size(0)
+    assert wrapper.capture_body(b'0123456789abc') == '0123456789'
+
+
+def test_replayable_input_replays_prefix():
+    '''reads see the read ahead prefix and then the rest of the stream'''
+    body = b'line 1\nline 2\nline 3\n'
+    replay = ReplayableInput(io.BytesIO(body[10:]), body[:10])
+    assert replay.read(4) == b'line'
+    assert replay.readline() == b' 1\n'
+    assert replay.readline(3) == b'lin'
+    buffer = bytearray(6)
+    assert replay.readinto(buffer) == 6
+    assert bytes(buffer) == b'e 2\nli'
+    assert list(replay) == [b'ne 3\n']
+    assert replay.read() == b''
+
+    replay = ReplayableInput(io.BytesIO(body[10:]), body[:10])
+    assert replay.read() == body
+
+
+def test_tee_wsgi_input_reads_bounded_prefix():
+    '''only the limit and one more byte are read before the app reads the body'''
+    size = 64 * 1024 * 1024
+    stream = EndlessStream(size)
+    environ = {'wsgi.input': stream, 'CONTENT_LENGTH': str(size)}
+    prefix = tee_wsgi_input(environ, 1024)
+    assert len(prefix) == 1025
+    assert stream.bytes_read == 1025
+    assert capture_body(prefix, 1024) == 'a' * 1024
+
+    replay = environ['wsgi.input']
+    total = 0
+    for chunk in iter(lambda: replay.read(1024 * 1024), b''):
+        total += len(chunk)
+    assert total == size
+
+
+def test_tee_wsgi_input_without_length():
+    '''a body without a length is only read when the server terminates the input'''
+    environ = {'wsgi.input': io.BytesIO(b'chunked body')}
+    assert tee_wsgi_input(environ, 1024) == b''
+    environ['wsgi.input_terminated'] = True
+    assert tee_wsgi_input(environ, 4) == b'chunk'
+    assert environ['wsgi.input'].read() == b'chunked body'
+
+
+def test_capturing_iterable_finishes_once():
+    '''chunks pass through unchanged, the capture is finished on exhaustion or close'''
+    finished = []
+    closed = []
+
+    def generate():
+        try:
+            yield b'abc'
+            yield 'def'
+            yield b'ghi'
+        finally:
+            closed.append(True)
+
+    iterable = CapturingIterable(generate(), BodyCapture(5), lambda capture: finished.append(capture.getvalue()))
+    assert list(iterable) == [b'abc', 'def', b'ghi']
+    iterable.close()
+    assert finished == ['abcde']
+    assert closed == [True]
+
+    # a client that disconnects early still finishes the capture
+    iterable = CapturingIterable(generate(), BodyCapture(5), lambda capture: finished.append(capture.getvalue()))
+    assert next(iterable) == b'abc'
+    iterable.close()
+    assert finished == ['abcde', 'abc']
+    assert closed == [True, True]
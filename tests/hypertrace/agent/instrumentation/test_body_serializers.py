@@ -0,0 +1,99 @@
+'''Unittests for content type keyed body serializers'''
+import json
+
+from google.protobuf.struct_pb2 import Struct  # pylint:disable=E0611
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.sdk.trace import TracerProvider
+
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper, body_serializers
+from hypertrace.agent.instrumentation.body_serializers import default_body_serializers, \
+    serialize_form, serialize_graphql, serialize_json
+
+
+def _span():
+    return TracerProvider().get_tracer(__name__).start_span('test')
+
+
+def test_json_is_compacted():
+    '''Insignificant whitespace is dropped and unicode is kept as is'''
+    assert serialize_json('{ "a" : [1, 2, 3],\n  "b": "é" }') == '{"a":[1,2,3],"b":"é"}'
+
+
+def test_invalid_json_is_returned_as_is():
+    '''Truncated bodies don't parse and are captured unchanged'''
+    assert serialize_json('{"a": "trunc') == '{"a": "trunc'
+
+
+def test_stdlib_fallback_matches(monkeypatch):
+    '''Without orjson the stdlib json module produces the same output'''
+    body = '{ "a" : [1, 2.5, null, true],  "b": {"c": "é"} }'
+    expected = serialize_json(body)
+    monkeypatch.setattr(body_serializers, 'orjson', None)
+    assert serialize_json(body) == expected
+
+
+def test_form_is_decoded():
+    '''Form fields are decoded, repeated fields become lists'''
+    assert json.loads(serialize_form('a=1&b=x+y&a=2&c=%C3%A9&d=')) == {
+        'a': ['1', '2'], 'b': 'x y', 'c': 'é', 'd': ''}
+
+
+def test_graphql_query_is_minified():
+    '''Comments and whitespace are removed, string literals are kept'''
+    query = '''query Hero($ep: Episode = JEDI) {  # the hero
+      hero(episode: $ep) {
+        name,
+        ... on Droid { primaryFunction }
+        friends(first: 10) { name  bio(text: "a  :  b") }
+      }
+    }
+    '''
+    assert serialize_graphql(query) == 'query Hero($ep:Episode=JEDI){hero(episode:$ep){name...on Droid' \
+                                       '{primaryFunction}friends(first:10){name bio(text:"a  :  b")}}}'
+
+
+def test_registry_lookup():
+    '''Serializers are found by media type and suffix, unknown types are left alone'''
+    registry = default_body_serializers()
+    assert registry.serialize('application/vnd.api+json; charset=utf-8', '{ "a": 1 }') == '{"a":1}'
+    assert registry.serialize('text/plain', '{ "a": 1 }') == '{ "a": 1 }'
+    registry.register('text/plain', str.upper)
+    assert registry.serialize('text/plain', 'abc') == 'ABC'
+
+
+def test_serializer_failures_are_ignored():
+    '''A failing serializer doesn't lose the body'''
+    registry = default_body_serializers()
+
+    def failing(body):
+        raise RuntimeError(body)
+    registry.register('application/json', failing)
+    assert registry.serialize('application/json', '{}') == '{}'
+
+
+def test_wrapper_serializes_before_truncating():
+    '''A body over max_body_size that fits once compacted is captured whole'''
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.set_process_request_body(BoolValue(value=True))
+    wrapper.set_body_max_size(64)
+    body = json.dumps({'key': 'value', 'items': list(range(10))}, indent=4)
+    assert len(body) > 64
+
+    span = _span()
+    wrapper.generic_request_handler({'Content-Type': 'application/json'}, body, span)
+    assert len(span.attributes['http.request.body']) == 64
+
+    wrapper.set_body_serialization(True)
+    span = _span()
+    wrapper.generic_request_handler({'Content-Type': 'application/json'}, body, span)
+    assert span.attributes['http.request.body'] == '{"key":"value","items":[0,1,2,3,4,5,6,7,8,9]}'
+
+
+def test_serialize_message():
+    '''Protobuf messages keep the legacy format unless serialization is enabled'''
+    wrapper = BaseInstrumentorWrapper()
+    message = Struct()
+    message.update({'name': 'you'})
+    assert wrapper.serialize_message(message) == '{"name": "you"}'
+    wrapper.set_body_serialization(True)
+    assert wrapper.serialize_message(message) == '{"name":"you"}'
@@ -0,0 +1,115 @@
+'''Per route capture policies'''
+import io
+
+import flask
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.instrumentation.flask import _ENVIRON_SPAN_KEY
+from opentelemetry.sdk.trace import TracerProvider
+
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.capture_policy import CapturePolicy, CapturePolicyTable
+from hypertrace.agent.instrumentation.flask import FlaskInstrumentorWrapper, \
+    _hypertrace_before_request, _hypertrace_after_request
+
+CAPTURE_ALL = CapturePolicy(True, True, True, True)
+
+RULES = [
+    {'route': '/ingest/*', 'methods': ['POST'], 'request_body': False, 'response_body': False},
+    {'route': '/ingest/health', 'request_headers': False},
+    {'route': '/users/<id>', 'response_body': False},
+    {'route': '/users/me', 'response_headers': False},
+    {'route': '/admin/*', 'request_headers': False},
+    {'route': '/admin/reports/*', 'response_headers': False},
+    {'route': '/pkg.Service/*', 'request_body': False},
+]
+
+
+def _enabled(wrapper):
+    for setter in (wrapper.set_process_request_headers, wrapper.set_process_request_body,
+                   wrapper.set_process_response_headers, wrapper.set_process_response_body):
+        setter(BoolValue(value=True))
+    return wrapper
+
+
+def test_policy_resolution():
+    '''The most specific rule wins and unspecified settings keep the default'''
+    table = CapturePolicyTable(RULES, CAPTURE_ALL)
+    assert table.resolve('POST', '/ingest/events') == CapturePolicy(True, False, True, False)
+    assert table.resolve('post', '/ingest/events/') == CapturePolicy(True, False, True, False)
+    # prefix rule limited to POST
+    assert table.resolve('GET', '/ingest/events') == CAPTURE_ALL
+    # exact beats prefix
+    assert table.resolve('POST', '/ingest/health') == CapturePolicy(False, True, True, True)
+    # templated segments match any value, literal segments beat templates
+    assert table.resolve('GET', '/users/42') == CapturePolicy(True, True, True, False)
+    assert table.resolve('GET', '/users/me') == CapturePolicy(True, True, False, True)
+    assert table.resolve('GET', '/users/42/orders') == CAPTURE_ALL
+    # flask/starlette route templates resolve to the templated rule
+    assert table.resolve('GET', '/users/<int:id>') == CapturePolicy(True, True, True, False)
+    assert table.resolve('GET', '/users/{id}') == CapturePolicy(True, True, True, False)
+    # longer prefix beats shorter
+    assert table.resolve('GET', '/admin/users') == CapturePolicy(False, True, True, True)
+    assert table.resolve('GET', '/admin/reports/1') == CapturePolicy(True, True, False, True)
+    # grpc full method names
+    assert table.resolve(None, '/pkg.Service/Method') == CapturePolicy(True, False, True, True)
+    assert table.resolve('GET', '/other') == CAPTURE_ALL
+
+
+def test_policy_resolution_is_memoized():
+    '''A route is matched against the rules once'''
+    table = CapturePolicyTable(RULES, CAPTURE_ALL)
+    for _ in range(10):
+        table.resolve('POST', '/ingest/events')
+    info = table.resolve.cache_info()  # pylint:disable=E1101
+    assert info.misses == 1
+    assert info.hits == 9
+
+
+def test_invalid_rules_are_ignored():
+    '''A bad rule doesn't prevent the others from applying'''
+    table = CapturePolicyTable([{'methods': ['GET']}, None, {'route': '/a', 'request_body': False}],
+                               CAPTURE_ALL)
+    assert table.resolve('GET', '/a') == CapturePolicy(True, False, True, True)
+    assert CapturePolicyTable([], CAPTURE_ALL).resolve('GET', '/a') == CAPTURE_ALL
+
+
+def test_wrapper_policy_follows_global_settings():
+    '''Policies are rebuilt when the global settings change'''
+    wrapper = _enabled(BaseInstrumentorWrapper())
+    wrapper.set_capture_policies(RULES)
+    assert wrapper.capture_policy('POST', '/ingest/events') == CapturePolicy(True, False, True, False)
+    wrapper.set_process_request_headers(BoolValue(value=False))
+    assert wrapper.capture_policy('POST', '/ingest/events') == CapturePolicy(False, False, True, False)
+    assert wrapper.capture_policy('GET', '/other') == CapturePolicy(False, True, True, True)
+
+
+def _flask_request(app, wrapper, path):
+    span = TracerProvider().get_tracer(__name__).start_span('test')
+    before = _hypertrace_before_request(wrapper)
+    after = _hypertrace_after_request(wrapper)
+    body = b'{"key": "value"}'
+    with app.test_request_context(path, method='POST', input_stream=io.BytesIO(body),
+                                  content_type='application/json',
+                                  environ_overrides={_ENVIRON_SPAN_KEY: span}):
+        flask.request.url_rule = app.url_map.bind('localhost').match(path, 'POST', return_rule=True)[0]
+        before()
+        after(flask.Response(body, mimetype='application/json'))
+    return span.attributes
+
+
+def test_flask_uses_route_policy():
+    '''Flask requests resolve their policy from the matched url rule'''
+    app = flask.Flask(__name__)
+    app.add_url_rule('/ingest/<source>', 'ingest', lambda source: '', methods=['POST'])
+    app.add_url_rule('/admin', 'admin', lambda: '', methods=['POST'])
+    wrapper = _enabled(FlaskInstrumentorWrapper())
+    wrapper.set_capture_policies([{'route': '/ingest/<source>', 'methods': ['POST'],
+                                   'request_body': False}])
+
+    ingest = _flask_request(app, wrapper, '/ingest/logs')
+    assert 'http.request.body' not in ingest
+    assert ingest['http.response.body'] == '{"key": "value"}'
+    assert ingest['http.request.header.content-type'] == 'application/json'
+
+    admin = _flask_request(app, wrapper, '/admin')
+    assert admin['http.request.body'] == '{"key": "value"}'
@@ -0,0 +1,55 @@
+'''Unittests for content-type based capture eligibility'''
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.content_type import ContentTypeClassifier, find_content_type
+
+
+def test_default_content_types():
+    '''Parameters and +json suffixes are eligible by default'''
+    classifier = ContentTypeClassifier()
+    assert classifier.is_eligible('application/json')
+    assert classifier.is_eligible('application/json; charset=utf-8')
+    assert classifier.is_eligible('Application/JSON;charset=UTF-8')
+    assert classifier.is_eligible('application/vnd.api+json')
+    assert classifier.is_eligible('application/x-www-form-urlencoded')
+    assert classifier.is_eligible('application/graphql')
+    assert not classifier.is_eligible('text/html; charset=utf-8')
+    assert not classifier.is_eligible('multipart/form-data; boundary=abc')
+    assert not classifier.is_eligible('application/jsonp')
+    assert not classifier.is_eligible('')
+    assert not classifier.is_eligible(None)
+
+
+def test_configured_content_types():
+    '''Configured lists replace the defaults and support type wildcards'''
+    classifier = ContentTypeClassifier(['text/*', '+xml'])
+    assert classifier.is_eligible('text/plain')
+    assert classifier.is_eligible('application/atom+xml')
+    assert not classifier.is_eligible('application/json')
+
+
+def test_decisions_are_memoized():
+    '''Repeated content-type values are served from the cache'''
+    classifier = ContentTypeClassifier()
+    for _ in range(10):
+        classifier.is_eligible('application/json; charset=utf-8')
+    cache_info = classifier.is_eligible.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 9
+
+
+def test_find_content_type():
+    '''content-type is found regardless of header name case'''
+    assert find_content_type({'content-type': 'a/b'}) == 'a/b'
+    assert find_content_type({'Content-Type': 'a/b'}) == 'a/b'
+    assert find_content_type({'CONTENT-TYPE': 'a/b'}) == 'a/b'
+    assert find_content_type({'x': 'y'}) is None
+    assert find_content_type(None) is None
+
+
+def test_wrapper_content_types():
+    '''Wrappers use the configured content types'''
+    wrapper = BaseInstrumentorWrapper()
+    assert wrapper.eligible_based_on_content_type({'Content-Type': 'application/problem+json'})
+    wrapper.set_body_capture_content_types(['text/plain'])
+    assert not wrapper.eligible_based_on_content_type({'Content-Type': 'application/json'})
+    assert wrapper.eligible_based_on_content_type({'Content-Type': 'text/plain; charset=utf-8'})
@@ -0,0 +1,78 @@
+'''Non sampled requests should not touch request/response data'''
+import io
+
+import flask
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.instrumentation.flask import _ENVIRON_SPAN_KEY
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace import NonRecordingSpan, INVALID_SPAN_CONTEXT
+
+from hypertrace.agent.filter.registry import Registry
+from hypertrace.agent.instrumentation.django import DjangoInstrumentationWrapper
+from hypertrace.agent.instrumentation.flask import FlaskInstrumentorWrapper, \
+    _hypertrace_before_request, _hypertrace_after_request
+
+BODY = b'{"key": "' + b'a' * (256 * 1024) + b'"}'
+
+
+class BodyGuardedRequest:  # pylint:disable=R0903
+    '''A django like request that fails the test if its body is read'''
+    headers = {'Content-Type': 'application/json'}
+
+    @property
+    def body(self):
+        raise AssertionError('request body should not be read')
+
+    def build_absolute_uri(self):
+        return 'http://localhost/'
+
+
+def _enabled(wrapper):
+    for setter in (wrapper.set_process_request_headers, wrapper.set_process_request_body,
+                   wrapper.set_process_response_headers, wrapper.set_process_response_body):
+        setter(BoolValue(value=True))
+    return wrapper
+
+
+def _recording_span():
+    return TracerProvider().get_tracer(__name__).start_span('test')
+
+
+def _run_flask_hooks(app, wrapper, span) -> int:
+    '''Run the hypertrace hooks for a request, returns how much of wsgi.input was read'''
+    before = _hypertrace_before_request(wrapper)
+    after = _hypertrace_after_request(wrapper)
+    stream = io.BytesIO(BODY)
+    with app.test_request_context('/', method='POST', input_stream=stream,
+                                  content_type='application/json',
+                                  environ_overrides={_ENVIRON_SPAN_KEY: span}):
+        before()
+        after(flask.Response(BODY, mimetype='application/json'))
+    return stream.tell()
+
+
+def test_flask_hooks_skip_body_for_non_recording_span():
+    '''The request stream is never read when the span is not recording'''
+    app = flask.Flask(__name__)
+    wrapper = _enabled(FlaskInstrumentorWrapper())
+    assert _run_flask_hooks(app, wrapper, NonRecordingSpan(INVALID_SPAN_CONTEXT)) == 0
+    assert _run_flask_hooks(app, wrapper, _recording_span()) > 0
+
+
+def test_flask_hooks_skip_body_when_capture_disabled():
+    '''Disabled body capture, set through BoolValue config, doesn't read the body'''
+    app = flask.Flask(__name__)
+    wrapper = _enabled(FlaskInstrumentorWrapper())
+    wrapper.set_process_request_body(BoolValue(value=False))
+    span = _recording_span()
+    assert _run_flask_hooks(app, wrapper, span) == 0
+    assert 'http.request.body' not in span.attributes
+    assert span.attributes['http.request.header.content-type'] == 'application/json'
+
+
+def test_django_request_hook_skips_body_for_non_recording_span():
+    '''Django request.body is not read for non sampled requests without filters'''
+    wrapper = _enabled(DjangoInstrumentationWrapper())
+    assert not Registry().has_filters()
+    wrapper.request_hook(NonRecordingSpan(INVALID_SPAN_CONTEXT), BodyGuardedRequest())
+
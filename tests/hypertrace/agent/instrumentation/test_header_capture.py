@@ -0,0 +1,63 @@
+'''Unittests for precomputed header capture plans'''
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.sdk.trace import TracerProvider
+
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.header_capture import HeaderCapturePlan, REDACTED_VALUE
+
+
+def _span():
+    return TracerProvider().get_tracer(__name__).start_span('test')
+
+
+def test_plan_lowercases_and_prefixes():
+    '''Header names are lowercased and prefixed'''
+    plan = HeaderCapturePlan('http.request.header.')
+    assert plan.attributes({'Content-Type': 'application/json', 'X-Id': '1'}) == {
+        'http.request.header.content-type': 'application/json',
+        'http.request.header.x-id': '1',
+    }
+
+
+def test_plan_accepts_pairs():
+    '''An iterable of pairs, like grpc metadata, can be captured'''
+    plan = HeaderCapturePlan('rpc.request.metadata.')
+    assert plan.attributes((('Key', 'v'),)) == {'rpc.request.metadata.key': 'v'}
+
+
+def test_plan_allow_deny_redact():
+    '''allow limits, deny removes and redact masks captured headers'''
+    plan = HeaderCapturePlan('p.', allow=['X-A', 'x-b', 'authorization'], deny=['x-b'],
+                             redact=['Authorization'])
+    assert plan.attributes({'x-a': '1', 'X-B': '2', 'x-c': '3', 'Authorization': 'secret'}) == {
+        'p.x-a': '1',
+        'p.authorization': REDACTED_VALUE,
+    }
+
+
+def test_plan_caches_resolved_names():
+    '''Resolved attribute keys are reused across requests'''
+    plan = HeaderCapturePlan('p.', deny=['cookie'])
+    plan.attributes({'X-A': '1', 'Cookie': 'c'})
+    assert plan._keys['X-A'] == ('p.x-a', False)  # pylint:disable=W0212
+    assert plan.attributes({'X-A': '2', 'Cookie': 'd'}) == {'p.x-a': '2'}
+
+
+def test_plan_name_cache_is_bounded():
+    '''Arbitrary client header names can't grow the cache without bound'''
+    plan = HeaderCapturePlan('p.')
+    plan.attributes({f'x-{i}': str(i) for i in range(5000)})
+    assert len(plan._keys) == 1024  # pylint:disable=W0212
+    assert plan.attributes({'x-4999': 'v'}) == {'p.x-4999': 'v'}
+
+
+def test_wrapper_applies_rules():
+    '''Header capture rules set on a wrapper are applied by the generic handlers'''
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.set_process_request_headers(BoolValue(value=True))
+    wrapper.set_header_capture_rules(deny=['x-internal'], redact=['cookie'])
+    span = _span()
+    wrapper.generic_request_handler({'X-Internal': '1', 'Cookie': 'session=1', 'X-Id': '2'}, None, span)
+    assert span.attributes['http.request.header.x-id'] == '2'
+    assert span.attributes['http.request.header.cookie'] == REDACTED_VALUE
+    assert 'http.request.header.x-internal' not in span.attributes
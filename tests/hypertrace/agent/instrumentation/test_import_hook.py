@@ -0,0 +1,75 @@
+'''Instrumentation applied when the instrumented library is imported'''
+import json
+import os
+import subprocess
+import sys
+
+from hypertrace.agent.instrumentation.import_hook import clear_post_import_hooks, \
+    pending_post_import_hooks, register_post_import_hook
+
+
+def test_hook_runs_after_import(tmp_path, monkeypatch):
+    (tmp_path / 'hooked_package').mkdir()
+    (tmp_path / 'hooked_package' / '__init__.py').write_text('VALUE = 42\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    calls = []
+    try:
+        register_post_import_hook('hooked_package', 'first', lambda module: calls.append(('first', module)))
+        register_post_import_hook('hooked_package', 'second', lambda module: calls.append(('stale', module)))
+        # registering a key again replaces its pending hook
+        register_post_import_hook('hooked_package', 'second', lambda module: calls.append(('second', module)))
+        assert pending_post_import_hooks()['hooked_package'] == ['first', 'second']
+        assert not calls
+
+        import hooked_package  # pylint:disable=C0415,E0401
+        assert [name for name, _ in calls] == ['first', 'second']
+        assert all(module is hooked_package for _, module in calls)
+        assert hooked_package.VALUE == 42
+        assert type(hooked_package.__loader__).__name__ == 'SourceFileLoader'
+        assert 'hooked_package' not in pending_post_import_hooks()
+
+        # already imported, runs right away
+        register_post_import_hook('hooked_package', 'third', lambda module: calls.append(('third', module)))
+        assert calls[-1][0] == 'third'
+    finally:
+        clear_post_import_hooks()
+        sys.modules.pop('hooked_package', None)
+
+
+def test_failing_hook_does_not_break_import(tmp_path, monkeypatch):
+    (tmp_path / 'hooked_module.py').write_text('VALUE = 1\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    try:
+        register_post_import_hook('hooked_module', 'failing', lambda module: 1 / 0)
+        import hooked_module  # pylint:disable=C0415,E0401
+        assert hooked_module.VALUE == 1
+    finally:
+        clear_post_import_hooks()
+        sys.modules.pop('hooked_module', None)
+
+
+AGENT_SCRIPT = '''
+import json, sys
+from hypertrace.agent import Agent
+from hypertrace.agent.instrumentation.instrumentation_definitions import is_already_instrumented
+Agent().instrument()
+before = {'flask': 'flask' in sys.modules,
+          'wrapper': 'hypertrace.agent.instrumentation.flask' in sys.modules,
+          'instrumented': is_already_instrumented('flask')}
+import flask
+after = {'wrapper': 'hypertrace.agent.instrumentation.flask' in sys.modules,
+         'instrumented': is_already_instrumented('flask'),
+         'aiohttp': 'aiohttp' in sys.modules,
+         'django': 'django' in sys.modules}
+print(json.dumps({'before': before, 'after': after}))
+'''
+
+
+def test_agent_instruments_libraries_when_imported():
+    env = dict(os.environ, HT_ENABLE_CONSOLE_SPAN_EXPORTER='true')
+    output = subprocess.run([sys.executable, '-c', AGENT_SCRIPT], env=env, check=True,
+                            capture_output=True, text=True, timeout=60).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result['before'] == {'flask': False, 'wrapper': False, 'instrumented': False}
+    assert result['after'] == {'wrapper': True, 'instrumented': True,
+                               'aiohttp': False, 'django': False}
@@ -0,0 +1,101 @@
+'''Unittests for redaction of captured headers and bodies'''
+import json
+
+from google.protobuf.wrappers_pb2 import BoolValue  # pylint:disable=E0611
+from opentelemetry.sdk.trace import TracerProvider
+
+from hypertrace.agent.config import AgentConfig
+from hypertrace.agent.instrumentation import BaseInstrumentorWrapper
+from hypertrace.agent.instrumentation.header_capture import REDACTED_VALUE
+from hypertrace.agent.instrumentation.redaction import Redactor, compile_redactor, NO_REDACTION
+
+SSN = r'\b\d{3}-\d{2}-\d{4}\b'
+
+
+def _span():
+    return TracerProvider().get_tracer(__name__).start_span('test')
+
+
+def test_json_keys():
+    '''JSON values of sensitive keys are masked whatever their type or key case'''
+    redactor = Redactor(keys=['password', 'Token'])
+    body = '{"user": "bob", "Password" : "se\\"cret", "token": 12345, "tokens": [1]}'
+    assert redactor.redact(body) == \
+        '{"user": "bob", "Password" : "[redacted]", "token": "[redacted]", "tokens": [1]}'
+
+
+def test_truncated_json_value():
+    '''A value cut by body capture is still masked'''
+    assert Redactor(keys=['password']).redact('{"password": "hunt') == '{"password": "[redacted]"'
+
+
+def test_form_keys():
+    '''Form and query string values of sensitive keys are masked'''
+    redactor = Redactor(keys=['password', 'token'])
+    assert redactor.redact('user=bob&PASSWORD=abc&token=&mytoken=1') == \
+        'user=bob&PASSWORD=[redacted]&token=[redacted]&mytoken=1'
+
+
+def test_non_ascii_body():
+    '''Bodies whose lowercase form changes length use the case-insensitive fallback'''
+    redactor = Redactor(keys=['password'])
+    assert redactor.redact('{"İ": 1, "PASSWORD": "x"}') == '{"İ": 1, "PASSWORD": "[redacted]"}'
+
+
+def test_patterns():
+    '''Pattern matches are masked, invalid patterns are ignored'''
+    redactor = Redactor(patterns=[SSN, r'[\w.+-]+@[\w-]+\.\w+', '(unbalanced'])
+    assert redactor.patterns == [SSN, r'[\w.+-]+@[\w-]+\.\w+']
+    assert redactor.redact('ssn 123-45-6789, mail a.b@example.com') == \
+        f'ssn {REDACTED_VALUE}, mail {REDACTED_VALUE}'
+
+
+def test_compiled_once():
+    '''The same rules share one compiled redactor'''
+    assert compile_redactor(['b', 'A'], [SSN]) is compile_redactor(['a', 'b'], [SSN])
+    assert compile_redactor() is NO_REDACTION
+    assert not NO_REDACTION.enabled()
+
+
+def test_wrapper_redacts_headers_and_body():
+    '''Redaction applies to captured headers and bodies'''
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.set_process_request_headers(BoolValue(value=True))
+    wrapper.set_process_request_body(BoolValue(value=True))
+    wrapper.set_redaction_rules(keys=['password', 'x-api-key'], patterns=[SSN])
+    span = _span()
+    wrapper.generic_request_handler(
+        {'Content-Type': 'application/json', 'X-Api-Key': 'k', 'X-Ssn': '123-45-6789'},
+        '{"password": "p", "ssn": "123-45-6789"}', span)
+    assert span.attributes['http.request.header.x-api-key'] == REDACTED_VALUE
+    assert span.attributes['http.request.header.x-ssn'] == REDACTED_VALUE
+    assert span.attributes['http.request.header.content-type'] == 'application/json'
+    assert span.attributes['http.request.body'] == '{"password": "[redacted]", "ssn": "[redacted]"}'
+
+
+def test_redacts_large_body():
+    '''Every key of a 128 KiB body is redacted'''
+    keys = ['password', 'token', 'secret', 'authorization', 'ssn', 'credit_card']
+    items = [{'id': i, 'email': f'user{i}@example.com', 'password': 'hunter2', 'note': 'lorem ipsum ' * 4}
+             for i in range(2000)]
+    body = json.dumps(items)[:128 * 1024]
+    redacted = compile_redactor(keys).redact(body)
+    assert redacted.count(REDACTED_VALUE) == body.count('"password"')
+
+
+def test_credential_headers_redacted_by_default(monkeypatch):
+    '''Without a user config credential headers are captured redacted'''
+    monkeypatch.delenv('HT_CONFIG_FILE', raising=False)
+    monkeypatch.delenv('HT_DATA_CAPTURE_HEADERS_REDACT', raising=False)
+    wrapper = BaseInstrumentorWrapper()
+    wrapper.apply_agent_config(AgentConfig())
+    span = _span()
+    wrapper.generic_request_handler(
+        {'Authorization': 'Bearer t', 'Proxy-Authorization': 'Basic p',
+         'Cookie': 'session=s', 'Accept': 'text/html'}, None, span)
+    wrapper.generic_response_handler({'Set-Cookie': 'session=s'}, None, span)
+    assert span.attributes['http.request.header.authorization'] == REDACTED_VALUE
+    assert span.attributes['http.request.header.proxy-authorization'] == REDACTED_VALUE
+    assert span.attributes['http.request.header.cookie'] == REDACTED_VALUE
+    assert span.attributes['http.request.header.accept'] == 'text/html'
+    assert span.attributes['http.response.header.set-cookie'] == REDACTED_VALUE
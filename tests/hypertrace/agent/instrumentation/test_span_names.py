@@ -0,0 +1,26 @@
+'''Unittests for server span names'''
+from hypertrace.agent.instrumentation.span_names import SpanNameTable, template_path
+
+
+def test_template_path():
+    assert template_path('/users/42/avatar') == '/users/{id}/avatar'
+    assert template_path('/orders/3f2b8c1e-0d4a-4c7e-9a51-6f0c2d9e8b17') == '/orders/{id}'
+    assert template_path('/files/deadbeefcafe/raw/') == '/files/{id}/raw'
+    assert template_path('/tokens/abcdefgh12345678') == '/tokens/{id}'
+    assert template_path('/a/b/c/d/e/f') == '/a/b/c/d/*'
+    assert template_path('/wp-admin/setup.php') == '/wp-admin/setup.php'
+    assert template_path('/') == '/'
+
+
+def test_span_names():
+    table = SpanNameTable()
+    table.add_route('/users/<int:user_id>', {'GET', 'HEAD'})
+    first = table.name('GET', '/users/<int:user_id>')
+    assert first == 'GET /users/<int:user_id>'
+    # the precomputed string is reused
+    assert table.name('GET', '/users/<int:user_id>') is first
+    assert table.name('POST', '/items') == 'POST /items'
+
+    assert table.name('GET', None, '/users/42/missing') == 'GET None'
+    table.template_unmatched = True
+    assert table.name('GET', None, '/users/42/missing') == 'GET /users/{id}/missing'
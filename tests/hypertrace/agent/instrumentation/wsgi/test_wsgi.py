@@ -0,0 +1,93 @@
+'''Hypertrace WSGI middleware around a plain WSGI app'''
+import json
+import time
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from werkzeug.test import Client
+
+from hypertrace.agent.instrumentation.wsgi import HypertraceWSGIMiddleware, wsgi_request_headers
+
+# the middleware with header & body capture must serve at least this many requests a second
+MIN_REQUESTS_PER_SECOND = 500
+
+
+def echo_app(environ, start_response):
+    '''Returns the request body as a json response'''
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('200 OK', [('Content-Type', 'application/json'), ('X-Echo', 'yes')])
+    return [b'{"echo": ', body, b'}']
+
+
+def lazy_app(environ, start_response):
+    '''Calls start_response on the first iteration, like a generator based app'''
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    yield b'{"chunks": ['
+    for index in range(1000):
+        yield b'"' + b'a' * 1024 + b'",' if index < 999 else b'"last"'
+    yield b']}'
+
+
+def test_request_headers():
+    environ = {'HTTP_X_FORWARDED_FOR': '10.0.0.1', 'CONTENT_TYPE': 'application/json',
+               'CONTENT_LENGTH': '', 'PATH_INFO': '/'}
+    assert wsgi_request_headers(environ) == {'x-forwarded-for': '10.0.0.1',
+                                             'content-type': 'application/json'}
+
+
+def test_captures_request_and_response(agent, exporter):
+    app = HypertraceWSGIMiddleware(echo_app, agent._config)
+    response = Client(app).post('/echo', data=json.dumps({'key': 'value'}),
+                                headers={'tester1': 'tester1'}, content_type='application/json')
+    assert response.status_code == 200
+    assert response.json == {'echo': {'key': 'value'}}
+
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 1
+    attributes = spans[0].attributes
+    assert spans[0].name == 'POST /echo'
+    assert attributes['http.status_code'] == 200
+    assert attributes['http.request.header.tester1'] == 'tester1'
+    assert attributes['http.request.body'] == '{"key": "value"}'
+    assert attributes['http.response.header.x-echo'] == 'yes'
+    assert attributes['http.response.body'] == '{"echo": {"key": "value"}}'
+
+
+def test_lazy_start_response(agent, exporter):
+    app = HypertraceWSGIMiddleware(lazy_app, agent._config)
+    response = Client(app).get('/lazy')
+    assert response.json['chunks'][-1] == 'last'
+    body = exporter.get_finished_spans()[0].attributes['http.response.body']
+    assert len(body) == agent._config.agent_config.data_capture.body_max_size_bytes
+    assert body.startswith('{"chunks": ["aaa')
+
+
+def test_filter_blocks_request(agent_with_filter, exporter):
+    calls = []
+
+    def app(environ, start_response):
+        calls.append(environ)
+        return echo_app(environ, start_response)
+
+    response = Client(HypertraceWSGIMiddleware(app, agent_with_filter._config)).get('/blocked')
+    assert response.status_code == 403
+    assert not calls
+    assert exporter.get_finished_spans()[0].attributes['http.status_code'] == 403
+
+
+def _requests_per_second(app, count=2000) -> float:
+    client = Client(app)
+    body = json.dumps({'key': 'value'})
+    start = time.perf_counter()
+    for _ in range(count):
+        client.post('/echo', data=body, content_type='application/json')
+    return count / (time.perf_counter() - start)
+
+
+@pytest.mark.benchmark
+def test_throughput_benchmark(agent):
+    '''Benchmark, the middleware must serve MIN_REQUESTS_PER_SECOND. Spans are recorded
+    but not exported so the exporters other tests registered don't count'''
+    instrumented = _requests_per_second(
+        HypertraceWSGIMiddleware(echo_app, agent._config, tracer_provider=TracerProvider()))
+    assert instrumented > MIN_REQUESTS_PER_SECOND, f'served {instrumented:.0f} req/s'
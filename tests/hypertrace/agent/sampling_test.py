@@ -0,0 +1,84 @@
+'''Sampler config test'''
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, Decision, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags, set_span_in_context
+
+from hypertrace.agent.config import AgentConfig
+from hypertrace.agent.sampling import RateLimitingSampler, build_sampler
+
+
+class FakeClock:  # pylint:disable=R0903
+    '''A monotonic clock moved by the test'''
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _sampled(sampler, trace_id=1, parent_context=None) -> bool:
+    return sampler.should_sample(parent_context, trace_id, 'span').decision is Decision.RECORD_AND_SAMPLE
+
+
+def test_rate_limiting_sampler_caps_traces_per_second():
+    '''A burst is limited to the rate and tokens refill with time'''
+    clock = FakeClock()
+    sampler = RateLimitingSampler(10, clock=clock)
+    assert sum(_sampled(sampler) for _ in range(50)) == 10
+    clock.now += 0.5
+    assert sum(_sampled(sampler) for _ in range(50)) == 5
+    # tokens don't accumulate past one second worth
+    clock.now += 60
+    assert sum(_sampled(sampler) for _ in range(50)) == 10
+
+
+def test_rate_limiting_sampler_below_one_per_second():
+    '''Fractional rates sample one trace every 1 / rate seconds'''
+    clock = FakeClock()
+    sampler = RateLimitingSampler(0.5, clock=clock)
+    assert _sampled(sampler)
+    assert not _sampled(sampler)
+    clock.now += 1
+    assert not _sampled(sampler)
+    clock.now += 1
+    assert _sampled(sampler)
+
+
+def test_rate_limiting_sampler_only_counts_delegate_samples():
+    '''Traces dropped by the ratio sampler don't consume tokens'''
+    clock = FakeClock()
+    sampler = RateLimitingSampler(1, TraceIdRatioBased(0.5), clock=clock)
+    dropped_trace_id = (1 << 64) - 1
+    assert not _sampled(sampler, dropped_trace_id)
+    assert _sampled(sampler, 1)
+    assert not _sampled(sampler, 1)
+
+
+def test_build_sampler():
+    '''The configured ratio, rate limit and parent based settings are combined'''
+    assert build_sampler() is None
+    assert build_sampler(ratio=1.0, parent_based=False) is ALWAYS_ON
+    assert build_sampler(ratio=0.1, parent_based=False).get_description() == 'TraceIdRatioBased{0.1}'
+    sampler = build_sampler(ratio=0.1, rate_limit=5)
+    assert isinstance(sampler, ParentBased)
+    assert 'RateLimitingSampler{5.0, TraceIdRatioBased{0.1}}' in sampler.get_description()
+    # invalid values fall back to sampling everything
+    assert build_sampler(ratio=3, rate_limit=-1) is None
+
+
+def test_parent_based_sampler_follows_parent():
+    '''Children of a sampled parent are sampled even when the root sampler is exhausted'''
+    sampler = build_sampler(ratio=0.0)
+    parent = NonRecordingSpan(SpanContext(trace_id=1, span_id=2, is_remote=True,
+                                          trace_flags=TraceFlags(TraceFlags.SAMPLED)))
+    assert not _sampled(sampler)
+    assert _sampled(sampler, parent_context=set_span_in_context(parent))
+
+
+def test_tracer_provider_uses_configured_sampler():
+    '''Config reaches the TracerProvider'''
+    config = AgentConfig()
+    config.custom_config['_sampling'] = {'ratio': 0.0, 'parent_based': False}
+    provider = TracerProvider(sampler=build_sampler(**config.sampling()))
+    span = provider.get_tracer(__name__).start_span('dropped')
+    assert not span.is_recording()
@@ -0,0 +1,114 @@
+'''Bounded batch span processor test'''
+import threading
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+
+from hypertrace.agent.span_processor import BoundedBatchSpanProcessor, DROP_NEWEST, \
+    DROP_OLDEST, KEEP_ERRORS
+
+TRACER = TracerProvider().get_tracer(__name__)
+
+
+class BlockingExporter(SpanExporter):
+    '''Holds the first export until released so the processor queue can fill up'''
+    def __init__(self):
+        self.exporting = threading.Event()
+        self.release = threading.Event()
+        self.exported = []
+
+    def export(self, spans):
+        self.exporting.set()
+        self.release.wait(5)
+        self.exported.extend(span.name for span in spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.release.set()
+
+
+def _span(name, error=False):
+    span = TRACER.start_span(name)
+    if error:
+        span.set_status(Status(StatusCode.ERROR))
+    span.end()
+    return span
+
+
+def _full_processor(drop_policy):
+    '''A processor whose worker is stuck exporting and whose 4 span queue is full'''
+    exporter = BlockingExporter()
+    processor = BoundedBatchSpanProcessor(exporter, max_queue_size=4, max_export_batch_size=2,
+                                          schedule_delay_millis=60000, drop_policy=drop_policy)
+    processor.on_end(_span('exporting-1'))
+    processor.on_end(_span('exporting-2'))
+    assert exporter.exporting.wait(5)
+    for i in range(4):
+        processor.on_end(_span(f'queued-{i}'))
+    return processor, exporter
+
+
+def _queued(processor):
+    return [span.name for span in reversed(processor.queue)]
+
+
+def _shutdown(processor, exporter):
+    exporter.release.set()
+    processor.shutdown()
+
+
+def test_drop_oldest():
+    '''The oldest queued span makes room for the new one'''
+    processor, exporter = _full_processor(DROP_OLDEST)
+    processor.on_end(_span('new'))
+    assert _queued(processor) == ['queued-1', 'queued-2', 'queued-3', 'new']
+    assert processor.dropped_spans == 1
+    _shutdown(processor, exporter)
+
+
+def test_drop_newest():
+    '''The queued spans are kept'''
+    processor, exporter = _full_processor(DROP_NEWEST)
+    processor.on_end(_span('new'))
+    processor.on_end(_span('error', error=True))
+    assert _queued(processor) == ['queued-0', 'queued-1', 'queued-2', 'queued-3']
+    assert processor.dropped_spans == 2
+    assert processor.dropped_error_spans == 1
+    _shutdown(processor, exporter)
+    assert 'queued-3' in exporter.exported
+
+
+def test_keep_errors():
+    '''Error spans evict the oldest span, other spans are dropped'''
+    processor, exporter = _full_processor(KEEP_ERRORS)
+    processor.on_end(_span('new'))
+    processor.on_end(_span('error', error=True))
+    assert _queued(processor) == ['queued-1', 'queued-2', 'queued-3', 'error']
+    assert processor.dropped_spans == 2
+    assert processor.dropped_error_spans == 0
+    _shutdown(processor, exporter)
+
+
+def test_invalid_drop_policy():
+    '''Unknown policies are rejected'''
+    with pytest.raises(ValueError):
+        BoundedBatchSpanProcessor(BlockingExporter(), drop_policy='drop_random')
+
+
+def test_agent_applies_span_processor_options(agent):
+    '''Config options reach the processor, invalid options fall back to the defaults'''
+    agent._config.custom_config['_span_processor'] = {  # pylint:disable=W0212
+        'max_queue_size': 64, 'max_export_batch_size': 8, 'drop_policy': KEEP_ERRORS}
+    processor = agent._init._init_span_processor(BlockingExporter())  # pylint:disable=W0212
+    assert (processor.max_queue_size, processor.max_export_batch_size) == (64, 8)
+    assert processor.drop_policy == KEEP_ERRORS
+    processor.shutdown()
+
+    agent._config.custom_config['_span_processor'] = {  # pylint:disable=W0212
+        'max_queue_size': 8, 'max_export_batch_size': 64}
+    processor = agent._init._init_span_processor(BlockingExporter())  # pylint:disable=W0212
+    assert processor.max_queue_size == 2048
+    assert processor.drop_policy == DROP_OLDEST
+    processor.shutdown()
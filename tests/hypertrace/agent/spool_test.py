@@ -0,0 +1,197 @@
+'''Disk spool test'''
+import os
+import subprocess
+import sys
+import time
+
+from opentelemetry.exporter.otlp.proto.common._internal.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from hypertrace.agent.config import AgentConfig
+from hypertrace.agent.spool import DiskSpool, SpoolingSpanExporter, _claim
+
+TRACER = TracerProvider().get_tracer(__name__)
+
+
+class Collector:
+    '''A send function whose availability the test controls'''
+    def __init__(self, available=True):
+        self.available = available
+        self.fail_after = None
+        self.received = []
+
+    def __call__(self, request):
+        if not self.available or (self.fail_after is not None and len(self.received) >= self.fail_after):
+            raise ConnectionError('collector unavailable')
+        self.received.append(request)
+        return True
+
+    def span_names(self):
+        return [span.name for request in self.received
+                for resource_spans in request.resource_spans
+                for scope_spans in resource_spans.scope_spans
+                for span in scope_spans.spans]
+
+
+def _request(name):
+    span = TRACER.start_span(name, attributes={'http.request.body': 'x' * 1000})
+    span.end()
+    return encode_spans([span])
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.spool'))
+
+
+def test_healthy_collector_is_not_spooled(tmp_path):
+    '''Requests go straight to the collector'''
+    collector = Collector()
+    spool = DiskSpool(str(tmp_path), collector)
+    assert spool.submit(_request('a'))
+    assert collector.span_names() == ['a']
+    assert not _segments(tmp_path)
+    spool.close()
+
+
+def test_outage_is_spooled_and_replayed_in_order(tmp_path):
+    '''Batches are spooled while the collector is down and replayed once it is back'''
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector, max_segment_bytes=2500)
+    for name in 'abcde':
+        assert not spool.submit(_request(name))
+    # new segments are opened as the previous ones fill up
+    assert len(_segments(tmp_path)) == 3
+    assert spool.stats.spooled_batches == 5
+
+    collector.available = True
+    # batches keep going through the spool until it is drained
+    spool.submit(_request('f'))
+    assert spool.replay()
+    assert collector.span_names() == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert not _segments(tmp_path)
+    stats = spool.stats.as_dict()
+    assert stats['replayed_batches'] == 6
+    assert stats['replayed_bytes'] == stats['spooled_bytes']
+    assert stats['replay_bytes_per_second'] > 0
+    spool.close()
+
+
+def test_partial_replay_resumes(tmp_path):
+    '''A replay interrupted by a new outage doesn't resend batches'''
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector)
+    for name in 'abc':
+        spool.submit(_request(name))
+    collector.available = True
+    collector.fail_after = 1
+    assert not spool.replay()
+    collector.fail_after = None
+    assert spool.replay()
+    assert collector.span_names() == ['a', 'b', 'c']
+    spool.close()
+
+
+def test_batches_spooled_during_replay_are_kept(tmp_path):
+    '''A batch spooled while a segment is replayed goes to a new segment, it is
+    neither deleted with the replayed one nor lost'''
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector)
+    spool.submit(_request('a'))
+    collector.available = True
+
+    def send(request):
+        if not collector.received:
+            # the replay already listed the segments, an export runs concurrently
+            assert not spool.submit(_request('b'))
+        return collector(request)
+    spool._send = send  # pylint:disable=W0212
+
+    assert spool.replay()
+    assert spool.submit(_request('c'))
+    assert collector.span_names() == ['a', 'b', 'c']
+    assert spool.stats.spooled_batches == 2
+    assert spool.pending_bytes() == 0
+    spool.close()
+
+
+def test_spool_size_is_bounded(tmp_path):
+    '''The oldest segments are dropped past max_bytes'''
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector, max_segment_bytes=2500, max_bytes=5000)
+    for name in 'abcdefgh':
+        spool.submit(_request(name))
+    assert spool.pending_bytes() <= 5000
+    assert spool.stats.dropped_batches >= 4
+
+    collector.available = True
+    assert spool.replay()
+    names = collector.span_names()
+    assert names == list('abcdefgh')[spool.stats.dropped_batches:]
+    spool.close()
+
+
+def test_background_replay(tmp_path):
+    '''The replay thread drains the spool after the collector recovers'''
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector)
+    spool.submit(_request('a'))
+    collector.available = True
+    deadline = time.monotonic() + 10
+    while spool.pending_bytes() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert collector.span_names() == ['a']
+    spool.close()
+
+
+def test_segments_of_exited_processes_are_replayed(tmp_path):
+    '''A worker replays what a previous worker spooled'''
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                            capture_output=True, check=True)
+    pid = int(exited.stdout)
+    collector = Collector(available=False)
+    spool = DiskSpool(str(tmp_path), collector)
+    spool.submit(_request('a'))
+    spool.close()
+    (segment,) = _segments(tmp_path)
+    orphan = tmp_path / segment.replace(f'-{os.getpid()}.', f'-{pid}.')
+    os.rename(tmp_path / segment, orphan)
+
+    other = DiskSpool(str(tmp_path), collector)
+    # the orphan is renamed after the process replaying it, no other worker gets it
+    assert other._segments(claim=True) == [str(tmp_path / segment)]  # pylint:disable=W0212
+    assert _claim(str(orphan), 1) is None
+    collector.available = True
+    assert other.replay()
+    assert collector.span_names() == ['a']
+    other.close()
+
+
+def test_default_directory_per_user_and_service(monkeypatch):
+    monkeypatch.setenv('HT_SERVICE_NAME', 'billing api/v2')
+    directory = AgentConfig().spool_options()['directory']
+    assert os.path.basename(directory) == f'hypertrace-spool-{os.getuid()}-billing_api_v2'
+
+
+def test_exporter_reports_spooled_batches_as_exported(tmp_path):
+    '''The batch processor must not retry or count spooled batches as failures'''
+    collector = Collector(available=False)
+    exporter = SpoolingSpanExporter(DiskSpool(str(tmp_path), collector))
+    span = TRACER.start_span('a')
+    span.end()
+    assert exporter.export([span]) is SpanExportResult.SUCCESS
+    assert exporter.spool.stats.spooled_batches == 1
+    exporter.shutdown()
+
+
+def test_agent_spools_when_collector_is_down(agent, tmp_path):
+    '''The configured exporter spools batches the collector refused'''
+    from hypertrace.agent.config import config_pb2  # pylint:disable=C0415
+    agent._config.custom_config['_spool'] = {'enabled': True, 'directory': str(tmp_path)}  # pylint:disable=W0212
+    agent._config.agent_config.reporting.endpoint = 'http://127.0.0.1:1/v1/traces'  # pylint:disable=W0212
+    exporter = agent._init._init_spool_exporter(config_pb2.TraceReporterType.OTLP_HTTP)  # pylint:disable=W0212
+    span = TRACER.start_span('a')
+    span.end()
+    assert exporter.export([span]) is SpanExportResult.SUCCESS
+    assert len(_segments(tmp_path)) == 1
+    exporter.shutdown()
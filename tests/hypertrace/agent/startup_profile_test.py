@@ -0,0 +1,71 @@
+'''Startup profiler and startup time budget'''
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from hypertrace.agent.startup_profile import StartupProfiler
+
+# Agent() + instrument() in a fresh interpreter, including importing the agent
+STARTUP_BUDGET_SECONDS = 2.0
+
+STARTUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+from hypertrace.agent import Agent
+Agent().instrument()
+elapsed = time.perf_counter() - start
+from hypertrace.agent.startup_profile import startup_profiler
+print(json.dumps({'seconds': elapsed, 'report': startup_profiler().report()}))
+'''
+
+
+def _start_agent(**env):
+    env = dict(os.environ, HT_ENABLE_CONSOLE_SPAN_EXPORTER='true', **env)
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], env=env, check=True,
+                            capture_output=True, text=True, timeout=60).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_profiler_records_nested_phases():
+    profiler = StartupProfiler(enabled=True)
+    with profiler.phase('outer'):
+        with profiler.phase('inner'):
+            data = [bytes(1024) for _ in range(100)]
+    profiler.finish()
+    report = profiler.report()
+    assert [(record['phase'], record['depth']) for record in report['phases']] == \
+           [('outer', 0), ('inner', 1)]
+    assert report['phases'][1]['memory_bytes'] >= 100 * 1024
+    assert report['total_seconds'] == report['phases'][0]['seconds']
+    assert len(data) == 100
+
+    # phases after the report still record time, memory is no longer traced
+    with profiler.phase('late'):
+        pass
+    assert profiler.phases[-1]['memory_bytes'] is None
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StartupProfiler(enabled=False)
+    with profiler.phase('outer'):
+        pass
+    profiler.finish()
+    assert not profiler.phases
+
+
+def test_startup_profile_report():
+    report = _start_agent(HT_STARTUP_PROFILE='true')['report']
+    phases = {record['phase'] for record in report['phases']}
+    assert {'agent.config', 'config.load', 'config.protobuf', 'agent.init', 'instrument',
+            'apply_config.span_processors', 'instrument.requests'} <= phases
+    assert report['total_seconds'] > 0
+
+
+@pytest.mark.benchmark
+def test_startup_budget():
+    '''Benchmark, fails when agent startup gets slower than the budget'''
+    seconds = min(_start_agent()['seconds'] for _ in range(3))
+    assert seconds < STARTUP_BUDGET_SECONDS, f'agent startup took {seconds * 1000:.0f}ms'